@@ -0,0 +1,125 @@
+import asyncio
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+import random
+import weakref
+
+import httpx
+
+from shimoku_tangram.reporting.logging import init_logger
+from shimoku_tangram.storage.compression import Codec, compress_blocks, resolve_codec
+
+
+logger = init_logger(__name__)
+
+# Throttling and transient server errors, worth another attempt
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Longest backoff between two attempts of a request, in seconds
+MAX_BACKOFF = 20
+# Bodies up to this size are (de)compressed on the event loop, larger ones in
+# a worker thread so the loop keeps serving other requests
+INLINE_CODEC_SIZE = 256 * 1024
+
+
+class AsyncTransport:
+    """
+    HTTP client shared by the async storage modules. Every event loop gets
+    its own httpx.AsyncClient, since clients are bound to the loop they are
+    used in, with a pool of max_concurrency connections and a semaphore that
+    keeps at most max_concurrency requests of the loop in flight, however
+    many tasks are awaiting them. Transport errors, throttling and 5xx
+    responses are tried up to max_attempts times with jittered exponential
+    backoff.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        max_attempts: int = 5,
+        timeout: float = 60,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._transport = transport
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[httpx.AsyncClient, asyncio.Semaphore]
+        ] = weakref.WeakKeyDictionary()
+
+    def _get(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        entry = self._loops.get(loop)
+        if entry is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self._transport,
+            )
+            entry = (client, asyncio.Semaphore(self.max_concurrency))
+            self._loops[loop] = entry
+        return entry
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request, reading the whole response body, and return the
+        response of the last attempt. Auth flows run again on every attempt.
+        """
+        client, semaphore = self._get()
+        async with semaphore:
+            for attempt in range(self.max_attempts):
+                last = attempt == self.max_attempts - 1
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if last:
+                        raise
+                    logger.warning(f"Retrying {method} {url}: {e}")
+                else:
+                    if last or response.status_code not in RETRY_STATUS_CODES:
+                        return response
+                    logger.warning(
+                        f"Retrying {method} {url}: HTTP {response.status_code}"
+                    )
+                await asyncio.sleep(
+                    random.uniform(0, min(MAX_BACKOFF, 0.1 * 2**attempt))
+                )
+
+    async def aclose(self) -> None:
+        """
+        Close the client of the running event loop.
+        """
+        entry = self._loops.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+
+async def decompress(key: str, body: bytes) -> bytes:
+    """
+    Decompress a body with the codec of the extension of its key.
+    """
+    codec = resolve_codec(key)
+    if len(body) <= INLINE_CODEC_SIZE:
+        return codec.decompress(body)
+    return await asyncio.to_thread(codec.decompress, body)
+
+
+async def compress(key: str, body: bytes, codec: str | Codec | None) -> bytes:
+    """
+    Compress a body with codec or the codec of the extension of its key.
+    """
+    codec = resolve_codec(key, codec)
+    if len(body) <= INLINE_CODEC_SIZE:
+        return codec.compress(body)
+    return await asyncio.to_thread(compress_blocks, body, codec)
+
+
+async def _aiter(items: Iterable) -> AsyncIterator:
+    for item in items:
+        yield item
+
+
+def as_async_iterable(items: Iterable | AsyncIterable) -> AsyncIterable:
+    return items if isinstance(items, AsyncIterable) else _aiter(items)
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+
+from shimoku_tangram.reporting.logging import init_logger
+
+
+logger = init_logger(__name__)
+
+
+class DiskCache:
+    """
+    Local directory of object bodies tagged with the version they were
+    downloaded at (S3 ETag, GCS generation). Every entry is a single file
+    holding the tag on its first line followed by the body, replaced
+    atomically, so the directory can be shared by threads and processes.
+    Hits refresh the entry's mtime and the least recently used entries are
+    evicted once the directory grows over max_size_mb. Only the files with
+    the entry suffix are managed, so other files in the directory are left
+    alone.
+    """
+
+    SUFFIX = ".entry"
+
+    def __init__(self, directory: str | os.PathLike, max_size_mb: float = 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024**2)
+        self._lock = threading.Lock()
+        # Running size of the entries, rescanned whenever it crosses max_size
+        # since other processes may have added or evicted entries meanwhile
+        self._size = sum(entry[1] for entry in self._entries())
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}{self.SUFFIX}"
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob(f"*{self.SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        """
+        Return the (tag, body) cached for key, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        tag, _, body = data.partition(b"\n")
+        return tag.decode("utf-8"), body
+
+    def put(self, key: str, tag: str, body: bytes) -> None:
+        """
+        Cache body under key at version tag, evicting the least recently
+        used entries if needed. Bodies larger than the cache are skipped.
+        """
+        if len(body) > self.max_size:
+            return
+        header = tag.encode("utf-8") + b"\n"
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(body)
+            with self._lock:
+                try:
+                    replaced = path.stat().st_size
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, path)
+                self._size += len(header) + len(body) - replaced
+                if self._size > self.max_size:
+                    self._evict()
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            logger.debug(f"Evicted {path.name} from the cache")
+        self._size = size
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            for _, _, path in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process cache of immutable object bodies. Entries expire
+    ttl_seconds after being stored and the least recently used ones are
+    dropped once the bodies add up to more than max_size_mb.
+    """
+
+    def __init__(self, max_size_mb: float = 64, ttl_seconds: float = 300):
+        self.max_size = int(max_size_mb * 1024**2)
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Return the body cached for key, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, body: bytes) -> None:
+        """
+        Cache body under key. Bodies larger than the cache are skipped.
+        """
+        if len(body) > self.max_size:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body)
+            self._size += len(body)
+            while self._size > self.max_size:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """
+        Drop every entry whose key starts with prefix.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
@@ -0,0 +1,329 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+import csv
+import gzip
+import itertools
+import math
+import os
+import threading
+from typing import BinaryIO
+import zlib
+
+import pandas as pd
+import pyarrow as pa
+
+# Rows serialized at a time by the streaming CSV writer
+CSV_CHUNK_ROWS = 10000
+# Uncompressed size of the blocks that large payloads are split into
+BLOCK_SIZE = 4 * 1024**2
+
+_block_size = BLOCK_SIZE
+_block_max_workers = min(8, os.cpu_count() or 1)
+_block_executor: ThreadPoolExecutor | None = None
+_block_executor_lock = threading.Lock()
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """
+    GzipFile that also closes the stream it reads from, so the underlying
+    HTTP connection goes back to the pool as soon as the reader is closed.
+    """
+
+    def close(self) -> None:
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+class Codec(ABC):
+    """
+    Compression format of stored objects, recognized by the extension it
+    adds to their keys.
+    """
+
+    name = ""
+    extension = ""
+    level: int | None = None
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def open(self, stream: BinaryIO) -> BinaryIO:
+        """
+        Wrap a binary stream of compressed data in a file object that
+        decompresses it incrementally as it is read, and closes the stream
+        when closed.
+        """
+
+    @abstractmethod
+    def iter_compress(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Compress a sequence of chunks into a single object as they come,
+        yielding the compressed bytes available after every chunk.
+        """
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    extension = ".gz"
+
+    def __init__(self, level: int = 9):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+    def open(self, stream: BinaryIO) -> BinaryIO:
+        return _ClosingGzipFile(fileobj=stream, mode="rb")
+
+    def iter_compress(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+
+class _ArrowCodec(Codec):
+    """
+    Frame formats implemented by pyarrow, so they need no extra dependency.
+    Streams are written as one frame per chunk, and concatenated frames are
+    a valid object for the standard tools and libraries.
+    """
+
+    def __init__(self, level: int | None = None):
+        self.level = level
+        self._codec = pa.Codec(self.name, compression_level=level)
+
+    def __reduce__(self):
+        # pa.Codec does not pickle; rebuild it, e.g. in a worker process
+        return type(self), (self.level,)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._codec.compress(data, asbytes=True)
+
+    def decompress(self, data: bytes) -> bytes:
+        return pa.CompressedInputStream(pa.BufferReader(data), self.name).read()
+
+    def open(self, stream: BinaryIO) -> BinaryIO:
+        return pa.CompressedInputStream(pa.PythonFile(stream, mode="r"), self.name)
+
+    def iter_compress(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        empty = True
+        for chunk in chunks:
+            if chunk:
+                empty = False
+                yield self.compress(chunk)
+        if empty:
+            yield self.compress(b"")
+
+
+class ZstdCodec(_ArrowCodec):
+    name = "zstd"
+    extension = ".zst"
+
+    def __init__(self, level: int = 3):
+        super().__init__(level)
+
+
+class Lz4Codec(_ArrowCodec):
+    name = "lz4"
+    extension = ".lz4"
+
+
+CODECS: dict[str, Codec] = {
+    "gzip": GzipCodec(),
+    "zstd": ZstdCodec(),
+    "lz4": Lz4Codec(),
+}
+
+
+def register_codec(codec: Codec) -> None:
+    """
+    Make a codec available by name and recognize its extension on read.
+    Registering an instance with another level, e.g. GzipCodec(6), changes
+    the level used for that name.
+    """
+    CODECS[codec.name] = codec
+
+
+def get_codec(codec: str | Codec) -> Codec:
+    if isinstance(codec, Codec):
+        return codec
+    try:
+        return CODECS[codec]
+    except KeyError:
+        raise ValueError(f"Unknown codec: {codec}") from None
+
+
+def codec_of_key(key: str) -> Codec | None:
+    """
+    The codec a key was compressed with, from its extension, or None if the
+    key has no compressed extension.
+    """
+    for codec in CODECS.values():
+        if key.endswith(codec.extension):
+            return codec
+    return None
+
+
+def resolve_codec(key: str, codec: str | Codec | None = None) -> Codec:
+    """
+    The given codec, else the codec of the key extension, else gzip, which
+    is what objects without a known extension have always been written with.
+    """
+    if codec is not None:
+        return get_codec(codec)
+    return codec_of_key(key) or CODECS["gzip"]
+
+
+def configure_compression(
+    block_size_mb: float = 4, max_workers: int | None = None
+) -> None:
+    """
+    Set how large payloads are compressed. Payloads larger than block_size_mb
+    are split into blocks compressed concurrently by a pool of max_workers
+    threads shared by every caller (by default the CPU count, up to 8); with
+    max_workers=1 everything is compressed in the calling thread.
+    """
+    global _block_size, _block_max_workers, _block_executor
+    with _block_executor_lock:
+        if _block_executor is not None:
+            _block_executor.shutdown(wait=False)
+        _block_executor = None
+        _block_size = int(block_size_mb * 1024**2)
+        _block_max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+
+def _get_block_executor() -> ThreadPoolExecutor:
+    global _block_executor
+    with _block_executor_lock:
+        if _block_executor is None:
+            _block_executor = ThreadPoolExecutor(
+                _block_max_workers, thread_name_prefix="compression"
+            )
+        return _block_executor
+
+
+def _compress_in_order(codec: Codec, blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Compress every block on its own in the shared pool, yielding the results
+    in block order. At most max_workers blocks wait ahead of the consumer.
+    """
+    executor = _get_block_executor()
+    pending: deque[Future] = deque()
+    try:
+        for block in blocks:
+            pending.append(executor.submit(codec.compress, block))
+            if len(pending) > _block_max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def compress_blocks(data: bytes, codec: str | Codec = "gzip") -> bytes:
+    """
+    Compress a payload, splitting it into blocks compressed concurrently when
+    it is larger than one block (see configure_compression). Blocks become
+    gzip members or zstd/lz4 frames, and their concatenation is a single
+    valid object for the standard readers. zlib and pyarrow release the GIL
+    while compressing, so the blocks use several cores.
+    """
+    codec = get_codec(codec)
+    if _block_max_workers <= 1 or len(data) <= _block_size:
+        return codec.compress(data)
+    view = memoryview(data)
+    blocks = (view[i : i + _block_size] for i in range(0, len(view), _block_size))
+    return b"".join(_compress_in_order(codec, blocks))
+
+
+def _iter_compress_blocks(codec: Codec, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Like codec.iter_compress, but gathering the chunks into blocks that are
+    compressed concurrently once there is more than one.
+    """
+
+    def _blocks() -> Iterator[bytes]:
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= _block_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    blocks = _blocks()
+    first = next(blocks, b"")
+    second = next(blocks, None)
+    if second is None:
+        yield codec.compress(first)
+        return
+    yield from _compress_in_order(codec, itertools.chain([first, second], blocks))
+
+
+def iter_compressed_csv(
+    df: pd.DataFrame,
+    part_size: float,
+    codec: str | Codec = "gzip",
+    encoding: str = "utf-8",
+    chunk_rows: int = CSV_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """
+    Serialize a dataframe to compressed CSV (the same CSV text as
+    df.to_csv(index=False, quoting=csv.QUOTE_ALL)) chunk_rows rows at a
+    time. The compressed bytes are yielded in parts of at least part_size,
+    except the last one, so the whole CSV text is never held in memory.
+    Outputs of more than one block are compressed block by block in parallel
+    like in compress_blocks.
+    """
+
+    def _chunks() -> Iterator[bytes]:
+        for start in range(0, len(df), chunk_rows):
+            text = df.iloc[start : start + chunk_rows].to_csv(
+                index=False, header=start == 0, quoting=csv.QUOTE_ALL
+            )
+            yield text.encode(encoding)
+
+    codec = get_codec(codec)
+    if _block_max_workers > 1:
+        compressed = _iter_compress_blocks(codec, _chunks())
+    else:
+        compressed = codec.iter_compress(_chunks())
+
+    buffer = bytearray()
+    parts = 0
+    for data in compressed:
+        buffer += data
+        if len(buffer) >= part_size:
+            yield bytes(buffer)
+            buffer.clear()
+            parts += 1
+    # No empty trailing part, but always at least one part
+    if buffer or parts == 0:
+        yield bytes(buffer)
+
+
+def compress_csv(
+    df: pd.DataFrame, codec: str | Codec = "gzip", encoding: str = "utf-8"
+) -> bytes:
+    """
+    Compressed CSV of a dataframe, as written by the CSV shard writers.
+    """
+    return b"".join(iter_compressed_csv(df, math.inf, codec, encoding))
@@ -0,0 +1,84 @@
+import io
+from typing import BinaryIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from shimoku_tangram.storage.compression import resolve_codec
+from shimoku_tangram.storage.manifest import check_rows, csv_read_types
+
+
+def read_csv_shard(
+    stream: BinaryIO,
+    key: str,
+    shard: dict | None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Parse a csv shard from a stream of its decompressed bytes: with the
+    dtypes of its manifest entry when it has one (dtype entries take
+    precedence), checking its row count. With a dtype_backend only the
+    manifest dates are applied, as Arrow timestamps for the pyarrow one.
+    """
+    dates = {}
+    if shard is not None:
+        manifest_dtype, dates = csv_read_types(shard["columns"], usecols)
+        dates = {
+            name: date for name, date in dates.items() if name not in (dtype or {})
+        }
+        if dtype_backend is None:
+            dtype = {**manifest_dtype, **(dtype or {})}
+
+    kwargs = {"engine": engine, "usecols": usecols, "dtype": dtype}
+    if dtype_backend is not None:
+        kwargs["dtype_backend"] = dtype_backend
+    elif dates:
+        kwargs["parse_dates"] = list(dates)
+    df = pd.read_csv(stream, **kwargs)
+
+    if shard is None:
+        return df
+    if dtype_backend is not None:
+        df = _parse_dates(df, dates, dtype_backend == "pyarrow")
+    elif dates:
+        df = df.astype(dates)
+    return check_rows(df, key, shard)
+
+
+def _parse_dates(df: pd.DataFrame, dates: dict, arrow: bool) -> pd.DataFrame:
+    """
+    Convert the date columns of a shard read with a dtype_backend, which
+    leaves them as strings (c engine) or as UTC timestamps of inferred
+    precision (pyarrow engine), to their manifest dtypes.
+    """
+    for name, dtype in dates.items():
+        tz = getattr(dtype, "tz", None)
+        values = pd.to_datetime(df[name], utc=tz is not None).astype(dtype)
+        if arrow:
+            unit = dtype.unit if tz is not None else np.datetime_data(dtype)[0]
+            values = values.astype(pd.ArrowDtype(pa.timestamp(unit, tz)))
+        df[name] = values
+    return df
+
+
+def parse_csv_shard(
+    body: bytes,
+    key: str,
+    shard: dict | None,
+    compressed: bool,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Parse a downloaded csv shard like read_csv_shard, decompressing it first
+    with the codec of its key when compressed.
+    """
+    stream = io.BytesIO(body)
+    with resolve_codec(key).open(stream) if compressed else stream as f:
+        return read_csv_shard(f, key, shard, engine, dtype_backend, usecols, dtype)
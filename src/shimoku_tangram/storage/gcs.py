@@ -1,61 +1,257 @@
-from gzip import compress as compress_f, decompress
-import io
+import hashlib
 import json
 import os
 import logging
 from pathlib import Path
 import pickle
 import uuid
+from collections.abc import Callable, Iterable, Iterator
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
-import csv
-
+from functools import partial
+import threading
+from typing import BinaryIO
+
+from google.api_core import exceptions
+from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
+from google.cloud.storage.batch import Batch
 import pandas as pd
+from requests.adapters import HTTPAdapter
 
 from shimoku_tangram.reporting.logging import init_logger
+from shimoku_tangram.storage.cache import DiskCache, MemoryCache
+from shimoku_tangram.storage.compression import (
+    Codec,
+    codec_of_key,
+    compress_blocks,
+    compress_csv,
+    get_codec,
+    iter_compressed_csv,
+    resolve_codec,
+)
+from shimoku_tangram.storage.csv_shards import read_csv_shard
+from shimoku_tangram.storage.manifest import (
+    check_rows,
+    hash_parts,
+    is_metadata,
+    list_shards,
+    manifest_key,
+)
+from shimoku_tangram.storage.parquet import read_parquet, write_parquet
+from shimoku_tangram.storage.processes import check_executor, parse_csv, serialize_csv
+from shimoku_tangram.storage.partitions import (
+    build_index,
+    dataset_of,
+    drop_cleared,
+    index_key,
+    keys_between_dates,
+    list_shards_between_dates,
+    modify_index,
+    partition_of_prefix,
+    read_partitions,
+    record_shards,
+    split_partition_prefix,
+    write_partitions,
+)
+from shimoku_tangram.storage.sharding import (
+    commit_shards,
+    estimate_bytes_per_row,
+    get_multiple_objects_threaded,
+    get_shards_threaded,
+    plan_shard_rows,
+    put_shards,
+    rechunk,
+)
+from shimoku_tangram.storage.tasks import batched, iter_threaded, run_threaded
 from shimoku_tangram.utils.environment import retrieve_google_env
 
 
 logger = init_logger(__name__)
 
+# GCS recommends at most 100 calls per batch request
+DELETE_BATCH_SIZE = 100
+# Chunk size of the seekable reader used for parquet, a multiple of 256 KB
+PARQUET_READ_CHUNK_SIZE = 4 * 1024**2
+# Chunk size of the resumable uploads of CSV shards, a multiple of 256 KB
+CSV_UPLOAD_CHUNK_SIZE = 16 * 1024**2
 
-def bucket_exists(bucket: str, project_id: str | None = None) -> bool:
+_clients: dict[str, storage.Client] = {}
+_sessions: dict[str, AuthorizedSession] = {}
+_buckets: dict[tuple[str, str], storage.Bucket] = {}
+_clients_lock = threading.Lock()
+_index_locks: dict[tuple[str, str], threading.Lock] = {}
+_index_locks_lock = threading.Lock()
+# Large enough for the default ThreadPoolExecutor size (min(32, cpus + 4))
+_max_pool_connections = 50
+
+
+def configure_client(max_pool_connections: int = 50) -> None:
+    """
+    Set the HTTP connection pool size of the shared GCS clients. It should be
+    at least the number of threads issuing requests at once. Clients already
+    created are dropped so the next call builds them with the new size.
+    """
+    global _max_pool_connections
+    with _clients_lock:
+        _max_pool_connections = max_pool_connections
+        _clients.clear()
+        _sessions.clear()
+        _buckets.clear()
+
+
+def get_client(project_id: str | None = None) -> storage.Client:
+    """
+    Return the shared GCS client for a project, creating it on first use.
+    The client keeps its authorized HTTP session, so the auth token and the
+    open connections are reused across calls and threads.
+    """
     project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
+    client = _clients.get(project_id)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(project_id)
+            if client is None:
+                credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+                session = AuthorizedSession(credentials)
+                adapter = HTTPAdapter(
+                    pool_connections=_max_pool_connections,
+                    pool_maxsize=_max_pool_connections,
+                )
+                session.mount("https://", adapter)
+                # _http is the only way the client takes a session of its
+                # own; it is a constructor argument, not patched afterwards
+                client = storage.Client(
+                    project=project_id, credentials=credentials, _http=session
+                )
+                _sessions[project_id] = session
+                _clients[project_id] = client
+    return client
+
+
+def get_session(project_id: str | None = None) -> AuthorizedSession:
+    """
+    Return the authorized HTTP session of the shared client of a project.
+    """
+    project_id, _ = retrieve_google_env(project_id, None)
+    get_client(project_id)
+    return _sessions[project_id]
+
+
+def get_bucket(bucket: str, project_id: str | None = None) -> storage.Bucket:
+    """
+    Return the shared bucket handle for a bucket of a project.
+    """
+    project_id, _ = retrieve_google_env(project_id, None)
+    bucket_obj = _buckets.get((project_id, bucket))
+    if bucket_obj is None:
+        bucket_obj = get_client(project_id).bucket(bucket)
+        with _clients_lock:
+            bucket_obj = _buckets.setdefault((project_id, bucket), bucket_obj)
+    return bucket_obj
+
+
+def reset_clients() -> None:
+    """
+    Drop every shared GCS client and bucket handle, mainly for tests.
+    """
+    with _clients_lock:
+        _clients.clear()
+        _sessions.clear()
+        _buckets.clear()
+
+
+_cache: DiskCache | None = None
+
+
+def configure_cache(directory: str | None, max_size_mb: float = 1024) -> None:
+    """
+    Cache the bodies read by get_object in a local directory, capped at
+    max_size_mb with least recently used eviction, or stop caching with None.
+    Cached objects are revalidated with a download conditional on their
+    generation, so an unchanged object costs one round-trip and no body
+    transfer.
+    """
+    global _cache
+    _cache = DiskCache(directory, max_size_mb) if directory is not None else None
+
+
+_memory_cache: MemoryCache | None = None
+
+
+def configure_memory_cache(
+    max_size_mb: float | None = 64, ttl_seconds: float = 300
+) -> None:
+    """
+    Keep the bodies read by the text, json and pickle getters in memory, up
+    to max_size_mb in total and for ttl_seconds each, or stop caching with
+    None. Bodies larger than the cache are not kept. The single-object
+    getters also remember the key found under their prefix. Writes and
+    deletes made through this module invalidate the affected entries, and
+    every call parses the cached bytes again, so callers get their own copy.
+    """
+    global _memory_cache
+    _memory_cache = (
+        MemoryCache(max_size_mb, ttl_seconds) if max_size_mb is not None else None
+    )
+
+
+def invalidate_cache(bucket: str, keys: Iterable[str]) -> None:
+    """
+    Drop the memory cache entries of keys written or deleted by other means,
+    e.g. the async module, so the getters of this module read them again.
+    """
+    if _memory_cache is None:
+        return
+    for key in keys:
+        _memory_cache.invalidate(f"object:{bucket}/{key}")
+    _memory_cache.invalidate_prefix(f"single:{bucket}/")
+
+
+def bucket_exists(bucket: str, project_id: str | None = None) -> bool:
+    bucket_obj = get_bucket(bucket, project_id)
     try:
-        bucket_obj = client.bucket(bucket)
         return bucket_obj.exists()
     except Exception:
         return False
 
 
-def list_objects_metadata(
+def iter_objects_metadata(
     bucket: str, prefix: str = "", project_id: str | None = None
-) -> list:
-    project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
+) -> Iterator[dict]:
+    """
+    Yield the metadata of every object under a prefix. Pages of the listing
+    are requested lazily, only once the previous page has been consumed.
+    """
+    bucket_obj = get_bucket(bucket, project_id)
+    for blob in bucket_obj.list_blobs(prefix=prefix):
+        yield {
+            "Key": blob.name,
+            "LastModified": blob.time_created,
+            "Size": blob.size,
+            "ETag": blob.etag,
+        }
 
-    bucket_obj = client.bucket(bucket)
-    blobs = bucket_obj.list_blobs(prefix=prefix)
 
-    metadata = []
-    for blob in blobs:
-        metadata.append(
-            {
-                "Key": blob.name,
-                "LastModified": blob.time_created,
-                "Size": blob.size,
-                "ETag": blob.etag,
-            }
-        )
-    return metadata
+def iter_objects_key(
+    bucket: str, prefix: str = "", project_id: str | None = None
+) -> Iterator[str]:
+    for obj in iter_objects_metadata(bucket, prefix, project_id):
+        yield obj["Key"]
+
+
+def list_objects_metadata(
+    bucket: str, prefix: str = "", project_id: str | None = None
+) -> list:
+    return list(iter_objects_metadata(bucket, prefix, project_id))
 
 
 def list_objects_key(
     bucket: str, prefix: str = "", project_id: str | None = None
 ) -> list:
-    return [obj["Key"] for obj in list_objects_metadata(bucket, prefix, project_id)]
+    return list(iter_objects_key(bucket, prefix, project_id))
 
 
 def list_objects_key_between_dates(
@@ -69,7 +265,23 @@ def list_objects_key_between_dates(
     List all objects keys between two dates.
     The date is extracted from the object key, which has the following format:
     <prefix>/<YYYY>/<MM>/<DD>/<filename>
+    When the prefix has a partition index (see build_partition_index) the
+    keys are read from it with a single GET instead of listing every day.
     """
+    index = get_partition_index(bucket, prefix, project_id)
+    if index is not None:
+        return keys_between_dates(index, start_date, end_date)
+    return _list_objects_key_by_day(bucket, prefix, start_date, end_date, project_id)
+
+
+def _list_objects_key_by_day(
+    bucket: str,
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    project_id: str | None = None,
+) -> list[str]:
+    # A listing per day, merged into a listing per month or year when whole
     end_date = end_date + timedelta(days=1)
     file_prefixes = []
     for x in range(0, (end_date - start_date).days):
@@ -116,6 +328,152 @@ def list_objects_key_between_dates(
     return file_keys
 
 
+def _get_partition_index(
+    bucket: str, prefix: str, project_id: str | None = None
+) -> tuple[dict | None, int]:
+    # Around the caches, which could hand a writer an outdated index. The
+    # generation of a missing index is 0, which if_generation_match takes
+    # as "does not exist"
+    key = index_key(prefix)
+    blob = get_bucket(bucket, project_id).blob(key)
+    try:
+        body = blob.download_as_bytes()
+    except NotFound:
+        return None, 0
+    return json.loads(resolve_codec(key).decompress(body)), blob.generation
+
+
+def get_partition_index(
+    bucket: str, prefix: str, project_id: str | None = None
+) -> dict | None:
+    """
+    Return the partition index of a dataset prefix, or None if it has none.
+    """
+    return _get_partition_index(bucket, prefix, project_id)[0]
+
+
+def get_manifest(
+    bucket: str, prefix: str, project_id: str | None = None
+) -> dict | None:
+    """
+    Return the manifest written with the shards of a prefix, or None if it
+    has none.
+    """
+    try:
+        return get_json_object(
+            bucket, manifest_key(prefix), compressed=False, project_id=project_id
+        )
+    except NotFound:
+        return None
+
+
+def _put_partition_index(
+    bucket: str,
+    prefix: str,
+    index: dict,
+    generation: int,
+    project_id: str | None = None,
+) -> bool:
+    # Only over the generation read, so an index written meanwhile by
+    # another process is not overwritten
+    key = index_key(prefix)
+    blob = get_bucket(bucket, project_id).blob(key)
+    body = resolve_codec(key).compress(json.dumps(index).encode("utf-8"))
+    try:
+        blob.upload_from_string(body, if_generation_match=generation)
+    except PreconditionFailed:
+        return False
+    finally:
+        invalidate_cache(bucket, [key])
+    return True
+
+
+def _partition_index_lock(bucket: str, prefix: str) -> threading.Lock:
+    # One per index, so writers of different datasets do not wait on each other
+    with _index_locks_lock:
+        return _index_locks.setdefault((bucket, index_key(prefix)), threading.Lock())
+
+
+def _modify_partition_index(
+    bucket: str,
+    prefix: str,
+    modify: Callable[[dict], dict],
+    create: bool,
+    project_id: str | None = None,
+    current: tuple[dict | None, int] | None = None,
+) -> dict | None:
+    """
+    Store modify(index) as the partition index of a dataset prefix with a
+    conditional upload, reading the index again and retrying when another
+    writer changed it first. current, the index and generation the caller
+    has just read, saves the first read. Without create, a prefix with no
+    index is left without one. Returns the index stored, if any.
+    """
+    # Writers of this process wait for each other instead of retrying
+    with _partition_index_lock(bucket, prefix):
+        return modify_index(
+            prefix,
+            modify,
+            partial(_get_partition_index, bucket, project_id=project_id),
+            partial(_put_partition_index, bucket, project_id=project_id),
+            create,
+            current,
+        )
+
+
+def build_partition_index(
+    bucket: str, prefix: str, project_id: str | None = None
+) -> dict:
+    """
+    List a dataset prefix once and store the index of its
+    <prefix>/<YYYY>/<MM>/<DD>/ partitions, with the shards and columns of
+    their manifests, so date range reads skip listing and manifests.
+    Writers of its partitions and clear_path keep it up to date afterwards.
+    """
+    return _modify_partition_index(
+        bucket,
+        prefix,
+        lambda _: build_index(
+            prefix,
+            iter_objects_metadata(bucket, f"{prefix}/", project_id),
+            partial(get_manifest, bucket, project_id=project_id),
+        ),
+        create=True,
+        project_id=project_id,
+    )
+
+
+def _update_partition_index(
+    bucket: str,
+    index_prefix: str | None,
+    prefix: str,
+    shards: list[dict],
+    columns: list[dict] | None = None,
+    project_id: str | None = None,
+) -> None:
+    """
+    Record the shards written to a partition prefix, and the columns of its
+    manifest if it has one, in the index of index_prefix, or, without one,
+    in the index of the dataset the prefix is a <YYYY>/<MM>/<DD> partition
+    of, when that dataset has an index.
+    """
+    create = index_prefix is not None
+    if create:
+        partition = partition_of_prefix(index_prefix, prefix)
+    elif (split := split_partition_prefix(prefix)) is not None:
+        index_prefix, partition = split
+    else:
+        return
+
+    _modify_partition_index(
+        bucket,
+        index_prefix,
+        record_shards(partition, shards, columns),
+        create,
+        project_id,
+    )
+
+
 def list_single_object_key(
     bucket: str, prefix: str, project_id: str | None = None
 ) -> str:
@@ -144,15 +502,12 @@ def list_multiple_objects_keys(
     Retrieve multiple file keys from a GCS bucket given a folder.
     Fails if no files are found.
     """
-    project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
-
-    bucket_obj = client.bucket(bucket)
+    bucket_obj = get_bucket(bucket, project_id)
     blobs = bucket_obj.list_blobs(prefix=prefix)
 
     list_keys = []
     for blob in blobs:
-        if not blob.name.endswith("/"):
+        if not blob.name.endswith("/") and not is_metadata(blob.name):
             list_keys.append(blob.name)
 
     if len(list_keys) == 0:
@@ -161,44 +516,230 @@ def list_multiple_objects_keys(
     return list_keys
 
 
+class _DeleteBatch(Batch):
+    """
+    Batch request that keeps the (status, body) responses finish returns,
+    one per deferred call, in the order the calls were made.
+    """
+
+    def __init__(self, client: storage.Client, raise_exception: bool = True):
+        super().__init__(client, raise_exception=raise_exception)
+        self.responses = []
+
+    def finish(self, raise_exception: bool = True) -> list:
+        self.responses = super().finish(raise_exception=raise_exception)
+        return self.responses
+
+
+def _delete_batch(
+    bucket: str, keys: list[str], project_id: str | None = None
+) -> dict[str, str]:
+    bucket_obj = get_bucket(bucket, project_id)
+    # The batch stack of a client is thread local, so concurrent batches on
+    # the shared client do not capture each other's requests.
+    batch = _DeleteBatch(bucket_obj.client, raise_exception=False)
+    try:
+        with batch:
+            for key in keys:
+                bucket_obj.delete_blob(key)
+    except Exception as e:
+        return {key: str(e) for key in keys}
+    finally:
+        invalidate_cache(bucket, keys)
+    # A 404 means the blob is already gone, which is what we wanted
+    return {
+        key: f"{response.status_code}: {response.text}"
+        for key, response in zip(keys, batch.responses, strict=True)
+        if not 200 <= response.status_code < 300 and response.status_code != 404
+    }
+
+
+def delete_objects(
+    bucket: str,
+    keys: Iterable[str],
+    max_workers: int | None = None,
+    project_id: str | None = None,
+) -> dict[str, str]:
+    """
+    Delete keys with GCS batch requests of up to 100 calls, running the
+    requests concurrently. Returns the keys that could not be deleted mapped
+    to their error, so an empty dict means every key was deleted.
+    """
+    failures = {}
+    with ThreadPoolExecutor(max_workers) as executor:
+        tasks = [
+            executor.submit(_delete_batch, bucket, batch, project_id)
+            for batch in batched(keys, DELETE_BATCH_SIZE)
+        ]
+        for task in tasks:
+            failures.update(task.result())
+    return failures
+
+
+def _clear_partition_index(
+    bucket: str,
+    prefix: str,
+    failures: dict[str, str],
+    project_id: str | None = None,
+    index_prefix: str | None = None,
+    current: tuple[dict | None, int] | None = None,
+) -> None:
+    """
+    Drop the keys cleared under a prefix from the index of index_prefix or,
+    without it, of the dataset the prefix is a date partition (or a year or
+    month of them) of, if it has one, but the ones that could not be
+    deleted. current is passed on to _modify_partition_index.
+    """
+    index_prefix = index_prefix or dataset_of(prefix)
+    if index_prefix is None:
+        return
+
+    _modify_partition_index(
+        bucket, index_prefix, drop_cleared(prefix, failures), False, project_id, current
+    )
+
+
+def _delete_prefix(
+    bucket: str, prefix: str, project_id: str | None = None
+) -> dict[str, str]:
+    failures = delete_objects(
+        bucket,
+        iter_objects_key(bucket, prefix, project_id=project_id),
+        project_id=project_id,
+    )
+    for key, error in failures.items():
+        logger.error(f"Error deleting object {key}: {error}")
+    return failures
+
+
 def clear_path(bucket: str, prefix: str = "", project_id: str | None = None) -> bool:
-    project_id, _ = retrieve_google_env(project_id, None)
-    result = True
-    for obj_key in list_objects_key(bucket, prefix, project_id=project_id):
-        result = result and delete_object(bucket, obj_key, project_id=project_id)
-    return result
+    """
+    Delete every object under a prefix. Batches are deleted while the
+    listing is still being paginated. Failed keys are logged and make the
+    result False; use delete_objects to get them back. Clearing date
+    partitions of an indexed dataset drops them from its partition index.
+    """
+    failures = _delete_prefix(bucket, prefix, project_id)
+    _clear_partition_index(bucket, prefix, failures, project_id)
+    return len(failures) == 0
+
+
+def _skip_partition_index(*args) -> None:
+    return None
+
+
+def _clear_for_write(
+    bucket: str, prefix: str, index_prefix: str | None, project_id: str | None = None
+) -> Callable[[str | None, str, list[dict], list[dict] | None], None]:
+    """
+    Clear a prefix about to be written like clear_path and return the
+    update_index of commit_shards. The index the shards of a day go to is
+    read once, before clearing, and the clearing reuses that read, so
+    writing a day of a dataset without an index costs a single GET.
+    """
+    split = split_partition_prefix(prefix) if index_prefix is None else None
+    if index_prefix is None and split is None:
+        clear_path(bucket, prefix, project_id)
+        return _skip_partition_index
+
+    dataset = index_prefix or split[0]
+    current = _get_partition_index(bucket, dataset, project_id)
+    failures = _delete_prefix(bucket, prefix, project_id)
+    if current[0] is not None:
+        _clear_partition_index(bucket, prefix, failures, project_id, dataset, current)
+    elif index_prefix is None:
+        return _skip_partition_index
+    return partial(_update_partition_index, bucket, project_id=project_id)
+
+
+def _download_cached(blob: storage.Blob, cache_key: str) -> bytes:
+    entry = _cache.get(cache_key)
+    if entry is None:
+        data = blob.download_as_bytes()
+    else:
+        try:
+            data = blob.download_as_bytes(if_generation_not_match=int(entry[0]))
+        except NotModified:
+            return entry[1]
+    if blob.generation is not None:
+        _cache.put(cache_key, str(blob.generation), data)
+    return data
+
+
+def _get_body(bucket: str, key: str, project_id: str | None = None) -> bytes:
+    blob = get_bucket(bucket, project_id).blob(key)
+    if _cache is not None:
+        return _download_cached(blob, f"gs://{bucket}/{key}")
+    return blob.download_as_bytes()
 
 
 def get_object(
     bucket: str, key: str, compressed: bool = True, project_id: str | None = None
 ) -> bytes:
-    project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
-
-    bucket_obj = client.bucket(bucket)
-    blob = bucket_obj.blob(key)
-
-    data = blob.download_as_bytes()
+    """
+    Get an object, decompressing it when compressed with the codec of its
+    extension (gzip when it has none of .gz, .zst, .lz4). Reads go through
+    the local cache when configured (see configure_cache).
+    """
+    data = _get_body(bucket, key, project_id)
     if compressed:
-        return decompress(data)
+        return resolve_codec(key).decompress(data)
     else:
         return data
 
 
+def _get_small_object(
+    bucket: str, key: str, compressed: bool = True, project_id: str | None = None
+) -> bytes:
+    """
+    get_object through the memory cache, when configured, for the small
+    objects read by the text, json and pickle getters. Bodies larger than
+    the cache are not kept.
+    """
+    if _memory_cache is None:
+        return get_object(bucket, key, compressed, project_id)
+    cache_key = f"object:{bucket}/{key}"
+    data = _memory_cache.get(cache_key)
+    if data is None:
+        data = _get_body(bucket, key, project_id)
+        _memory_cache.put(cache_key, data)
+    return resolve_codec(key).decompress(data) if compressed else data
+
+
+def open_object(
+    bucket: str, key: str, compressed: bool = True, project_id: str | None = None
+) -> BinaryIO:
+    """
+    Open an object as a binary file object that streams the blob in chunks,
+    and decompresses it on the fly when compressed, with the codec of its
+    extension like in get_object. Only one chunk is held in memory at a time;
+    close it (or use it as a context manager) when done.
+    """
+    bucket_obj = get_bucket(bucket, project_id)
+    stream = bucket_obj.blob(key).open("rb")
+    if compressed:
+        return resolve_codec(key).open(stream)
+    return stream
+
+
 def put_object(
     bucket: str,
     key: str,
     body: bytes,
     compress: bool = True,
+    codec: str | Codec | None = None,
     project_id: str | None = None,
 ) -> bool:
+    """
+    Put an object, compressing it first when compress is set: with codec
+    ("gzip", "zstd", "lz4" or a Codec such as GzipCodec(level=6)), else the
+    codec of the key extension, else gzip. Large bodies are compressed in
+    parallel blocks (see compression.configure_compression).
+    """
     if compress:
-        body = compress_f(body)
-
-    project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
+        body = compress_blocks(body, resolve_codec(key, codec))
 
-    bucket_obj = client.bucket(bucket)
+    bucket_obj = get_bucket(bucket, project_id)
     blob = bucket_obj.blob(key)
 
     try:
@@ -207,13 +748,13 @@ def put_object(
     except Exception as e:
         logger.error(f"Error uploading object: {e}")
         return False
+    finally:
+        # After the write, so a concurrent read can't cache the old body
+        invalidate_cache(bucket, [key])
 
 
 def delete_object(bucket: str, key: str, project_id: str | None = None) -> bool:
-    project_id, _ = retrieve_google_env(project_id, None)
-    client = storage.Client(project=project_id)
-
-    bucket_obj = client.bucket(bucket)
+    bucket_obj = get_bucket(bucket, project_id)
     blob = bucket_obj.blob(key)
 
     try:
@@ -222,6 +763,8 @@ def delete_object(bucket: str, key: str, project_id: str | None = None) -> bool:
     except Exception as e:
         logger.error(f"Error deleting object: {e}")
         return False
+    finally:
+        invalidate_cache(bucket, [key])
 
 
 def get_text_object(
@@ -231,7 +774,7 @@ def get_text_object(
     compressed: bool = True,
     project_id: str | None = None,
 ) -> str:
-    return get_object(bucket, key, compressed, project_id=project_id).decode(encoding)
+    return _get_small_object(bucket, key, compressed, project_id).decode(encoding)
 
 
 def put_text_object(
@@ -240,6 +783,7 @@ def put_text_object(
     body: str,
     encoding: str = "utf-8",
     compress: bool = True,
+    codec: str | Codec | None = None,
     project_id: str | None = None,
 ) -> bool:
     return put_object(
@@ -247,6 +791,7 @@ def put_text_object(
         key,
         body.encode(encoding),
         compress,
+        codec,
         project_id=project_id,
     )
 
@@ -264,6 +809,7 @@ def put_json_object(
     key: str,
     body: dict,
     compress: bool = True,
+    codec: str | Codec | None = None,
     project_id: str | None = None,
 ) -> bool:
     return put_text_object(
@@ -271,6 +817,7 @@ def put_json_object(
         key,
         json.dumps(body),
         compress=compress,
+        codec=codec,
         project_id=project_id,
     )
 
@@ -278,17 +825,56 @@ def put_json_object(
 def get_pkl_object(
     bucket: str, key: str, compressed: bool = True, project_id: str | None = None
 ) -> dict:
-    return pickle.loads(get_object(bucket, key, compressed, project_id=project_id))
+    return pickle.loads(_get_small_object(bucket, key, compressed, project_id))
 
 
 def put_pkl_object(
-    bucket: str, key: str, body, compress: bool = True, project_id: str | None = None
+    bucket: str,
+    key: str,
+    body,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+    project_id: str | None = None,
 ):
     return put_object(
         bucket,
         key,
         body=pickle.dumps(body),
         compress=compress,
+        codec=codec,
+        project_id=project_id,
+    )
+
+
+def get_parquet_object(
+    bucket: str,
+    key: str,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Read a parquet object with ranged reads, downloading only the footer,
+    the requested columns and the row groups that can match the filters.
+    """
+    bucket_obj = get_bucket(bucket, project_id)
+    with bucket_obj.blob(key).open("rb", chunk_size=PARQUET_READ_CHUNK_SIZE) as reader:
+        return read_parquet(reader, columns=columns, filters=filters)
+
+
+def put_parquet_object(
+    bucket: str,
+    key: str,
+    body: pd.DataFrame,
+    row_group_size: int | None = None,
+    project_id: str | None = None,
+) -> bool:
+    # Parquet pages are already compressed, so the object is not gzipped
+    return put_object(
+        bucket,
+        key,
+        write_parquet(body, row_group_size),
+        compress=False,
         project_id=project_id,
     )
 
@@ -304,15 +890,26 @@ def get_extension(key: str, compressed: bool = True) -> str:
 
 
 def is_compressed(key: str) -> bool:
-    compressed_extensions = [".gz"]
-    return any(key.endswith(ext) for ext in compressed_extensions)
+    return codec_of_key(key) is not None
+
+
+def _single_object_key(bucket: str, prefix: str, project_id: str | None = None) -> str:
+    if _memory_cache is None:
+        return list_single_object_key(bucket, prefix, project_id=project_id)
+    cache_key = f"single:{bucket}/{prefix}"
+    key = _memory_cache.get(cache_key)
+    if key is None:
+        key = list_single_object_key(bucket, prefix, project_id=project_id)
+        key = key.encode("utf-8")
+        _memory_cache.put(cache_key, key)
+    return key.decode("utf-8")
 
 
 def get_single_json_object(bucket: str, prefix: str, project_id: str | None = None):
     """
     Retrieve a single json object from a GCS bucket given a folder
     """
-    key = list_single_object_key(bucket, prefix, project_id=project_id)
+    key = _single_object_key(bucket, prefix, project_id)
 
     if get_extension(key, compressed=is_compressed(key)) != "json":
         raise ValueError("File is not a json file.")
@@ -329,7 +926,7 @@ def get_single_pkl_object(bucket: str, prefix: str, project_id: str | None = Non
     """
     Retrieve a single pickle object from a GCS bucket given a folder
     """
-    key = list_single_object_key(bucket, prefix, project_id=project_id)
+    key = _single_object_key(bucket, prefix, project_id)
 
     if get_extension(key, compressed=is_compressed(key)) != "pkl":
         raise ValueError("File is not a pickle file.")
@@ -342,33 +939,89 @@ def get_single_pkl_object(bucket: str, prefix: str, project_id: str | None = Non
     )
 
 
-def get_multiple_csv_objects(
+def _read_csv_shard(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Stream and parse a csv shard (see csv_shards.read_csv_shard).
+    """
+    with open_object(
+        bucket, key, compressed=is_compressed(key), project_id=project_id
+    ) as stream:
+        return read_csv_shard(stream, key, shard, engine, dtype_backend, usecols, dtype)
+
+
+def _read_csv_shard_in_process(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Read a csv shard like _read_csv_shard, downloading it in the calling
+    thread and parsing it in the process pool.
+    """
+    body = get_object(bucket, key, compressed=False, project_id=project_id)
+    return parse_csv(
+        body, key, shard, is_compressed(key), engine, dtype_backend, usecols, dtype
+    )
+
+
+def _list_shards(
     bucket: str, prefix: str, project_id: str | None = None
+) -> list[tuple[str, dict | None]]:
+    """
+    Keys of the shards under a prefix with their manifest entries (see
+    manifest.list_shards).
+    """
+    list_keys = list_objects_key(bucket, prefix, project_id)
+    manifest = None
+    if manifest_key(prefix) in list_keys:
+        manifest = get_manifest(bucket, prefix, project_id)
+    return list_shards(prefix, list_keys, manifest)
+
+
+def get_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    project_id: str | None = None,
 ) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from a GCS bucket given a folder and
     concatenate them.
+    engine="pyarrow" parses the decompressed bytes with the multithreaded
+    pyarrow reader; dtype_backend="pyarrow" also keeps the arrow columns.
+    When the prefix has a manifest, only the shards it lists are read, with
+    the dtypes it records, and a missing or truncated shard is an error.
     """
-    list_keys = list_multiple_objects_keys(bucket, prefix, project_id=project_id)
+    shards = _list_shards(bucket, prefix, project_id)
 
     list_ext = [
-        get_extension(key=key, compressed=is_compressed(key)) for key in list_keys
+        get_extension(key=key, compressed=is_compressed(key)) for key, _ in shards
     ]
     if not all(ext == "csv" for ext in list_ext):
         raise ValueError("Not all files are csv files.")
 
     list_df = []
-    for key in list_keys:
+    for key, shard in shards:
         list_df += [
-            pd.read_csv(
-                io.StringIO(
-                    get_text_object(
-                        bucket,
-                        key=key,
-                        compressed=is_compressed(key),
-                        project_id=project_id,
-                    )
-                )
+            _read_csv_shard(
+                bucket, key, shard, engine, dtype_backend, usecols, dtype, project_id
             )
         ]
 
@@ -381,124 +1034,350 @@ def get_multiple_csv_objects(
 
 
 def put_single_json_object(
-    bucket: str, prefix: str, body: dict, project_id: str | None = None
+    bucket: str,
+    prefix: str,
+    body: dict,
+    codec: str | Codec = "gzip",
+    project_id: str | None = None,
 ) -> str:
     """
-    Clean folder and put a single json file into such folder.
+    Clean folder and put a single json file into such folder, compressed
+    with codec.
     """
     clear_path(bucket, prefix, project_id=project_id)
 
-    key = os.path.join(prefix, str(uuid.uuid4()) + ".json.gz")
+    codec = get_codec(codec)
+    key = os.path.join(prefix, str(uuid.uuid4()) + ".json" + codec.extension)
 
-    put_json_object(bucket, key=key, body=body, compress=True, project_id=project_id)
+    put_json_object(
+        bucket,
+        key=key,
+        body=body,
+        compress=True,
+        codec=codec,
+        project_id=project_id,
+    )
 
     return key
 
 
 def put_single_pkl_object(
-    bucket: str, prefix: str, body, project_id: str | None = None
+    bucket: str,
+    prefix: str,
+    body,
+    codec: str | Codec = "gzip",
+    project_id: str | None = None,
 ) -> str:
     """
-    Clean folder and put a single pickle object into such folder.
+    Clean folder and put a single pickle object into such folder, compressed
+    with codec.
     """
     clear_path(bucket, prefix, project_id=project_id)
 
-    key = os.path.join(prefix, str(uuid.uuid4()) + ".pkl.gz")
+    codec = get_codec(codec)
+    key = os.path.join(prefix, str(uuid.uuid4()) + ".pkl" + codec.extension)
 
-    put_pkl_object(bucket, key=key, body=body, compress=True, project_id=project_id)
+    put_pkl_object(
+        bucket,
+        key=key,
+        body=body,
+        compress=True,
+        codec=codec,
+        project_id=project_id,
+    )
 
     return key
 
 
+def _put_csv_object(
+    bucket: str,
+    key: str,
+    body: pd.DataFrame,
+    codec: str | Codec = "gzip",
+    project_id: str | None = None,
+) -> dict:
+    """
+    Stream a dataframe as compressed CSV. Small outputs go up in a
+    single request; larger ones through a resumable upload fed while the
+    rest is still being serialized, so memory is bounded by the chunk size.
+    Returns the size and md5 of the stored object.
+    """
+    stored = {}
+    parts = hash_parts(iter_compressed_csv(body, CSV_UPLOAD_CHUNK_SIZE, codec), stored)
+    first_part = next(parts)
+    second_part = next(parts, None)
+    if second_part is None:
+        if not put_object(
+            bucket, key, first_part, compress=False, project_id=project_id
+        ):
+            raise OSError(f"Error uploading object {key}")
+        return stored
+
+    blob = get_bucket(bucket, project_id).blob(key)
+    url = blob.create_resumable_upload_session()
+    session = get_session(project_id)
+    try:
+        _upload_chunks(session, url, [first_part, second_part], parts)
+        return stored
+    except Exception as e:
+        # The object is only created by the final chunk, so cancelling the
+        # session leaves whatever was stored under the key untouched
+        try:
+            session.delete(url)
+        except Exception as cancel_error:
+            logger.warning(f"Error cancelling upload of {key}: {cancel_error}")
+        logger.error(f"Error uploading object: {e}")
+        raise
+    finally:
+        invalidate_cache(bucket, [key])
+
+
+def _upload_chunks(
+    session: AuthorizedSession,
+    url: str,
+    first_parts: list[bytes],
+    parts: Iterator[bytes],
+) -> None:
+    """
+    Send the parts of an object through a resumable upload session in
+    chunks of CSV_UPLOAD_CHUNK_SIZE, the last one completing the upload.
+    """
+    buffer = bytearray()
+    offset = 0
+    for part in [*first_parts, *parts]:
+        buffer += part
+        while len(buffer) > CSV_UPLOAD_CHUNK_SIZE:
+            chunk = bytes(buffer[:CSV_UPLOAD_CHUNK_SIZE])
+            del buffer[:CSV_UPLOAD_CHUNK_SIZE]
+            _upload_chunk(session, url, chunk, offset, None)
+            offset += len(chunk)
+    _upload_chunk(session, url, bytes(buffer), offset, offset + len(buffer))
+
+
+def _upload_chunk(
+    session: AuthorizedSession,
+    url: str,
+    chunk: bytes,
+    offset: int,
+    total: int | None,
+) -> None:
+    size = "*" if total is None else total
+    content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+    response = session.put(url, data=chunk, headers={"Content-Range": content_range})
+    # 308 acknowledges an intermediate chunk, 200/201 the completed object
+    if response.status_code not in (200, 201, 308):
+        raise exceptions.from_http_response(response)
+
+
+def _put_csv_object_in_process(
+    bucket: str,
+    key: str,
+    body: pd.DataFrame,
+    codec: Codec,
+    project_id: str | None = None,
+) -> dict:
+    """
+    Serialize a csv shard in the process pool and upload it from the
+    calling thread. Returns the size and md5 of the stored object.
+    """
+    data = serialize_csv(body, codec)
+    if not put_object(bucket, key, data, compress=False, project_id=project_id):
+        raise OSError(f"Error uploading object {key}")
+    return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+
+def _put_parquet_shard(
+    bucket: str,
+    key: str,
+    body: pd.DataFrame,
+    row_group_size: int | None = None,
+    codec: str | Codec = "zstd",
+    project_id: str | None = None,
+) -> dict:
+    codec = get_codec(codec)
+    data = write_parquet(body, row_group_size, codec.name, codec.level)
+    if not put_object(bucket, key, data, compress=False, project_id=project_id):
+        raise OSError(f"Error uploading object {key}")
+    return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+
 def put_multiple_csv_objects(
     bucket: str,
     prefix: str,
     body: pd.DataFrame,
     size_max_mb: float = 100,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    index_prefix: str | None = None,
+    manifest: bool = True,
+    codec: str | Codec = "gzip",
+    executor: str = "thread",
     project_id: str | None = None,
 ) -> list[str]:
     """
     Clean folder, split dataframe into multiple csv files and put them into
-    folder
+    folder. Shards are planned from the compressed size of a sample of rows,
+    so they come out about the same size and under size_max_mb once stored.
+    Up to max_workers shards are serialized and uploaded at once.
+    Shards are compressed with codec and named with its extension.
+    With executor="process", shards are serialized and compressed in the
+    shared process pool (see processes.configure_process_pool) and uploaded
+    from threads; their columns must be convertible to Arrow.
+    With index_prefix, prefix must be one of its <YYYY>/<MM>/<DD> partitions
+    and the shards are recorded in its partition index; without it, a
+    <YYYY>/<MM>/<DD> prefix is recorded in the index of its dataset, if any.
+    With manifest, a _manifest.json listing the keys, sizes, rows and md5 of
+    the shards and the column dtypes is written once every shard is stored.
     """
-    clear_path(bucket, prefix, project_id=project_id)
-
-    size_memory_mb = body.memory_usage(deep=True).sum() / (1024**2)
-    size_row_slice = int(size_max_mb / size_memory_mb * len(body))
-
-    def _generate_slices(dataframe: pd.DataFrame, row_slice_size: int):
-        """Generates slices of the DataFrame based on the given row slice size."""
-        for start in range(0, len(dataframe), row_slice_size):
-            yield dataframe.iloc[start : start + row_slice_size]
-
-    list_keys = list()
-    for df in _generate_slices(body, max(size_row_slice, 1)):
-        key = os.path.join(prefix, str(uuid.uuid4()) + ".csv.gz")
-        list_keys.append(key)
-        put_text_object(
-            bucket,
-            key=key,
-            body=df.to_csv(index=False, quoting=csv.QUOTE_ALL),
-            compress=True,
-            project_id=project_id,
-        )
+    check_executor(executor)
+    if index_prefix is not None:
+        partition_of_prefix(index_prefix, prefix)
+    update_index = _clear_for_write(bucket, prefix, index_prefix, project_id)
+
+    codec = get_codec(codec)
+    put = _put_csv_object if executor == "thread" else _put_csv_object_in_process
+    shard_rows = plan_shard_rows(
+        len(body),
+        estimate_bytes_per_row(body, lambda df: compress_csv(df, codec)),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
 
-    return list_keys
+    shards = put_shards(
+        prefix,
+        body,
+        shard_rows,
+        ".csv" + codec.extension,
+        lambda key, df: put(
+            bucket, key=key, body=df, codec=codec, project_id=project_id
+        ),
+        max_workers,
+    )
+    return commit_shards(
+        prefix,
+        body,
+        "csv",
+        shards,
+        index_prefix,
+        manifest,
+        update_index,
+        partial(put_json_object, bucket, compress=False, project_id=project_id),
+    )
 
 
 def get_multiple_csv_objects_threaded(
     bucket: str,
     prefixes: list[str],
     logger: logging.Logger | None = None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+    executor: str = "thread",
     project_id: str | None = None,
 ) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from a GCS bucket given a list of prefixes and
-    concatenate them.
+    concatenate them. See get_multiple_csv_objects for the parsing options.
+    With executor="process", objects are downloaded from threads and
+    decompressed and parsed in the shared process pool (see
+    processes.configure_process_pool), which returns the columns as Arrow
+    IPC buffers.
+    Failed listings or downloads are retried up to retries times; the first
+    key that still fails cancels the pending ones and raises a
+    ThreadedTaskError.
+    Shards are concatenated in key order. assembly="preallocate" copies them
+    into preallocated columns, releasing each shard as soon as it is copied,
+    which keeps peak memory close to the size of the result.
+    Prefixes with a manifest are read like in get_multiple_csv_objects, and
+    every shard must have the rows the manifest lists.
     """
+    check_executor(executor)
+    read = _read_csv_shard if executor == "thread" else _read_csv_shard_in_process
+    return get_multiple_objects_threaded(
+        prefixes,
+        partial(_list_shards, bucket, project_id=project_id),
+        lambda key, shard: read(
+            bucket, key, shard, engine, dtype_backend, usecols, dtype, project_id
+        ),
+        logger,
+        retries,
+        assembly,
+    )
 
-    def _get_object(key: str, list_df: list[pd.DataFrame]):
-        if logger:
-            logger.info(f"Getting object {key}")
-        list_df.append(
-            pd.read_csv(
-                io.StringIO(
-                    get_text_object(
-                        bucket,
-                        key=key,
-                        compressed=is_compressed(key),
-                        project_id=project_id,
-                    )
-                )
-            )
-        )
-        if logger:
-            logger.info(f"Object {key} done")
-
-    def _get_keys(prefix: str, list_keys: list[str]):
-        list_keys.extend(
-            list_multiple_objects_keys(bucket, prefix, project_id=project_id)
-        )
 
-    list_keys = []
-    with ThreadPoolExecutor() as executor:
-        for prefix in prefixes:
-            executor.submit(_get_keys, prefix, list_keys)
+def iter_csv_objects(
+    bucket: str,
+    prefixes: list[str],
+    chunksize: int | None = None,
+    prefetch: int = 2,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+    project_id: str | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Iterate over the csv objects under a list of prefixes in key order,
+    yielding one DataFrame per object, or chunks of chunksize rows when given.
+    The next prefetch objects are downloaded and parsed in the background, so
+    at most prefetch + 2 objects are held in memory at once, counting the one
+    being consumed.
+    See get_multiple_csv_objects for the parsing options.
+    """
 
-    list_df = []
-    with ThreadPoolExecutor() as executor:
-        for key in list_keys:
-            executor.submit(_get_object, key, list_df)
+    shards = {}
 
-    if len(list_df) == 0:
-        raise ValueError("No data found")
+    def _iter_keys() -> Iterator[str]:
+        for prefix in prefixes:
+            for key, shard in _list_shards(bucket, prefix, project_id):
+                shards[key] = shard
+                yield key
+
+    def _read(key: str) -> pd.DataFrame:
+        # Dropped only once read, so a retry still finds the entry
+        df = _read_csv_shard(
+            bucket, key, shards[key], engine, dtype_backend, usecols, dtype, project_id
+        )
+        shards.pop(key, None)
+        return df
+
+    dfs = iter_threaded(
+        _read,
+        _iter_keys(),
+        prefetch=prefetch,
+        retries=retries,
+    )
+    if chunksize is None:
+        return dfs
+    return rechunk(dfs, chunksize)
 
-    try:
-        df = pd.concat(list_df).reset_index(drop=True)
-    except Exception as e:
-        raise ValueError("Error concatenating dataframes") from e
 
-    return df
+def _list_shards_between_dates(
+    bucket: str,
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    project_id: str | None = None,
+) -> list[tuple[str, dict | None]]:
+    shards = list_shards_between_dates(
+        prefix,
+        start_date,
+        end_date,
+        partial(get_partition_index, bucket, project_id=project_id),
+        partial(_list_objects_key_by_day, bucket, project_id=project_id),
+        partial(get_manifest, bucket, project_id=project_id),
+    )
+    if len(shards) == 0:
+        raise ValueError(
+            f"No data found between {start_date} and {end_date} at {prefix}"
+        )
+    return shards
 
 
 def get_multiple_csv_objects_between_dates_threaded(
@@ -506,20 +1385,23 @@ def get_multiple_csv_objects_between_dates_threaded(
     prefix: str,
     start_date: datetime,
     end_date: datetime,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
     project_id: str | None = None,
 ) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from a GCS bucket given a prefix and a
-    date range, then concatenate them.
+    date range, then concatenate them. Days written with a manifest are
+    read like in get_multiple_csv_objects.
     """
-    list_keys = list_objects_key_between_dates(
-        bucket, prefix, start_date, end_date, project_id=project_id
+    return get_shards_threaded(
+        _list_shards_between_dates(bucket, prefix, start_date, end_date, project_id),
+        lambda key, shard: _read_csv_shard(
+            bucket, key, shard, engine, dtype_backend, usecols, dtype, project_id
+        ),
     )
-    if len(list_keys) == 0:
-        raise ValueError(
-            f"No data found between {start_date} and {end_date} at {prefix}"
-        )
-    return get_multiple_csv_objects_threaded(bucket, list_keys, project_id=project_id)
 
 
 def put_multiple_csv_objects_threaded(
@@ -527,22 +1409,252 @@ def put_multiple_csv_objects_threaded(
     dfs: dict[str, pd.DataFrame],
     size_max_mb: float = 100,
     logger: logging.Logger | None = None,
+    retries: int = 0,
+    index_prefix: str | None = None,
+    codec: str | Codec = "gzip",
+    executor: str = "thread",
     project_id: str | None = None,
 ) -> None:
     """
-    Put multiple csv objects into a GCS bucket given a folder.
+    Put multiple csv objects into a GCS bucket given a folder, compressed
+    with codec. executor="process" serializes the shards in a process pool
+    (see put_multiple_csv_objects).
+    Failed prefixes are retried up to retries times; the first prefix that
+    still fails cancels the pending ones and raises a ThreadedTaskError.
+    With index_prefix, every prefix must be one of its date partitions (see
+    put_multiple_csv_objects).
     """
-    with ThreadPoolExecutor() as executor:
-        for prefix, df in dfs.items():
-            if logger:
-                logger.info(f"Putting object {prefix}")
-            executor.submit(
-                put_multiple_csv_objects,
-                bucket,
-                prefix,
-                df,
-                size_max_mb,
-                project_id=project_id,
-            )
+
+    def _put(prefix: str) -> list[str]:
+        if logger:
+            logger.info(f"Putting object {prefix}")
+        return put_multiple_csv_objects(
+            bucket,
+            prefix,
+            dfs[prefix],
+            size_max_mb,
+            index_prefix=index_prefix,
+            codec=codec,
+            executor=executor,
+            project_id=project_id,
+        )
+
+    check_executor(executor)
+    run_threaded(_put, list(dfs), retries=retries)
     if logger:
         logger.info("Upload finished")
+
+
+def put_multiple_parquet_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    size_max_mb: float = 100,
+    row_group_size: int | None = None,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    index_prefix: str | None = None,
+    manifest: bool = True,
+    codec: str | Codec = "zstd",
+    project_id: str | None = None,
+) -> list[str]:
+    """
+    Clean folder, split dataframe into multiple parquet files and put them
+    into folder. Shards are planned, uploaded, indexed and committed with a
+    manifest like in put_multiple_csv_objects. codec compresses the pages
+    inside the files, which keep the .parquet extension.
+    """
+    if index_prefix is not None:
+        partition_of_prefix(index_prefix, prefix)
+    update_index = _clear_for_write(bucket, prefix, index_prefix, project_id)
+
+    codec = get_codec(codec)
+    shard_rows = plan_shard_rows(
+        len(body),
+        estimate_bytes_per_row(
+            body,
+            lambda df: write_parquet(df, row_group_size, codec.name, codec.level),
+        ),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
+
+    shards = put_shards(
+        prefix,
+        body,
+        shard_rows,
+        ".parquet",
+        lambda key, df: _put_parquet_shard(
+            bucket, key, df, row_group_size, codec, project_id
+        ),
+        max_workers,
+    )
+    return commit_shards(
+        prefix,
+        body,
+        "parquet",
+        shards,
+        index_prefix,
+        manifest,
+        update_index,
+        partial(put_json_object, bucket, compress=False, project_id=project_id),
+    )
+
+
+def _read_parquet_shard(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    df = get_parquet_object(
+        bucket, key, columns=columns, filters=filters, project_id=project_id
+    )
+    if shard is None or filters is not None:
+        return df
+    return check_rows(df, key, shard)
+
+
+def get_multiple_parquet_objects_threaded(
+    bucket: str,
+    prefixes: list[str],
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve multiple parquet objects from a GCS bucket given a list of
+    prefixes and concatenate them, reading only the given columns and the
+    rows that match the filters. Errors are handled like in
+    get_multiple_csv_objects_threaded.
+    """
+
+    return get_multiple_objects_threaded(
+        prefixes,
+        partial(_list_shards, bucket, project_id=project_id),
+        lambda key, shard: _read_parquet_shard(
+            bucket, key, shard, columns, filters, project_id
+        ),
+        logger,
+        retries,
+        assembly,
+    )
+
+
+def get_multiple_parquet_objects_between_dates_threaded(
+    bucket: str,
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve multiple parquet objects from a GCS bucket given a prefix and a
+    date range, then concatenate them. Days written with a manifest must
+    have the rows it lists.
+    """
+    return get_shards_threaded(
+        _list_shards_between_dates(bucket, prefix, start_date, end_date, project_id),
+        lambda key, shard: _read_parquet_shard(
+            bucket, key, shard, columns, filters, project_id
+        ),
+    )
+
+
+def put_partitioned_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    partition_cols: list[str] | None = None,
+    date_col: str | None = None,
+    file_format: str = "csv",
+    size_max_mb: float = 100,
+    max_workers: int = 4,
+    retries: int = 0,
+    index: bool = False,
+    project_id: str | None = None,
+) -> dict[str, list[str]]:
+    """
+    Split a dataframe by partition and put every partition under its own
+    folder, up to max_workers partitions at once:
+    <prefix>/<YYYY>/<MM>/<DD>/<col>=<value>/..., the date taken from
+    date_col and a segment per partition column (see partition_groups).
+    Partitions are written like in put_multiple_csv_objects or
+    put_multiple_parquet_objects, replacing the partitions present in the
+    dataframe and leaving the others untouched. The partition columns are
+    kept in the files. With index, which needs date_col and no
+    partition_cols, the dates are recorded in the partition index of prefix.
+    Returns the keys written for every partition folder.
+    """
+    writers = {"csv": put_multiple_csv_objects, "parquet": put_multiple_parquet_objects}
+    if file_format not in writers:
+        raise ValueError(f"Unknown file format: {file_format}")
+
+    def _put(path: str, df: pd.DataFrame, index_prefix: str | None) -> list[str]:
+        return writers[file_format](
+            bucket,
+            path,
+            df,
+            size_max_mb,
+            index_prefix=index_prefix,
+            project_id=project_id,
+        )
+
+    return write_partitions(
+        prefix, body, _put, partition_cols, date_col, max_workers, retries, index
+    )
+
+
+def get_partitioned_objects(
+    bucket: str,
+    prefix: str,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    file_format: str = "csv",
+    columns: list[str] | None = None,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+    project_id: str | None = None,
+) -> pd.DataFrame:
+    """
+    Read a dataset written by put_partitioned_objects, downloading only the
+    partitions that can match. Partitions are pruned from the keys of a
+    single listing: by date between start_date and end_date, both included,
+    using the partition index when there is one, and by the <col>=<value>
+    segments against filters (see match_partition). The remaining objects
+    are read and filtered row by row, parquet with predicate pushdown and
+    csv with the dtypes of the manifest of their partition, and
+    concatenated like in get_multiple_csv_objects_threaded.
+    """
+    return read_partitions(
+        prefix,
+        partial(iter_objects_key, bucket, project_id=project_id),
+        partial(get_partition_index, bucket, project_id=project_id),
+        partial(_list_objects_key_by_day, bucket, project_id=project_id),
+        partial(get_manifest, bucket, project_id=project_id),
+        lambda key, shard, usecols: _read_csv_shard(
+            bucket, key, shard, usecols=usecols, project_id=project_id
+        ),
+        lambda key, columns, filters: get_parquet_object(
+            bucket, key, columns=columns, filters=filters, project_id=project_id
+        ),
+        filters,
+        start_date,
+        end_date,
+        file_format,
+        columns,
+        logger,
+        retries,
+        assembly,
+    )
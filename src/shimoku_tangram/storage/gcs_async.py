@@ -0,0 +1,529 @@
+import asyncio
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable
+from functools import partial
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from urllib.parse import quote
+
+from google.api_core.exceptions import NotFound, PreconditionFailed, from_http_status
+import google.auth
+from google.auth.transport.requests import Request
+import httpx
+import pandas as pd
+
+from shimoku_tangram.reporting.logging import init_logger
+from shimoku_tangram.storage import aio, gcs
+from shimoku_tangram.storage.aio import AsyncTransport, as_async_iterable
+from shimoku_tangram.storage.csv_shards import parse_csv_shard
+from shimoku_tangram.storage.compression import Codec, compress_csv, get_codec
+from shimoku_tangram.storage.manifest import manifest_key
+from shimoku_tangram.storage.partitions import (
+    dataset_of,
+    drop_cleared,
+    index_key,
+    modify_index_async,
+    record_shards,
+    split_partition_prefix,
+)
+from shimoku_tangram.storage.sharding import (
+    commit_shards_async,
+    estimate_bytes_per_row,
+    get_multiple_objects_async,
+    list_prefix_shards_async,
+    plan_shard_rows,
+    put_shards_async,
+)
+from shimoku_tangram.storage.tasks import run_async
+
+
+logger = init_logger(__name__)
+
+SCOPES = ("https://www.googleapis.com/auth/devstorage.read_write",)
+
+_endpoint_url = "https://storage.googleapis.com"
+_transport = AsyncTransport()
+
+
+def configure_client(
+    max_concurrency: int = 64,
+    max_attempts: int = 5,
+    timeout: float = 60,
+    endpoint_url: str = "https://storage.googleapis.com",
+) -> None:
+    """
+    Set the number of requests kept in flight per event loop, the attempts
+    and timeout of every request, and the JSON API endpoint (e.g. an
+    emulator). Clients already created are dropped; call close_clients first
+    from loops that used them.
+    """
+    global _transport, _endpoint_url
+    _transport = AsyncTransport(max_concurrency, max_attempts, timeout)
+    _endpoint_url = endpoint_url.rstrip("/")
+
+
+async def close_clients() -> None:
+    """
+    Close the HTTP client of the running event loop, e.g. on app shutdown.
+    """
+    await _transport.aclose()
+
+
+class _GoogleAuth(httpx.Auth):
+    """
+    Authorize requests with the application default credentials. Tokens are
+    refreshed in a worker thread, since google-auth refreshes synchronously.
+    """
+
+    def __init__(self):
+        self._credentials = None
+        self._lock = threading.Lock()
+
+    def _token(self) -> str:
+        with self._lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(scopes=SCOPES)
+            if not self._credentials.valid:
+                self._credentials.refresh(Request())
+            return self._credentials.token
+
+    def auth_flow(self, request: httpx.Request):
+        request.headers["Authorization"] = f"Bearer {self._token()}"
+        yield request
+
+    async def async_auth_flow(self, request: httpx.Request):
+        credentials = self._credentials
+        if credentials is not None and credentials.valid:
+            token = credentials.token
+        else:
+            token = await asyncio.to_thread(self._token)
+        request.headers["Authorization"] = f"Bearer {token}"
+        yield request
+
+
+_auth = _GoogleAuth()
+
+
+def _object_url(bucket: str, key: str) -> str:
+    return f"{_endpoint_url}/storage/v1/b/{bucket}/o/{quote(key, safe='')}"
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request and raise the google.api_core exception the sync client
+    would raise for an error response (NotFound, Forbidden, ...).
+    """
+    response = await _transport.request(method, url, auth=_auth, **kwargs)
+    if response.status_code >= 300:
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text
+        raise from_http_status(response.status_code, message, response=response)
+    return response
+
+
+async def iter_objects_metadata(bucket: str, prefix: str = "") -> AsyncIterator[dict]:
+    """
+    Yield the metadata of every object under a prefix. Pages of the listing
+    are requested lazily, only once the previous page has been consumed.
+    """
+    params = {
+        "prefix": prefix,
+        "fields": "items(name,size,timeCreated,etag),nextPageToken",
+    }
+    while True:
+        response = await _request(
+            "GET", f"{_endpoint_url}/storage/v1/b/{bucket}/o", params=params
+        )
+        page = response.json()
+        for item in page.get("items", []):
+            yield {
+                "Key": item["name"],
+                "LastModified": item.get("timeCreated"),
+                "Size": int(item.get("size", 0)),
+                "ETag": item.get("etag"),
+            }
+        if "nextPageToken" not in page:
+            return
+        params = {**params, "pageToken": page["nextPageToken"]}
+
+
+async def iter_objects_key(bucket: str, prefix: str = "") -> AsyncIterator[str]:
+    async for obj in iter_objects_metadata(bucket, prefix):
+        yield obj["Key"]
+
+
+async def list_objects_metadata(bucket: str, prefix: str = "") -> list:
+    return [obj async for obj in iter_objects_metadata(bucket, prefix)]
+
+
+async def list_objects_key(bucket: str, prefix: str = "") -> list:
+    return [key async for key in iter_objects_key(bucket, prefix)]
+
+
+async def _get_body(bucket: str, key: str) -> bytes:
+    response = await _request("GET", _object_url(bucket, key), params={"alt": "media"})
+    return response.content
+
+
+async def get_object(bucket: str, key: str, compressed: bool = True) -> bytes:
+    """
+    Get an object, decompressing it when compressed with the codec of its
+    extension, like gcs.get_object.
+    """
+    body = await _get_body(bucket, key)
+    if compressed:
+        return await aio.decompress(key, body)
+    return body
+
+
+async def put_object(
+    bucket: str,
+    key: str,
+    body: bytes,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    """
+    Put an object, compressing it first when compress is set with codec or
+    the codec of the key extension. Errors are logged and make the result
+    False, like gcs.put_object.
+    """
+    if compress:
+        body = await aio.compress(key, body, codec)
+    try:
+        await _request(
+            "POST",
+            f"{_endpoint_url}/upload/storage/v1/b/{bucket}/o",
+            params={"uploadType": "media", "name": key},
+            content=body,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error uploading object: {e}")
+        return False
+    finally:
+        # Keep the caches of storage.gcs coherent with writes made from here
+        gcs.invalidate_cache(bucket, [key])
+
+
+async def _delete(bucket: str, key: str) -> None:
+    try:
+        await _request("DELETE", _object_url(bucket, key))
+    finally:
+        gcs.invalidate_cache(bucket, [key])
+
+
+async def delete_object(bucket: str, key: str) -> bool:
+    try:
+        await _delete(bucket, key)
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting object: {e}")
+        return False
+
+
+async def delete_objects(
+    bucket: str, keys: Iterable[str] | AsyncIterable[str]
+) -> dict[str, str]:
+    """
+    Delete keys with one request each, sent as soon as the key is known.
+    Tasks are only started for the requests configure_client lets in
+    flight, so a long listing is consumed as keys get deleted. Returns the
+    keys that could not be deleted mapped to their error, so an empty dict
+    means every key was deleted. A key that is already gone counts as
+    deleted.
+    """
+    failures = {}
+    slots = asyncio.Semaphore(_transport.max_concurrency)
+
+    async def _delete_key(key: str) -> None:
+        try:
+            await _delete(bucket, key)
+        except Exception as e:
+            if getattr(e, "code", None) != 404:
+                failures[key] = str(e)
+        finally:
+            slots.release()
+
+    tasks = set()
+    async for key in as_async_iterable(keys):
+        await slots.acquire()
+        task = asyncio.ensure_future(_delete_key(key))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return failures
+
+
+async def _get_partition_index(bucket: str, prefix: str) -> tuple[dict | None, int]:
+    key = index_key(prefix)
+    try:
+        response = await _request(
+            "GET", _object_url(bucket, key), params={"alt": "media"}
+        )
+    except NotFound:
+        return None, 0
+    body = await aio.decompress(key, response.content)
+    return json.loads(body), int(response.headers["x-goog-generation"])
+
+
+async def _put_partition_index(
+    bucket: str, prefix: str, index: dict, generation: int
+) -> bool:
+    key = index_key(prefix)
+    body = await aio.compress(key, json.dumps(index).encode("utf-8"), None)
+    try:
+        await _request(
+            "POST",
+            f"{_endpoint_url}/upload/storage/v1/b/{bucket}/o",
+            params={
+                "uploadType": "media",
+                "name": key,
+                "ifGenerationMatch": str(generation),
+            },
+            content=body,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+    except PreconditionFailed:
+        return False
+    finally:
+        gcs.invalidate_cache(bucket, [key])
+    return True
+
+
+async def _modify_partition_index(
+    bucket: str, prefix: str, modify: Callable[[dict], dict]
+) -> None:
+    # Only an existing index is kept up to date, like gcs._modify_partition_index
+    await modify_index_async(
+        prefix,
+        modify,
+        partial(_get_partition_index, bucket),
+        partial(_put_partition_index, bucket),
+        create=False,
+    )
+
+
+async def _update_partition_index(
+    bucket: str, prefix: str, shards: list[dict], columns: list[dict] | None
+) -> None:
+    # Shards of a <YYYY>/<MM>/<DD> prefix go to the index of its dataset
+    split = split_partition_prefix(prefix)
+    if split is not None:
+        await _modify_partition_index(
+            bucket, split[0], record_shards(split[1], shards, columns)
+        )
+
+
+async def _clear_partition_index(
+    bucket: str, prefix: str, failures: dict[str, str]
+) -> None:
+    index_prefix = dataset_of(prefix)
+    if index_prefix is not None:
+        await _modify_partition_index(
+            bucket, index_prefix, drop_cleared(prefix, failures)
+        )
+
+
+async def clear_path(bucket: str, prefix: str = "") -> bool:
+    """
+    Delete every object under a prefix while the listing is still being
+    paginated. Failed keys are logged and make the result False. Like
+    gcs.clear_path, cleared date partitions leave the partition index.
+    """
+    failures = await delete_objects(bucket, iter_objects_key(bucket, prefix))
+    for key, error in failures.items():
+        logger.error(f"Error deleting object {key}: {error}")
+    await _clear_partition_index(bucket, prefix, failures)
+    return len(failures) == 0
+
+
+async def get_text_object(
+    bucket: str, key: str, encoding: str = "utf-8", compressed: bool = True
+) -> str:
+    return (await get_object(bucket, key, compressed)).decode(encoding)
+
+
+async def put_text_object(
+    bucket: str,
+    key: str,
+    body: str,
+    encoding: str = "utf-8",
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_object(bucket, key, body.encode(encoding), compress, codec)
+
+
+async def get_json_object(bucket: str, key: str, compressed: bool = True) -> dict:
+    return json.loads(await get_text_object(bucket, key, compressed=compressed))
+
+
+async def put_json_object(
+    bucket: str,
+    key: str,
+    body: dict,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_text_object(
+        bucket, key, json.dumps(body), compress=compress, codec=codec
+    )
+
+
+async def get_pkl_object(bucket: str, key: str, compressed: bool = True):
+    return pickle.loads(await get_object(bucket, key, compressed))
+
+
+async def put_pkl_object(
+    bucket: str,
+    key: str,
+    body,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_object(bucket, key, pickle.dumps(body), compress, codec)
+
+
+async def _get_manifest(bucket: str, prefix: str) -> dict:
+    return await get_json_object(bucket, manifest_key(prefix), compressed=False)
+
+
+async def get_multiple_csv_objects_threaded(
+    bucket: str,
+    prefixes: list[str],
+    logger: logging.Logger | None = None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+) -> pd.DataFrame:
+    """
+    Async counterpart of gcs.get_multiple_csv_objects_threaded, under the
+    same name so calls port over with an await. Downloads run on the event
+    loop, bounded by configure_client; parsing runs in worker threads.
+    """
+
+    async def _list_shards(prefix: str) -> list[tuple[str, dict | None]]:
+        return await list_prefix_shards_async(
+            prefix, partial(list_objects_key, bucket), partial(_get_manifest, bucket)
+        )
+
+    async def _read(key: str, shard: dict | None) -> pd.DataFrame:
+        return await asyncio.to_thread(
+            parse_csv_shard,
+            await _get_body(bucket, key),
+            key,
+            shard,
+            gcs.is_compressed(key),
+            engine,
+            dtype_backend,
+            usecols,
+            dtype,
+        )
+
+    return await get_multiple_objects_async(
+        prefixes, _list_shards, _read, logger, retries
+    )
+
+
+async def get_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve the csv objects under a prefix and concatenate them, like
+    gcs.get_multiple_csv_objects.
+    """
+    return await get_multiple_csv_objects_threaded(
+        bucket,
+        [prefix],
+        engine=engine,
+        dtype_backend=dtype_backend,
+        usecols=usecols,
+        dtype=dtype,
+    )
+
+
+async def put_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    size_max_mb: float = 100,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    manifest: bool = True,
+    codec: str | Codec = "gzip",
+) -> list[str]:
+    """
+    Clean folder, split dataframe into multiple csv files and put them into
+    folder, like gcs.put_multiple_csv_objects. Up to max_workers shards are
+    serialized in worker threads at once, uploads run on the event loop.
+    """
+    await clear_path(bucket, prefix)
+
+    codec = get_codec(codec)
+    shard_rows = plan_shard_rows(
+        len(body),
+        await asyncio.to_thread(
+            estimate_bytes_per_row, body, lambda df: compress_csv(df, codec)
+        ),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
+
+    async def _put(key: str, df: pd.DataFrame) -> dict:
+        data = await asyncio.to_thread(compress_csv, df, codec)
+        if not await put_object(bucket, key, data, compress=False):
+            raise OSError(f"Error uploading object {key}")
+        return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+    shards = await put_shards_async(
+        prefix, body, shard_rows, ".csv" + codec.extension, _put, max_workers
+    )
+    return await commit_shards_async(
+        prefix,
+        body,
+        "csv",
+        shards,
+        manifest,
+        partial(_update_partition_index, bucket),
+        partial(put_json_object, bucket, compress=False),
+    )
+
+
+async def put_multiple_csv_objects_threaded(
+    bucket: str,
+    dfs: dict[str, pd.DataFrame],
+    size_max_mb: float = 100,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    codec: str | Codec = "gzip",
+) -> None:
+    """
+    Async counterpart of gcs.put_multiple_csv_objects_threaded, putting the
+    dataframes of several prefixes at once.
+    """
+
+    async def _put(prefix: str) -> list[str]:
+        if logger:
+            logger.info(f"Putting object {prefix}")
+        return await put_multiple_csv_objects(
+            bucket, prefix, dfs[prefix], size_max_mb, codec=codec
+        )
+
+    await run_async(_put, list(dfs), retries)
+    if logger:
+        logger.info("Upload finished")
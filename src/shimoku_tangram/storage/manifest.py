@@ -0,0 +1,124 @@
+from collections.abc import Iterator
+import hashlib
+
+import pandas as pd
+
+# Object written under a prefix once all of its shards are stored
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_key(prefix: str) -> str:
+    return f"{prefix.rstrip('/')}/{MANIFEST_NAME}"
+
+
+def is_metadata(key: str) -> bool:
+    """
+    Whether a key is a metadata object (manifest, partition index, ...)
+    rather than a data shard: its file name starts with an underscore.
+    """
+    return key.rsplit("/", 1)[-1].startswith("_")
+
+
+def list_shards(
+    prefix: str, list_keys: list[str], manifest: dict | None
+) -> list[tuple[str, dict | None]]:
+    """
+    Keys of the shards under a prefix, each with its manifest entry and the
+    manifest columns, given the listing of the prefix and its manifest. When
+    there is no manifest the entries are None. Fails if no files are found
+    or a shard of the manifest is missing from the listing.
+    """
+    if manifest is None:
+        list_keys = [
+            key for key in list_keys if not key.endswith("/") and not is_metadata(key)
+        ]
+        if len(list_keys) == 0:
+            raise ValueError(f"No files found in prefix: {prefix}")
+        return [(key, None) for key in list_keys]
+
+    missing = {shard["key"] for shard in manifest["shards"]} - set(list_keys)
+    if missing:
+        raise ValueError(
+            f"Incomplete data in prefix {prefix}: {len(missing)} shard(s) of "
+            "its manifest are missing"
+        )
+    return [
+        (shard["key"], {**shard, "columns": manifest["columns"]})
+        for shard in manifest["shards"]
+    ]
+
+
+def build_manifest(body: pd.DataFrame, file_format: str, shards: list[dict]) -> dict:
+    """
+    Describe the shards written for a dataframe: their keys, stored sizes,
+    row counts and md5 of the stored bytes, plus the columns and dtypes.
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "format": file_format,
+        "rows": len(body),
+        "columns": [
+            {"name": str(name), "dtype": str(dtype)}
+            for name, dtype in body.dtypes.items()
+        ],
+        "shards": shards,
+    }
+
+
+def hash_parts(parts: Iterator[bytes], shard: dict) -> Iterator[bytes]:
+    """
+    Pass the parts of a stored object through, recording their total size
+    and md5 in shard once they have all been consumed.
+    """
+    digest = hashlib.md5()
+    size = 0
+    for part in parts:
+        digest.update(part)
+        size += len(part)
+        yield part
+    shard["size"] = size
+    shard["md5"] = digest.hexdigest()
+
+
+def csv_read_types(
+    columns: list[dict], usecols: list[str] | None = None
+) -> tuple[dict, dict]:
+    """
+    Split the columns of a manifest into the dtypes read_csv can parse
+    directly and the datetime columns that have to be parsed as dates and
+    then converted. Other dtypes are left to inference.
+    """
+    dtypes = {}
+    dates = {}
+    for column in columns:
+        name = column["name"]
+        if usecols is not None and name not in usecols:
+            continue
+        try:
+            dtype = pd.api.types.pandas_dtype(column["dtype"])
+        except TypeError:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            dates[name] = dtype
+        elif (
+            pd.api.types.is_bool_dtype(dtype)
+            or pd.api.types.is_numeric_dtype(dtype)
+            or pd.api.types.is_string_dtype(dtype)
+        ) and not (
+            isinstance(dtype, pd.CategoricalDtype)
+            or pd.api.types.is_complex_dtype(dtype)
+        ):
+            dtypes[name] = dtype
+    return dtypes, dates
+
+
+def check_rows(df: pd.DataFrame, key: str, shard: dict) -> pd.DataFrame:
+    """
+    Fail if a shard read back does not have the rows its manifest lists.
+    """
+    if shard.get("rows") is not None and len(df) != shard["rows"]:
+        raise ValueError(
+            f"Object {key} has {len(df)} rows, its manifest lists {shard['rows']}"
+        )
+    return df
@@ -0,0 +1,43 @@
+import io
+from typing import BinaryIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def write_parquet(
+    df: pd.DataFrame,
+    row_group_size: int | None = None,
+    compression: str = "zstd",
+    compression_level: int | None = None,
+) -> bytes:
+    """
+    Serialize a dataframe to parquet. Smaller row groups make predicate
+    pushdown more selective at the cost of a larger footer.
+    """
+    sink = io.BytesIO()
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False),
+        sink,
+        row_group_size=row_group_size,
+        compression=compression,
+        compression_level=compression_level,
+    )
+    return sink.getvalue()
+
+
+def read_parquet(
+    source: BinaryIO,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+) -> pd.DataFrame:
+    """
+    Read a parquet file from a seekable file object. Only the requested
+    columns are decoded, and row groups whose statistics cannot match the
+    filters (in pyarrow's DNF format, e.g. [("country", "=", "ES")]) are
+    skipped without being read.
+    """
+    return pq.read_table(
+        source, columns=columns, filters=filters, pre_buffer=True
+    ).to_pandas()
@@ -0,0 +1,598 @@
+from collections.abc import Awaitable, Callable, Container, Iterable
+from datetime import date, datetime
+import logging
+import numbers
+import operator
+import re
+from typing import Any
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+from shimoku_tangram.storage.manifest import is_metadata, list_shards, manifest_key
+from shimoku_tangram.storage.sharding import (
+    get_objects_threaded,
+    get_shards_threaded,
+    list_folder_shards,
+)
+from shimoku_tangram.storage.tasks import run_threaded
+
+# Object under a dataset prefix that maps its date partitions to their shards
+INDEX_NAME = "_partitions.json.gz"
+INDEX_VERSION = 1
+# Conditional writes of an index retried against concurrent writers
+INDEX_UPDATE_ATTEMPTS = 10
+
+# Date segments, so ids or versions such as models/1234/ are not taken for one
+_YEAR = r"(?:19|20)\d{2}"
+_MONTH = r"(?:0[1-9]|1[0-2])"
+_DAY = r"(?:0[1-9]|[12]\d|3[01])"
+_PARTITION_RE = re.compile(rf"({_YEAR})/({_MONTH})/({_DAY})/")
+# A year, a month or a day of a dataset, or anything under a day
+_DATASET_RE = re.compile(rf"(.+?)/{_YEAR}(?:/{_MONTH}(?:/{_DAY}(?:/.*)?)?)?/?")
+_DAY_PREFIX_RE = re.compile(rf"(.+)/({_YEAR}/{_MONTH}/{_DAY})/?")
+
+# Hive path segment of the rows whose partition column is missing
+HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+_OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def index_key(prefix: str) -> str:
+    return f"{prefix}/{INDEX_NAME}"
+
+
+def partition_of(prefix: str, key: str) -> str | None:
+    """
+    Return the YYYY/MM/DD partition of a key of the form
+    <prefix>/<YYYY>/<MM>/<DD>/<filename>, or None if it is not in one.
+    """
+    if not key.startswith(f"{prefix}/"):
+        return None
+    match = _PARTITION_RE.match(key, len(prefix) + 1)
+    if match is None:
+        return None
+    return "/".join(match.groups())
+
+
+def partition_of_prefix(index_prefix: str, prefix: str) -> str:
+    """
+    Return the partition a writer prefix stands for, which must be exactly
+    <index_prefix>/<YYYY>/<MM>/<DD>.
+    """
+    prefix = prefix.rstrip("/")
+    partition = partition_of(index_prefix, f"{prefix}/")
+    if partition is None or prefix != f"{index_prefix}/{partition}":
+        raise ValueError(f"{prefix} is not a YYYY/MM/DD partition of {index_prefix}")
+    return partition
+
+
+def split_partition_prefix(prefix: str) -> tuple[str, str] | None:
+    """
+    Split a prefix of the form <index_prefix>/<YYYY>/<MM>/<DD> into its
+    dataset prefix and its partition, or return None if it is not one.
+    """
+    match = _DAY_PREFIX_RE.fullmatch(prefix)
+    return None if match is None else (match[1], match[2])
+
+
+def dataset_of(prefix: str) -> str | None:
+    """
+    Return the dataset prefix whose index may list the keys under a prefix
+    of the form <dataset>/<YYYY>[/<MM>[/<DD>[/...]]], or None if the prefix
+    has no date in it.
+    """
+    match = _DATASET_RE.fullmatch(prefix)
+    return None if match is None else match[1]
+
+
+def new_index() -> dict:
+    return {"version": INDEX_VERSION, "partitions": {}, "columns": {}}
+
+
+def set_partition(
+    index: dict,
+    partition: str,
+    entries: list[dict],
+    columns: list[dict] | None = None,
+) -> None:
+    """
+    Replace the shards of a partition. Every entry has the key of a shard and,
+    when known, its size in bytes and its number of rows. The columns of the
+    manifest of the partition, if it has one, are kept with them so readers
+    need not fetch it.
+    """
+    index_columns = index.setdefault("columns", {})
+    if entries:
+        index["partitions"][partition] = entries
+    else:
+        index["partitions"].pop(partition, None)
+    if entries and columns is not None:
+        index_columns[partition] = columns
+    else:
+        index_columns.pop(partition, None)
+
+
+def shard_entries(shards: list[dict]) -> list[dict]:
+    """
+    Index entries of the shards written to a partition.
+    """
+    return [
+        {"key": shard["key"], "size": shard["size"], "rows": shard["rows"]}
+        for shard in shards
+    ]
+
+
+def clear_partitions(index: dict, prefix: str, kept: Container[str]) -> None:
+    """
+    Drop the shards whose key starts with prefix, the ones just deleted,
+    but the kept keys, the ones that could not be.
+    """
+    for partition, entries in list(index["partitions"].items()):
+        kept_entries = [
+            entry
+            for entry in entries
+            if not entry["key"].startswith(prefix) or entry["key"] in kept
+        ]
+        if kept_entries:
+            # The columns of the partition still describe the kept shards
+            index["partitions"][partition] = kept_entries
+        else:
+            set_partition(index, partition, [])
+
+
+def record_shards(
+    partition: str, shards: list[dict], columns: list[dict] | None = None
+) -> Callable[[dict], dict]:
+    """
+    Index change, for modify_index, recording the shards written to a
+    partition and the columns of their manifest.
+    """
+
+    def _record(index: dict) -> dict:
+        set_partition(index, partition, shard_entries(shards), columns)
+        return index
+
+    return _record
+
+
+def drop_cleared(prefix: str, kept: Container[str]) -> Callable[[dict], dict]:
+    """
+    Index change, for modify_index, dropping the shards cleared under a
+    prefix but the kept keys (see clear_partitions).
+    """
+
+    def _drop(index: dict) -> dict:
+        clear_partitions(index, prefix, kept)
+        return index
+
+    return _drop
+
+
+def modify_index(
+    prefix: str,
+    modify: Callable[[dict], dict],
+    get_index: Callable[[str], tuple[dict | None, Any]],
+    put_index: Callable[[str, dict, Any], bool],
+    create: bool,
+    current: tuple[dict | None, Any] | None = None,
+) -> dict | None:
+    """
+    Store modify(index) as the partition index of a dataset prefix. The
+    index is read with get_index(prefix), along with its version (ETag,
+    generation, ...), and written with put_index(prefix, index, version),
+    which only writes over that version and returns False when another
+    writer changed it first, in which case it is read again and retried.
+    current, the index and version the caller has just read, saves the first
+    read. Without create, a prefix with no index is left without one.
+    Returns the index stored, if any.
+    """
+    for _ in range(INDEX_UPDATE_ATTEMPTS):
+        if current is None:
+            current = get_index(prefix)
+        index, version = current
+        current = None
+        if index is None and not create:
+            return None
+        index = modify(index or new_index())
+        if put_index(prefix, index, version):
+            return index
+    raise OSError(f"Concurrent updates of the partition index of {prefix}")
+
+
+async def modify_index_async(
+    prefix: str,
+    modify: Callable[[dict], dict],
+    get_index: Callable[[str], Awaitable[tuple[dict | None, Any]]],
+    put_index: Callable[[str, dict, Any], Awaitable[bool]],
+    create: bool,
+) -> dict | None:
+    """
+    Async counterpart of modify_index, with get_index and put_index
+    coroutines.
+    """
+    for _ in range(INDEX_UPDATE_ATTEMPTS):
+        index, version = await get_index(prefix)
+        if index is None and not create:
+            return None
+        index = modify(index or new_index())
+        if await put_index(prefix, index, version):
+            return index
+    raise OSError(f"Concurrent updates of the partition index of {prefix}")
+
+
+def build_index(
+    prefix: str,
+    objects: Iterable[dict],
+    get_manifest: Callable[[str], dict | None] | None = None,
+) -> dict:
+    """
+    Build an index from the listing of a dataset prefix, as {"Key", "Size"}
+    dicts. Row counts are unknown to a listing, so they are left as None,
+    but for the partitions listed with a manifest, whose shards are taken
+    from get_manifest(partition prefix) on a thread pool.
+    """
+    index = new_index()
+    listed = {}
+    for obj in objects:
+        partition = partition_of(prefix, obj["Key"])
+        if partition is None or obj["Key"].endswith("/"):
+            continue
+        listed.setdefault(partition, []).append(obj)
+
+    def _entries(partition: str) -> tuple[list[dict], list[dict] | None]:
+        folder = f"{prefix}/{partition}"
+        keys = [obj["Key"] for obj in listed[partition]]
+        manifest = None
+        if get_manifest is not None and manifest_key(folder) in keys:
+            manifest = get_manifest(folder)
+        if manifest is None:
+            return [
+                {"key": obj["Key"], "size": obj["Size"], "rows": None}
+                for obj in listed[partition]
+                if not is_metadata(obj["Key"])
+            ], None
+        # Fails like a read would if a shard of the manifest is missing
+        list_shards(folder, keys, manifest)
+        return shard_entries(manifest["shards"]), manifest["columns"]
+
+    partitions = list(listed)
+    for partition, (entries, columns) in zip(
+        partitions, run_threaded(_entries, partitions), strict=True
+    ):
+        set_partition(index, partition, entries, columns)
+    return index
+
+
+def shards_between_dates(
+    index: dict, start_date: datetime, end_date: datetime
+) -> list[tuple[str, dict | None]]:
+    """
+    Shards of the partitions from start_date to end_date, both included, in
+    partition order, like manifest.list_shards: each key with its entry and
+    the manifest columns of its partition, or None when it has none.
+    """
+    start = start_date.strftime("%Y/%m/%d")
+    end = end_date.strftime("%Y/%m/%d")
+    index_columns = index.get("columns", {})
+    return [
+        (
+            entry["key"],
+            None
+            if partition not in index_columns
+            else {**entry, "columns": index_columns[partition]},
+        )
+        for partition, entries in sorted(index["partitions"].items())
+        if start <= partition <= end
+        for entry in entries
+    ]
+
+
+def keys_between_dates(
+    index: dict, start_date: datetime, end_date: datetime
+) -> list[str]:
+    """
+    Keys of the partitions from start_date to end_date, both included, in
+    partition order.
+    """
+    return [key for key, _ in shards_between_dates(index, start_date, end_date)]
+
+
+def _format_value(value) -> str:
+    if pd.isna(value):
+        return HIVE_NULL
+    if isinstance(value, date):
+        value = value.isoformat()
+    return quote(str(value), safe="")
+
+
+def partition_groups(
+    body: pd.DataFrame,
+    partition_cols: list[str] | None = None,
+    date_col: str | None = None,
+) -> dict[str, np.ndarray]:
+    """
+    Group the rows of a dataframe by partition. Returns the positions of the
+    rows of every partition by its path: <YYYY>/<MM>/<DD> from date_col
+    first, then a <col>=<value> segment per partition column, with the
+    values url-quoted and missing ones as __HIVE_DEFAULT_PARTITION__.
+    """
+    partition_cols = list(partition_cols or [])
+    if date_col is None and not partition_cols:
+        raise ValueError("No partition columns given")
+
+    groupers = [body[col] for col in partition_cols]
+    if date_col is not None:
+        dates = pd.to_datetime(body[date_col])
+        if dates.isna().any():
+            raise ValueError(f"Column {date_col} has missing dates")
+        groupers.insert(0, dates.dt.normalize())
+
+    paths = {}
+    for values, positions in body.groupby(
+        groupers, dropna=False, sort=True
+    ).indices.items():
+        values = values if isinstance(values, tuple) else (values,)
+        segments = []
+        if date_col is not None:
+            segments.append(values[0].strftime("%Y/%m/%d"))
+            values = values[1:]
+        segments.extend(
+            f"{col}={_format_value(value)}"
+            for col, value in zip(partition_cols, values, strict=True)
+        )
+        paths["/".join(segments)] = positions
+    return paths
+
+
+def partition_values(prefix: str, key: str) -> dict[str, str | None]:
+    """
+    Parse the <col>=<value> segments of a key under prefix. Missing values
+    come back as None.
+    """
+    values = {}
+    for segment in key[len(prefix) :].strip("/").split("/")[:-1]:
+        column, sep, value = segment.partition("=")
+        if sep:
+            values[column] = None if value == HIVE_NULL else unquote(value)
+    return values
+
+
+def _disjunction(
+    filters: list[tuple] | list[list[tuple]],
+) -> list[list[tuple]]:
+    return [filters] if isinstance(filters[0], tuple) else filters
+
+
+def _cast(text: str, value) -> tuple | None:
+    """
+    Bring a partition value and a filter value to comparable types, based
+    on the type of the filter value. None if the partition value can't be.
+    """
+    try:
+        if isinstance(value, bool):
+            return text == "True", value
+        if isinstance(value, numbers.Number):
+            return float(text), value
+        if isinstance(value, date):
+            return pd.Timestamp(text), pd.Timestamp(value)
+    except ValueError:
+        return None
+    return text, str(value)
+
+
+def _match_predicate(values: dict[str, str | None], predicate: tuple) -> bool:
+    column, op, value = predicate
+    if op not in _OPERATORS and op not in ("in", "not in"):
+        raise ValueError(f"Unknown filter operator: {op}")
+    # Predicates on data columns can only be checked once the rows are read
+    if column not in values:
+        return True
+    text = values[column]
+    if text is None:
+        return op in ("!=", "not in")
+
+    if op in ("in", "not in"):
+        pairs = [_cast(text, item) for item in value]
+        if any(pair is None for pair in pairs):
+            return True
+        found = any(left == right for left, right in pairs)
+        return found if op == "in" else not found
+
+    pair = _cast(text, value)
+    return pair is None or _OPERATORS[op](*pair)
+
+
+def match_partition(
+    values: dict[str, str | None],
+    filters: list[tuple] | list[list[tuple]] | None,
+) -> bool:
+    """
+    Whether a partition may hold rows matching filters, given in the
+    disjunctive normal form of read_parquet: a list of (column, op, value)
+    predicates that must all hold, or a list of such lists of which any
+    must hold. Predicates on columns that are not partition columns are
+    assumed to hold.
+    """
+    if not filters:
+        return True
+    return any(
+        all(_match_predicate(values, predicate) for predicate in conjunction)
+        for conjunction in _disjunction(filters)
+    )
+
+
+def filter_rows(
+    body: pd.DataFrame, filters: list[tuple] | list[list[tuple]] | None
+) -> pd.DataFrame:
+    """
+    Keep the rows of a dataframe that match filters (see match_partition).
+    """
+    if not filters:
+        return body
+    mask = pd.Series(False, index=body.index)
+    for conjunction in _disjunction(filters):
+        conjunction_mask = pd.Series(True, index=body.index)
+        for column, op, value in conjunction:
+            if op == "in":
+                conjunction_mask &= body[column].isin(value)
+            elif op == "not in":
+                conjunction_mask &= ~body[column].isin(value)
+            elif op in _OPERATORS:
+                conjunction_mask &= _OPERATORS[op](body[column], value)
+            else:
+                raise ValueError(f"Unknown filter operator: {op}")
+        mask |= conjunction_mask
+    return body[mask].reset_index(drop=True)
+
+
+def write_partitions(
+    prefix: str,
+    body: pd.DataFrame,
+    put: Callable[[str, pd.DataFrame, str | None], list[str]],
+    partition_cols: list[str] | None = None,
+    date_col: str | None = None,
+    max_workers: int = 4,
+    retries: int = 0,
+    index: bool = False,
+) -> dict[str, list[str]]:
+    """
+    Split a dataframe by partition (see partition_groups) and write every
+    partition with put(folder, rows, index_prefix), up to max_workers
+    partitions at once. With index, which needs date_col and no
+    partition_cols, index_prefix is prefix. Returns the keys written for
+    every partition folder.
+    """
+    if index and (date_col is None or partition_cols):
+        raise ValueError("index needs date_col and no partition_cols")
+
+    groups = partition_groups(body, partition_cols, date_col)
+
+    def _put(path: str) -> list[str]:
+        # The trailing slash keeps clear_path from matching sibling values
+        return put(
+            f"{prefix}/{path}/", body.take(groups[path]), prefix if index else None
+        )
+
+    paths = list(groups)
+    keys = run_threaded(_put, paths, max_workers, retries)
+    return {
+        f"{prefix}/{path}": path_keys
+        for path, path_keys in zip(paths, keys, strict=True)
+    }
+
+
+def list_shards_between_dates(
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    get_index: Callable[[str], dict | None],
+    list_day_keys: Callable[[str, datetime, datetime], list[str]],
+    get_manifest: Callable[[str], dict | None],
+    match: Callable[[str], bool] | None = None,
+    retries: int = 0,
+) -> list[tuple[str, dict | None]]:
+    """
+    Shards of the days of a dataset from start_date to end_date, both
+    included, like in manifest.list_shards: from its index get_index(prefix)
+    with a single GET when it has one, else from the listing
+    list_day_keys(prefix, start_date, end_date) and the manifests of the
+    listed days (see sharding.list_folder_shards). Keys for which match(key)
+    is False are left out before any manifest is fetched.
+    """
+    index = get_index(prefix)
+    if index is not None:
+        shards = shards_between_dates(index, start_date, end_date)
+        return [shard for shard in shards if match is None or match(shard[0])]
+    list_keys = list_day_keys(prefix, start_date, end_date)
+    if match is not None:
+        list_keys = [key for key in list_keys if match(key)]
+    return list_folder_shards(list_keys, get_manifest, retries)
+
+
+def _no_manifest(folder: str) -> None:
+    return None
+
+
+def read_partitions(
+    prefix: str,
+    iter_keys: Callable[[str], Iterable[str]],
+    get_index: Callable[[str], dict | None],
+    list_day_keys: Callable[[str, datetime, datetime], list[str]],
+    get_manifest: Callable[[str], dict | None],
+    read_csv: Callable[[str, dict | None, list[str] | None], pd.DataFrame],
+    read_parquet: Callable[[str, list[str] | None, list | None], pd.DataFrame],
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    file_format: str = "csv",
+    columns: list[str] | None = None,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    Read the partitions of a dataset that can match filters. Shards come
+    from list_shards_between_dates when given dates, else from the keys of
+    iter_keys(f"{prefix}/") like in sharding.list_folder_shards, pruned by
+    their <col>=<value> segments (see match_partition). Parquet objects are
+    read with read_parquet(key, columns, filters). CSV shards are read with
+    read_csv(key, manifest entry, usecols), with the entries of the
+    get_manifest(folder) of their partition so values such as "01" keep
+    their dtype, then filtered row by row. Results are concatenated like in
+    sharding.get_objects_threaded.
+    """
+    if file_format not in ("csv", "parquet"):
+        raise ValueError(f"Unknown file format: {file_format}")
+
+    # Parquet files carry their own schema, so their manifests are not needed
+    if file_format == "parquet":
+        get_manifest = _no_manifest
+
+    def _match(key: str) -> bool:
+        return match_partition(partition_values(prefix, key), filters)
+
+    if start_date is not None or end_date is not None:
+        if start_date is None or end_date is None:
+            raise ValueError("start_date and end_date must be given together")
+        shards = list_shards_between_dates(
+            prefix,
+            start_date,
+            end_date,
+            get_index,
+            list_day_keys,
+            get_manifest,
+            _match,
+            retries,
+        )
+    else:
+        list_keys = [key for key in iter_keys(f"{prefix}/") if _match(key)]
+        shards = list_folder_shards(list_keys, get_manifest, retries)
+    if len(shards) == 0:
+        raise ValueError(f"No partitions at {prefix} match the filters")
+
+    if file_format == "parquet":
+        return get_objects_threaded(
+            [key for key, _ in shards],
+            lambda key: read_parquet(key, columns, filters),
+            logger,
+            retries,
+            assembly,
+        )
+
+    def _read(key: str, shard: dict | None) -> pd.DataFrame:
+        if not filters:
+            return read_csv(key, shard, columns)
+        df = filter_rows(read_csv(key, shard, None), filters)
+        return df if columns is None else df[columns]
+
+    return get_shards_threaded(shards, _read, logger, retries, assembly)
@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from shimoku_tangram.storage.compression import Codec, compress_csv
+from shimoku_tangram.storage.csv_shards import parse_csv_shard
+
+# Workers are spawned rather than forked, since the parent process runs
+# client and transfer threads whose locks a fork would copy mid-use
+START_METHOD = "spawn"
+EXECUTORS = ("thread", "process")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_max_workers: int | None = None
+
+
+def configure_process_pool(max_workers: int | None = None) -> None:
+    """
+    Set the size of the process pool shared by the helpers called with
+    executor="process" (by default the CPU count). The current pool, if any,
+    is shut down once its pending work is done.
+    """
+    global _pool, _max_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _max_workers = max_workers
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                _max_workers or os.cpu_count(),
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+        return _pool
+
+
+def _run_in_pool(func, *args):
+    """
+    Run a function in the process pool and wait for its result. A pool
+    broken by a dead worker is dropped, so that the next call starts a new
+    one, and the error is raised.
+    """
+    global _pool
+    pool = get_process_pool()
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool.shutdown(wait=False)
+                _pool = None
+        raise
+
+
+def check_executor(executor: str) -> None:
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}")
+
+
+def to_ipc(df: pd.DataFrame) -> pa.Buffer:
+    """
+    Serialize a dataframe as an Arrow IPC stream. The pandas metadata it
+    carries restores the column dtypes in from_ipc.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc(data: pa.Buffer | bytes, dtype_backend: str | None = None) -> pd.DataFrame:
+    table = pa.ipc.open_stream(data).read_all()
+    if dtype_backend == "pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas()
+
+
+def _parse_csv(
+    body: bytes,
+    key: str,
+    shard: dict | None,
+    compressed: bool,
+    engine: str,
+    dtype_backend: str | None,
+    usecols: list[str] | None,
+    dtype: dict | None,
+) -> pa.Buffer:
+    df = parse_csv_shard(
+        body, key, shard, compressed, engine, dtype_backend, usecols, dtype
+    )
+    return to_ipc(df)
+
+
+def parse_csv(
+    body: bytes,
+    key: str,
+    shard: dict | None,
+    compressed: bool,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Decompress and parse a downloaded csv shard in the process pool, like
+    csv_shards.parse_csv_shard. The compressed body goes to the worker and the
+    parsed columns come back as one Arrow IPC buffer instead of a pickled
+    dataframe.
+    """
+    data = _run_in_pool(
+        _parse_csv, body, key, shard, compressed, engine, dtype_backend, usecols, dtype
+    )
+    return from_ipc(data, dtype_backend)
+
+
+def _serialize_csv(data: pa.Buffer, codec: Codec) -> bytes:
+    return compress_csv(from_ipc(data), codec)
+
+
+def serialize_csv(df: pd.DataFrame, codec: Codec) -> bytes:
+    """
+    Compressed CSV of a dataframe, as compression.compress_csv, serialized
+    in the process pool. The dataframe goes to the worker as an Arrow IPC
+    buffer, so its columns must be convertible to Arrow.
+    """
+    return _run_in_pool(_serialize_csv, to_ipc(df), codec)
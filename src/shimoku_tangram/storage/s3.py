@@ -1,26 +1,249 @@
-from gzip import compress as compress_f, decompress
-import io
+import hashlib
 import json
 import os
 import logging
 from pathlib import Path
 import pickle
 import uuid
+from collections.abc import Callable, Iterable, Iterator
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
-import csv
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+import io
+import threading
+from typing import BinaryIO
 
 from boto3 import client
+from botocore.client import BaseClient
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import pandas as pd
 
 from shimoku_tangram.reporting.logging import init_logger
+from shimoku_tangram.storage.cache import DiskCache, MemoryCache
+from shimoku_tangram.storage.compression import (
+    Codec,
+    codec_of_key,
+    compress_blocks,
+    compress_csv,
+    get_codec,
+    iter_compressed_csv,
+    resolve_codec,
+)
+from shimoku_tangram.storage.csv_shards import read_csv_shard
+from shimoku_tangram.storage.manifest import (
+    check_rows,
+    hash_parts,
+    is_metadata,
+    list_shards,
+    manifest_key,
+)
+from shimoku_tangram.storage.parquet import read_parquet, write_parquet
+from shimoku_tangram.storage.processes import check_executor, parse_csv, serialize_csv
+from shimoku_tangram.storage.partitions import (
+    build_index,
+    dataset_of,
+    drop_cleared,
+    index_key,
+    keys_between_dates,
+    list_shards_between_dates,
+    modify_index,
+    partition_of_prefix,
+    read_partitions,
+    record_shards,
+    split_partition_prefix,
+    write_partitions,
+)
+from shimoku_tangram.storage.sharding import (
+    commit_shards,
+    estimate_bytes_per_row,
+    get_multiple_objects_threaded,
+    get_shards_threaded,
+    plan_shard_rows,
+    put_shards,
+    rechunk,
+)
+from shimoku_tangram.storage.tasks import batched, iter_threaded, run_threaded
 
 
 logger = init_logger(__name__)
 
+# DeleteObjects accepts at most 1,000 keys per request
+DELETE_BATCH_SIZE = 1000
+# Multipart uploads need parts of at least 5 MB and at most 10,000 parts
+MULTIPART_MIN_PART_SIZE = 5 * 1024**2
+MULTIPART_MAX_PARTS = 10000
+
+_clients: dict[str | None, BaseClient] = {}
+_clients_lock = threading.Lock()
+_index_locks: dict[tuple[str, str], threading.Lock] = {}
+_index_locks_lock = threading.Lock()
+_client_config = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+)
+
+
+def configure_client(
+    max_pool_connections: int = 50,
+    tcp_keepalive: bool = True,
+    max_attempts: int = 5,
+    retry_mode: str = "adaptive",
+) -> None:
+    """
+    Set the connection pool, keep-alive and retry configuration used by the
+    shared S3 clients. Clients already created are dropped so the next call
+    builds them with the new configuration.
+    """
+    global _client_config
+    with _clients_lock:
+        _client_config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=tcp_keepalive,
+            retries={"max_attempts": max_attempts, "mode": retry_mode},
+        )
+        _clients.clear()
+
+
+def get_client(region_name: str | None = None) -> BaseClient:
+    """
+    Return the shared S3 client for a region, creating it on first use.
+    Clients are thread safe once built, but building them from the default
+    boto3 session is not, so creation is done under a lock.
+    """
+    s3 = _clients.get(region_name)
+    if s3 is None:
+        with _clients_lock:
+            s3 = _clients.get(region_name)
+            if s3 is None:
+                s3 = client("s3", region_name=region_name, config=_client_config)
+                _clients[region_name] = s3
+    return s3
+
+
+def reset_clients() -> None:
+    """
+    Drop every shared S3 client, mainly for tests that patch boto3.
+    """
+    with _clients_lock:
+        _clients.clear()
+
+
+_multipart_threshold = 64 * 1024**2
+_multipart_part_size = 16 * 1024**2
+_ranged_get_threshold = 64 * 1024**2
+_ranged_get_size = 16 * 1024**2
+_transfer_max_workers = 8
+_part_attempts = 3
+_part_executor: ThreadPoolExecutor | None = None
+_part_executor_lock = threading.Lock()
+
+
+def configure_transfer(
+    multipart_threshold_mb: float = 64,
+    multipart_part_size_mb: float = 16,
+    ranged_get_threshold_mb: float = 64,
+    ranged_get_size_mb: float = 16,
+    max_workers: int = 8,
+    part_attempts: int = 3,
+) -> None:
+    """
+    Set how large payloads are transferred. Bodies of at least
+    multipart_threshold_mb (after compression) are uploaded as a multipart
+    upload of multipart_part_size_mb parts. Ranged reads of objects of at
+    least ranged_get_threshold_mb are downloaded as ranged_get_size_mb byte
+    ranges. Both use max_workers threads and try each part or range up to
+    part_attempts times.
+    """
+    global _multipart_threshold, _multipart_part_size
+    global _ranged_get_threshold, _ranged_get_size
+    global _transfer_max_workers, _part_attempts
+    _multipart_threshold = int(multipart_threshold_mb * 1024**2)
+    _multipart_part_size = max(
+        int(multipart_part_size_mb * 1024**2), MULTIPART_MIN_PART_SIZE
+    )
+    _ranged_get_threshold = int(ranged_get_threshold_mb * 1024**2)
+    _ranged_get_size = int(ranged_get_size_mb * 1024**2)
+    _transfer_max_workers = max_workers
+    _part_attempts = part_attempts
+    _reset_part_executor()
+
+
+def _get_part_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool shared by the parts of every multipart upload, so
+    shards written in parallel do not each start a pool of their own.
+    """
+    global _part_executor
+    with _part_executor_lock:
+        if _part_executor is None:
+            _part_executor = ThreadPoolExecutor(
+                _transfer_max_workers, thread_name_prefix="s3-part"
+            )
+        return _part_executor
+
+
+def _reset_part_executor() -> None:
+    """
+    Drop the shared part pool so the next upload starts one of the configured
+    size. Parts already queued in the old pool still run.
+    """
+    global _part_executor
+    with _part_executor_lock:
+        if _part_executor is not None:
+            _part_executor.shutdown(wait=False)
+        _part_executor = None
+
+
+_cache: DiskCache | None = None
+
+
+def configure_cache(directory: str | None, max_size_mb: float = 1024) -> None:
+    """
+    Cache the bodies read by get_object in a local directory, capped at
+    max_size_mb with least recently used eviction, or stop caching with None.
+    Cached objects are revalidated with a GET conditional on their ETag, so
+    an unchanged object costs one round-trip and no body transfer.
+    """
+    global _cache
+    _cache = DiskCache(directory, max_size_mb) if directory is not None else None
+
+
+_memory_cache: MemoryCache | None = None
+
+
+def configure_memory_cache(
+    max_size_mb: float | None = 64, ttl_seconds: float = 300
+) -> None:
+    """
+    Keep the bodies read by the text, json and pickle getters in memory, up
+    to max_size_mb in total and for ttl_seconds each, or stop caching with
+    None. Bodies larger than the cache are not kept. The single-object
+    getters also remember the key found under their prefix. Writes and
+    deletes made through this module invalidate the affected entries, and
+    every call parses the cached bytes again, so callers get their own copy.
+    """
+    global _memory_cache
+    _memory_cache = (
+        MemoryCache(max_size_mb, ttl_seconds) if max_size_mb is not None else None
+    )
+
+
+def invalidate_cache(bucket: str, keys: Iterable[str]) -> None:
+    """
+    Drop the memory cache entries of keys written or deleted by other means,
+    e.g. the async module, so the getters of this module read them again.
+    """
+    if _memory_cache is None:
+        return
+    for key in keys:
+        _memory_cache.invalidate(f"object:{bucket}/{key}")
+    _memory_cache.invalidate_prefix(f"single:{bucket}/")
+
 
 def bucket_exists(bucket: str) -> bool:
-    s3 = client("s3")
+    s3 = get_client()
     try:
         s3.head_bucket(Bucket=bucket)
         return True
@@ -28,16 +251,33 @@ def bucket_exists(bucket: str) -> bool:
         return False
 
 
+def iter_objects_metadata(bucket: str, prefix: str = "") -> Iterator[dict]:
+    """
+    Yield the metadata of every object under a prefix. Pages of the listing
+    are requested lazily, only once the previous page has been consumed.
+    """
+    s3 = get_client()
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        if "Contents" in response:
+            yield from response["Contents"]
+        if "NextContinuationToken" not in response:
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def iter_objects_key(bucket: str, prefix: str = "") -> Iterator[str]:
+    for obj in iter_objects_metadata(bucket, prefix):
+        yield obj["Key"]
+
+
 def list_objects_metadata(bucket: str, prefix: str = "") -> list:
-    s3 = client("s3")
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    if "Contents" not in response:
-        return []
-    return response["Contents"]
+    return list(iter_objects_metadata(bucket, prefix))
 
 
 def list_objects_key(bucket: str, prefix: str = "") -> list:
-    return [obj["Key"] for obj in list_objects_metadata(bucket, prefix)]
+    return list(iter_objects_key(bucket, prefix))
 
 
 def list_objects_key_between_dates(
@@ -47,7 +287,19 @@ def list_objects_key_between_dates(
     List all objects keys between two dates.
     The date is extracted from the object key, which has the following format:
     <prefix>/<YYYY>/<MM>/<DD>/<filename>
+    When the prefix has a partition index (see build_partition_index) the
+    keys are read from it with a single GET instead of listing every day.
     """
+    index = get_partition_index(bucket, prefix)
+    if index is not None:
+        return keys_between_dates(index, start_date, end_date)
+    return _list_objects_key_by_day(bucket, prefix, start_date, end_date)
+
+
+def _list_objects_key_by_day(
+    bucket: str, prefix: str, start_date: datetime, end_date: datetime
+) -> list[str]:
+    # A listing per day, merged into a listing per month or year when whole
     end_date = end_date + timedelta(days=1)
     file_prefixes = []
     for x in range(0, (end_date - start_date).days):
@@ -89,6 +341,142 @@ def list_objects_key_between_dates(
     return file_keys
 
 
+def _get_json_object_or_none(
+    bucket: str, key: str, compressed: bool = True
+) -> dict | None:
+    try:
+        return get_json_object(bucket, key, compressed=compressed)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            raise
+        return None
+
+
+def _get_partition_index(bucket: str, prefix: str) -> tuple[dict | None, str | None]:
+    # Around the caches, which could hand a writer an outdated index
+    key = index_key(prefix)
+    try:
+        response = get_client().get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            raise
+        return None, None
+    body = resolve_codec(key).decompress(response["Body"].read())
+    return json.loads(body), response.get("ETag")
+
+
+def get_partition_index(bucket: str, prefix: str) -> dict | None:
+    """
+    Return the partition index of a dataset prefix, or None if it has none.
+    """
+    return _get_partition_index(bucket, prefix)[0]
+
+
+def get_manifest(bucket: str, prefix: str) -> dict | None:
+    """
+    Return the manifest written with the shards of a prefix, or None if it
+    has none.
+    """
+    return _get_json_object_or_none(bucket, manifest_key(prefix), compressed=False)
+
+
+def _put_partition_index(
+    bucket: str, prefix: str, index: dict, etag: str | None
+) -> bool:
+    # Only over the version read (or where there was none), so an index
+    # written meanwhile by another process is not overwritten
+    key = index_key(prefix)
+    condition = {"IfNoneMatch": "*"} if etag is None else {"IfMatch": etag}
+    body = resolve_codec(key).compress(json.dumps(index).encode("utf-8"))
+    try:
+        get_client().put_object(Bucket=bucket, Key=key, Body=body, **condition)
+    except ClientError as e:
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status not in (409, 412):
+            raise
+        return False
+    finally:
+        invalidate_cache(bucket, [key])
+    return True
+
+
+def _partition_index_lock(bucket: str, prefix: str) -> threading.Lock:
+    # One per index, so writers of different datasets do not wait on each other
+    with _index_locks_lock:
+        return _index_locks.setdefault((bucket, index_key(prefix)), threading.Lock())
+
+
+def _modify_partition_index(
+    bucket: str,
+    prefix: str,
+    modify: Callable[[dict], dict],
+    create: bool,
+    current: tuple[dict | None, str | None] | None = None,
+) -> dict | None:
+    """
+    Store modify(index) as the partition index of a dataset prefix with a
+    conditional put, reading the index again and retrying when another
+    writer changed it first. current, the index and ETag the caller has
+    just read, saves the first read. Without create, a prefix with no index
+    is left without one. Returns the index stored, if any.
+    """
+    # Writers of this process wait for each other instead of retrying
+    with _partition_index_lock(bucket, prefix):
+        return modify_index(
+            prefix,
+            modify,
+            partial(_get_partition_index, bucket),
+            partial(_put_partition_index, bucket),
+            create,
+            current,
+        )
+
+
+def build_partition_index(bucket: str, prefix: str) -> dict:
+    """
+    List a dataset prefix once and store the index of its
+    <prefix>/<YYYY>/<MM>/<DD>/ partitions, with the shards and columns of
+    their manifests, so date range reads skip listing and manifests.
+    Writers of its partitions and clear_path keep it up to date afterwards.
+    """
+    return _modify_partition_index(
+        bucket,
+        prefix,
+        lambda _: build_index(
+            prefix,
+            iter_objects_metadata(bucket, f"{prefix}/"),
+            partial(get_manifest, bucket),
+        ),
+        create=True,
+    )
+
+
+def _update_partition_index(
+    bucket: str,
+    index_prefix: str | None,
+    prefix: str,
+    shards: list[dict],
+    columns: list[dict] | None = None,
+) -> None:
+    """
+    Record the shards written to a partition prefix, and the columns of its
+    manifest if it has one, in the index of index_prefix, or, without one,
+    in the index of the dataset the prefix is a <YYYY>/<MM>/<DD> partition
+    of, when that dataset has an index.
+    """
+    create = index_prefix is not None
+    if create:
+        partition = partition_of_prefix(index_prefix, prefix)
+    elif (split := split_partition_prefix(prefix)) is not None:
+        index_prefix, partition = split
+    else:
+        return
+
+    _modify_partition_index(
+        bucket, index_prefix, record_shards(partition, shards, columns), create
+    )
+
+
 def list_single_object_key(bucket: str, prefix: str) -> str:
     """
     Retrieve the single file key from an S3 bucket given a folder.
@@ -114,16 +502,11 @@ def list_multiple_objects_keys(bucket: str, prefix: str) -> list[str]:
     Uses pagination to handle large numbers of objects.
     Fails if no files are found.
     """
-    s3 = client("s3")
-    paginator = s3.get_paginator("list_objects_v2")
-
-    list_keys = []
-
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        if "Contents" in page:
-            for obj in page["Contents"]:
-                if not obj["Key"].endswith("/"):
-                    list_keys.append(obj["Key"])
+    list_keys = [
+        key
+        for key in iter_objects_key(bucket, prefix)
+        if not key.endswith("/") and not is_metadata(key)
+    ]
 
     if len(list_keys) == 0:
         raise ValueError(f"No files found in prefix: {prefix}")
@@ -131,66 +514,507 @@ def list_multiple_objects_keys(bucket: str, prefix: str) -> list[str]:
     return list_keys
 
 
+def _delete_batch(bucket: str, keys: list[str]) -> dict[str, str]:
+    s3 = get_client()
+    try:
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+    except Exception as e:
+        return {key: str(e) for key in keys}
+    finally:
+        invalidate_cache(bucket, keys)
+    if "Errors" not in response:
+        return {}
+    return {
+        error["Key"]: f"{error.get('Code')}: {error.get('Message')}"
+        for error in response["Errors"]
+    }
+
+
+def delete_objects(
+    bucket: str, keys: Iterable[str], max_workers: int | None = None
+) -> dict[str, str]:
+    """
+    Delete keys with DeleteObjects requests of up to 1,000 keys, running the
+    requests concurrently. Returns the keys that could not be deleted mapped
+    to their error, so an empty dict means every key was deleted.
+    """
+    failures = {}
+    with ThreadPoolExecutor(max_workers) as executor:
+        tasks = [
+            executor.submit(_delete_batch, bucket, batch)
+            for batch in batched(keys, DELETE_BATCH_SIZE)
+        ]
+        for task in tasks:
+            failures.update(task.result())
+    return failures
+
+
+def _clear_partition_index(
+    bucket: str,
+    prefix: str,
+    failures: dict[str, str],
+    index_prefix: str | None = None,
+    current: tuple[dict | None, str | None] | None = None,
+) -> None:
+    """
+    Drop the keys cleared under a prefix from the index of index_prefix or,
+    without it, of the dataset the prefix is a date partition (or a year or
+    month of them) of, if it has one, but the ones that could not be
+    deleted. current is passed on to _modify_partition_index.
+    """
+    index_prefix = index_prefix or dataset_of(prefix)
+    if index_prefix is None:
+        return
+
+    _modify_partition_index(
+        bucket, index_prefix, drop_cleared(prefix, failures), False, current
+    )
+
+
+def _delete_prefix(bucket: str, prefix: str) -> dict[str, str]:
+    failures = delete_objects(bucket, iter_objects_key(bucket, prefix))
+    for key, error in failures.items():
+        logger.error(f"Error deleting object {key}: {error}")
+    return failures
+
+
 def clear_path(bucket: str, prefix: str = "") -> bool:
-    result = True
-    for obj_key in list_objects_key(bucket, prefix):
-        result = result and delete_object(bucket, obj_key)
-    return result
+    """
+    Delete every object under a prefix. Batches are deleted while the
+    listing is still being paginated. Failed keys are logged and make the
+    result False; use delete_objects to get them back. Clearing date
+    partitions of an indexed dataset drops them from its partition index.
+    """
+    failures = _delete_prefix(bucket, prefix)
+    _clear_partition_index(bucket, prefix, failures)
+    return len(failures) == 0
 
 
-def get_object(bucket: str, key: str, compressed: bool = True) -> bytes:
-    s3 = client("s3")
-    response = s3.get_object(Bucket=bucket, Key=key)
-    if compressed:
-        return decompress(response["Body"].read())
+def _skip_partition_index(*args) -> None:
+    return None
+
+
+def _clear_for_write(
+    bucket: str, prefix: str, index_prefix: str | None
+) -> Callable[[str | None, str, list[dict], list[dict] | None], None]:
+    """
+    Clear a prefix about to be written like clear_path and return the
+    update_index of commit_shards. The index the shards of a day go to is
+    read once, before clearing, and the clearing reuses that read, so
+    writing a day of a dataset without an index costs a single GET.
+    """
+    split = split_partition_prefix(prefix) if index_prefix is None else None
+    if index_prefix is None and split is None:
+        clear_path(bucket, prefix)
+        return _skip_partition_index
+
+    dataset = index_prefix or split[0]
+    current = _get_partition_index(bucket, dataset)
+    failures = _delete_prefix(bucket, prefix)
+    if current[0] is not None:
+        _clear_partition_index(bucket, prefix, failures, dataset, current)
+    elif index_prefix is None:
+        return _skip_partition_index
+    return partial(_update_partition_index, bucket)
+
+
+def _get_object_ranged(bucket: str, key: str) -> tuple[bytes | bytearray, str]:
+    s3 = get_client()
+    head = s3.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    if size < _ranged_get_threshold:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read(), head["ETag"]
+
+    # Ranges are written in place, so the parts are never concatenated
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def _get_range(start: int):
+        end = min(start + _ranged_get_size, size)
+        for attempt in range(1, _part_attempts + 1):
+            try:
+                # IfMatch fails the read if the object changes mid-download
+                body = s3.get_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Range=f"bytes={start}-{end - 1}",
+                    IfMatch=head["ETag"],
+                )["Body"]
+                position = start
+                while chunk := body.read(1024**2):
+                    view[position : position + len(chunk)] = chunk
+                    position += len(chunk)
+                if position != end:
+                    raise OSError(f"Incomplete range {start}-{end - 1} of {key}")
+                return
+            except Exception as e:
+                if attempt == _part_attempts:
+                    raise
+                logger.warning(
+                    f"Retrying range {start}-{end - 1} of {key} "
+                    f"(attempt {attempt}): {e}"
+                )
+
+    with ThreadPoolExecutor(_transfer_max_workers) as executor:
+        tasks = [
+            executor.submit(_get_range, start)
+            for start in range(0, size, _ranged_get_size)
+        ]
+        for task in tasks:
+            task.result()
+    return buffer, head["ETag"]
+
+
+def _get_object_cached(bucket: str, key: str, ranged: bool) -> bytes | bytearray:
+    cache_key = f"s3://{bucket}/{key}"
+    entry = _cache.get(cache_key)
+    if entry is None:
+        if ranged:
+            body, etag = _get_object_ranged(bucket, key)
+        else:
+            response = get_client().get_object(Bucket=bucket, Key=key)
+            body, etag = response["Body"].read(), response["ETag"]
     else:
-        return response["Body"].read()
+        try:
+            response = get_client().get_object(
+                Bucket=bucket, Key=key, IfNoneMatch=entry[0]
+            )
+        except ClientError as e:
+            if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") != 304:
+                raise
+            return entry[1]
+        body, etag = response["Body"].read(), response["ETag"]
+    _cache.put(cache_key, etag, body)
+    return body
+
+
+def _get_body(bucket: str, key: str, ranged: bool) -> bytes | bytearray:
+    if _cache is not None:
+        return _get_object_cached(bucket, key, ranged)
+    if ranged:
+        body, _ = _get_object_ranged(bucket, key)
+        return body
+    return get_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+def get_object(
+    bucket: str, key: str, compressed: bool = True, ranged: bool = False
+) -> bytes:
+    """
+    Get an object, decompressing it when compressed with the codec of its
+    extension (gzip when it has none of .gz, .zst, .lz4). With ranged, a HEAD
+    request finds the object size first, and objects above the ranged-get
+    threshold (see configure_transfer) are downloaded as concurrent byte
+    ranges. Reads go through the local cache when configured (see
+    configure_cache).
+    """
+    body = _get_body(bucket, key, ranged)
+    return resolve_codec(key).decompress(body) if compressed else body
+
+
+def _get_small_object(
+    bucket: str, key: str, compressed: bool = True, ranged: bool = False
+) -> bytes:
+    """
+    get_object through the memory cache, when configured, for the small
+    objects read by the text, json and pickle getters. Bodies are only
+    copied for the cache when they fit in it.
+    """
+    if _memory_cache is None:
+        return get_object(bucket, key, compressed, ranged)
+    cache_key = f"object:{bucket}/{key}"
+    body = _memory_cache.get(cache_key)
+    if body is None:
+        body = _get_body(bucket, key, ranged)
+        if len(body) <= _memory_cache.max_size:
+            body = bytes(body)
+            _memory_cache.put(cache_key, body)
+    return resolve_codec(key).decompress(body) if compressed else body
+
+
+def open_object(bucket: str, key: str, compressed: bool = True) -> BinaryIO:
+    """
+    Open an object as a binary file object that streams the body, and
+    decompresses it on the fly when compressed, with the codec of its
+    extension like in get_object. Only one chunk is held in
+    memory at a time; close it (or use it as a context manager) to release
+    the connection.
+    """
+    s3 = get_client()
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    if compressed:
+        return resolve_codec(key).open(body)
+    return body
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over an S3 object. Every read fetches
+    just the requested byte range, so columnar readers only download the
+    parts of the object they need.
+    """
+
+    def __init__(self, bucket: str, key: str):
+        self.bucket = bucket
+        self.key = key
+        self._s3 = get_client()
+        head = self._s3.head_object(Bucket=bucket, Key=key)
+        self._size = head["ContentLength"]
+        self._etag = head["ETag"]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = offset
+        return offset
+
+    def _read_range(self, end: int) -> bytes:
+        end = min(end, self._size)
+        if end <= self._position:
+            return b""
+        data = self._s3.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self._position}-{end - 1}",
+            IfMatch=self._etag,
+        )["Body"].read()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self._read_range(self._position + len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def readall(self) -> bytes:
+        return self._read_range(self._size)
+
+
+class _MultipartUpload:
+    """
+    Multipart upload whose parts are sent from the shared part pool. Each
+    part is retried on its own, at most two parts per pool worker are held
+    in memory at once, and the upload is aborted if it cannot be completed
+    so no orphaned parts are left behind.
+    """
+
+    def __init__(self, bucket: str, key: str):
+        self.bucket = bucket
+        self.key = key
+        self._s3 = get_client()
+        self._upload_id = self._s3.create_multipart_upload(Bucket=bucket, Key=key)[
+            "UploadId"
+        ]
+        self._executor = _get_part_executor()
+        self._slots = threading.BoundedSemaphore(2 * _transfer_max_workers)
+        self._tasks = []
+        self._aborted = False
+
+    def __enter__(self) -> "_MultipartUpload":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+
+    def _upload_part(self, part_number: int, data: bytes | memoryview) -> dict:
+        try:
+            data = bytes(data)
+            for attempt in range(1, _part_attempts + 1):
+                try:
+                    response = self._s3.upload_part(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        UploadId=self._upload_id,
+                        PartNumber=part_number,
+                        Body=data,
+                    )
+                    return {"PartNumber": part_number, "ETag": response["ETag"]}
+                except Exception as e:
+                    if attempt == _part_attempts:
+                        raise
+                    logger.warning(
+                        f"Retrying part {part_number} of {self.key} "
+                        f"(attempt {attempt}): {e}"
+                    )
+        finally:
+            self._slots.release()
+
+    def upload_part(self, data: bytes | memoryview) -> None:
+        """
+        Queue the next part. Blocks while too many parts are in flight.
+        """
+        if len(self._tasks) == MULTIPART_MAX_PARTS:
+            raise ValueError(f"Too many parts for {self.key}")
+        self._slots.acquire()
+        self._tasks.append(
+            self._executor.submit(self._upload_part, len(self._tasks) + 1, data)
+        )
+
+    def complete(self) -> bool:
+        try:
+            parts = [task.result() for task in self._tasks]
+            response_code = self._s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )["ResponseMetadata"]["HTTPStatusCode"]
+        except Exception:
+            self.abort()
+            raise
+        return response_code < 300 and response_code >= 200
+
+    def abort(self) -> None:
+        if self._aborted:
+            return
+        self._aborted = True
+        # Parts still running have to finish before the abort, or they
+        # would be stored after it as orphans
+        for task in self._tasks:
+            task.cancel()
+        wait(self._tasks)
+        try:
+            self._s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload of {self.key}: {e}")
 
 
-def put_object(bucket: str, key: str, body: bytes, compress: bool = True) -> bool:
+def _put_object_multipart(bucket: str, key: str, body: bytes) -> bool:
+    part_size = max(_multipart_part_size, -(-len(body) // MULTIPART_MAX_PARTS))
+    view = memoryview(body)
+    with _MultipartUpload(bucket, key) as upload:
+        for start in range(0, len(body), part_size):
+            upload.upload_part(view[start : start + part_size])
+        return upload.complete()
+
+
+def put_object(
+    bucket: str,
+    key: str,
+    body: bytes,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    """
+    Put an object, compressing it first when compress is set: with codec
+    ("gzip", "zstd", "lz4" or a Codec such as GzipCodec(level=6)), else the
+    codec of the key extension, else gzip. Large bodies are compressed in
+    parallel blocks (see compression.configure_compression). Bodies larger
+    than the multipart threshold (see configure_transfer) are uploaded in
+    parallel parts.
+    """
     if compress:
-        body = compress_f(body)
-    s3 = client("s3")
-    response_code = s3.put_object(Bucket=bucket, Key=key, Body=body)[
-        "ResponseMetadata"
-    ]["HTTPStatusCode"]
-    return response_code < 300 and response_code >= 200
+        body = compress_blocks(body, resolve_codec(key, codec))
+    try:
+        if len(body) >= _multipart_threshold:
+            return _put_object_multipart(bucket, key, body)
+        s3 = get_client()
+        response_code = s3.put_object(Bucket=bucket, Key=key, Body=body)[
+            "ResponseMetadata"
+        ]["HTTPStatusCode"]
+        return response_code < 300 and response_code >= 200
+    finally:
+        # After the write, so a concurrent read can't cache the old body
+        invalidate_cache(bucket, [key])
 
 
 def delete_object(bucket: str, key: str) -> bool:
-    s3 = client("s3")
-    response_code = s3.delete_object(Bucket=bucket, Key=key)["ResponseMetadata"][
-        "HTTPStatusCode"
-    ]
+    s3 = get_client()
+    try:
+        response_code = s3.delete_object(Bucket=bucket, Key=key)["ResponseMetadata"][
+            "HTTPStatusCode"
+        ]
+    finally:
+        invalidate_cache(bucket, [key])
     return response_code < 300 and response_code >= 200
 
 
 def get_text_object(
     bucket: str, key: str, encoding: str = "utf-8", compressed: bool = True
 ) -> str:
-    return get_object(bucket, key, compressed).decode(encoding)
+    return _get_small_object(bucket, key, compressed).decode(encoding)
 
 
 def put_text_object(
-    bucket: str, key: str, body: str, encoding: str = "utf-8", compress: bool = True
+    bucket: str,
+    key: str,
+    body: str,
+    encoding: str = "utf-8",
+    compress: bool = True,
+    codec: str | Codec | None = None,
 ) -> bool:
-    return put_object(bucket, key, body.encode(encoding), compress)
+    return put_object(bucket, key, body.encode(encoding), compress, codec)
 
 
 def get_json_object(bucket: str, key: str, compressed: bool = True) -> dict:
     return json.loads(get_text_object(bucket, key, compressed=compressed))
 
 
-def put_json_object(bucket: str, key: str, body: dict, compress: bool = True) -> bool:
-    return put_text_object(bucket, key, json.dumps(body), compress=compress)
+def put_json_object(
+    bucket: str,
+    key: str,
+    body: dict,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return put_text_object(
+        bucket, key, json.dumps(body), compress=compress, codec=codec
+    )
 
 
 def get_pkl_object(bucket: str, key: str, compressed: bool = True) -> dict:
-    return pickle.loads(get_object(bucket, key, compressed))
+    return pickle.loads(_get_small_object(bucket, key, compressed, ranged=True))
+
 
+def put_pkl_object(
+    bucket: str,
+    key: str,
+    body,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+):
+    return put_object(
+        bucket, key, body=pickle.dumps(body), compress=compress, codec=codec
+    )
 
-def put_pkl_object(bucket: str, key: str, body, compress: bool = True):
-    return put_object(bucket, key, body=pickle.dumps(body), compress=compress)
+
+def get_parquet_object(
+    bucket: str,
+    key: str,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+) -> pd.DataFrame:
+    """
+    Read a parquet object with ranged reads, downloading only the footer,
+    the requested columns and the row groups that can match the filters.
+    """
+    with _RangeReader(bucket, key) as reader:
+        return read_parquet(reader, columns=columns, filters=filters)
+
+
+def put_parquet_object(
+    bucket: str, key: str, body: pd.DataFrame, row_group_size: int | None = None
+) -> bool:
+    # Parquet pages are already compressed, so the object is not gzipped
+    return put_object(bucket, key, write_parquet(body, row_group_size), compress=False)
 
 
 def get_extension(key: str, compressed: bool = True) -> str:
@@ -204,15 +1028,25 @@ def get_extension(key: str, compressed: bool = True) -> str:
 
 
 def is_compressed(key: str) -> bool:
-    compressed_extensions = [".gz"]
-    return any(key.endswith(ext) for ext in compressed_extensions)
+    return codec_of_key(key) is not None
+
+
+def _single_object_key(bucket: str, prefix: str) -> str:
+    if _memory_cache is None:
+        return list_single_object_key(bucket, prefix)
+    cache_key = f"single:{bucket}/{prefix}"
+    key = _memory_cache.get(cache_key)
+    if key is None:
+        key = list_single_object_key(bucket, prefix).encode("utf-8")
+        _memory_cache.put(cache_key, key)
+    return key.decode("utf-8")
 
 
 def get_single_json_object(bucket: str, prefix: str):
     """
     Retrieve a single json object from an S3 bucket given a folder
     """
-    key = list_single_object_key(bucket, prefix)
+    key = _single_object_key(bucket, prefix)
 
     if get_extension(key, compressed=is_compressed(key)) != "json":
         raise ValueError("File is not a json file.")
@@ -224,7 +1058,7 @@ def get_single_pkl_object(bucket: str, prefix: str):
     """
     Retrieve a single pickle object from an S3 bucket given a folder
     """
-    key = list_single_object_key(bucket, prefix)
+    key = _single_object_key(bucket, prefix)
 
     if get_extension(key, compressed=is_compressed(key)) != "pkl":
         raise ValueError("File is not a pickle file.")
@@ -232,27 +1066,84 @@ def get_single_pkl_object(bucket: str, prefix: str):
     return get_pkl_object(bucket, key=key, compressed=is_compressed(key))
 
 
-def get_multiple_csv_objects(bucket: str, prefix: str) -> pd.DataFrame:
+def _read_csv_shard(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Stream and parse a csv shard (see csv_shards.read_csv_shard).
+    """
+    with open_object(bucket, key, compressed=is_compressed(key)) as stream:
+        return read_csv_shard(stream, key, shard, engine, dtype_backend, usecols, dtype)
+
+
+def _read_csv_shard_in_process(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Read a csv shard like _read_csv_shard, downloading it in the calling
+    thread and parsing it in the process pool. The size in the manifest
+    entry spares the HEAD of a ranged read for shards below the ranged-get
+    threshold.
+    """
+    ranged = shard is None or shard["size"] >= _ranged_get_threshold
+    body = get_object(bucket, key, compressed=False, ranged=ranged)
+    return parse_csv(
+        body, key, shard, is_compressed(key), engine, dtype_backend, usecols, dtype
+    )
+
+
+def _list_shards(bucket: str, prefix: str) -> list[tuple[str, dict | None]]:
+    """
+    Keys of the shards under a prefix with their manifest entries (see
+    manifest.list_shards).
+    """
+    list_keys = list_objects_key(bucket, prefix)
+    manifest = None
+    if manifest_key(prefix) in list_keys:
+        manifest = get_manifest(bucket, prefix)
+    return list_shards(prefix, list_keys, manifest)
+
+
+def get_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from an S3 bucket given a folder and
     concatenate them.
+    engine="pyarrow" parses the decompressed bytes with the multithreaded
+    pyarrow reader; dtype_backend="pyarrow" also keeps the arrow columns.
+    When the prefix has a manifest, only the shards it lists are read, with
+    the dtypes it records, and a missing or truncated shard is an error.
     """
-    list_keys = list_multiple_objects_keys(bucket, prefix)
+    shards = _list_shards(bucket, prefix)
 
     list_ext = [
-        get_extension(key=key, compressed=is_compressed(key)) for key in list_keys
+        get_extension(key=key, compressed=is_compressed(key)) for key, _ in shards
     ]
     if not all(ext == "csv" for ext in list_ext):
         raise ValueError("Not all files are csv files.")
 
     list_df = []
-    for key in list_keys:
+    for key, shard in shards:
         list_df += [
-            pd.read_csv(
-                io.StringIO(
-                    get_text_object(bucket, key=key, compressed=is_compressed(key))
-                )
-            )
+            _read_csv_shard(bucket, key, shard, engine, dtype_backend, usecols, dtype)
         ]
 
     try:
@@ -263,124 +1154,286 @@ def get_multiple_csv_objects(bucket: str, prefix: str) -> pd.DataFrame:
     return df
 
 
-def put_single_json_object(bucket: str, prefix: str, body: dict) -> str:
+def put_single_json_object(
+    bucket: str, prefix: str, body: dict, codec: str | Codec = "gzip"
+) -> str:
     """
-    Clean folder and put a single json file into such folder.
+    Clean folder and put a single json file into such folder, compressed
+    with codec.
     """
     clear_path(bucket, prefix)
 
-    key = os.path.join(prefix, str(uuid.uuid4()) + ".json.gz")
+    codec = get_codec(codec)
+    key = os.path.join(prefix, str(uuid.uuid4()) + ".json" + codec.extension)
 
-    put_json_object(bucket, key=key, body=body, compress=True)
+    put_json_object(bucket, key=key, body=body, compress=True, codec=codec)
 
     return key
 
 
-def put_single_pkl_object(bucket: str, prefix: str, body) -> str:
+def put_single_pkl_object(
+    bucket: str, prefix: str, body, codec: str | Codec = "gzip"
+) -> str:
     """
-    Clean folder and put a single pickle object into such folder.
+    Clean folder and put a single pickle object into such folder, compressed
+    with codec.
     """
     clear_path(bucket, prefix)
 
-    key = os.path.join(prefix, str(uuid.uuid4()) + ".pkl.gz")
+    codec = get_codec(codec)
+    key = os.path.join(prefix, str(uuid.uuid4()) + ".pkl" + codec.extension)
 
-    put_pkl_object(bucket, key=key, body=body, compress=True)
+    put_pkl_object(bucket, key=key, body=body, compress=True, codec=codec)
 
     return key
 
 
+def _put_csv_object(
+    bucket: str, key: str, body: pd.DataFrame, codec: str | Codec = "gzip"
+) -> dict:
+    """
+    Stream a dataframe as compressed CSV. Small outputs go up in a
+    single request; larger ones are uploaded part by part while the rest
+    is still being serialized, so memory is bounded by the part size.
+    Returns the size and md5 of the stored object.
+    """
+    stored = {}
+    parts = hash_parts(iter_compressed_csv(body, _multipart_part_size, codec), stored)
+    first_part = next(parts)
+    second_part = next(parts, None)
+    if second_part is None:
+        completed = put_object(bucket, key, first_part, compress=False)
+    else:
+        with _MultipartUpload(bucket, key) as upload:
+            upload.upload_part(first_part)
+            upload.upload_part(second_part)
+            for part in parts:
+                upload.upload_part(part)
+            completed = upload.complete()
+        invalidate_cache(bucket, [key])
+    if not completed:
+        raise OSError(f"Error uploading object {key}")
+    return stored
+
+
+def _put_csv_object_in_process(
+    bucket: str, key: str, body: pd.DataFrame, codec: Codec
+) -> dict:
+    """
+    Serialize a csv shard in the process pool and upload it from the
+    calling thread. Returns the size and md5 of the stored object.
+    """
+    data = serialize_csv(body, codec)
+    if not put_object(bucket, key, data, compress=False):
+        raise OSError(f"Error uploading object {key}")
+    return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+
+def _put_parquet_shard(
+    bucket: str,
+    key: str,
+    body: pd.DataFrame,
+    row_group_size: int | None = None,
+    codec: str | Codec = "zstd",
+) -> dict:
+    codec = get_codec(codec)
+    data = write_parquet(body, row_group_size, codec.name, codec.level)
+    if not put_object(bucket, key, data, compress=False):
+        raise OSError(f"Error uploading object {key}")
+    return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+
 def put_multiple_csv_objects(
     bucket: str,
     prefix: str,
     body: pd.DataFrame,
     size_max_mb: float = 100,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    index_prefix: str | None = None,
+    manifest: bool = True,
+    codec: str | Codec = "gzip",
+    executor: str = "thread",
 ) -> list[str]:
     """
     Clean folder, split dataframe into multiple csv files and put them into
-    folder
+    folder. Shards are planned from the compressed size of a sample of rows,
+    so they come out about the same size and under size_max_mb once stored.
+    Up to max_workers shards are serialized and uploaded at once.
+    Shards are compressed with codec and named with its extension.
+    With executor="process", shards are serialized and compressed in the
+    shared process pool (see processes.configure_process_pool) and uploaded
+    from threads; their columns must be convertible to Arrow.
+    With index_prefix, prefix must be one of its <YYYY>/<MM>/<DD> partitions
+    and the shards are recorded in its partition index; without it, a
+    <YYYY>/<MM>/<DD> prefix is recorded in the index of its dataset, if any.
+    With manifest, a _manifest.json listing the keys, sizes, rows and md5 of
+    the shards and the column dtypes is written once every shard is stored.
     """
-    clear_path(bucket, prefix)
-
-    size_memory_mb = body.memory_usage(deep=True).sum() / (1024**2)
-    size_row_slice = int(size_max_mb / size_memory_mb * len(body))
-
-    def _generate_slices(dataframe: pd.DataFrame, row_slice_size: int):
-        """Generates slices of the DataFrame based on the given row slice size."""
-        for start in range(0, len(dataframe), row_slice_size):
-            yield dataframe.iloc[start : start + row_slice_size]
-
-    list_keys = list()
-    for df in _generate_slices(body, max(size_row_slice, 1)):
-        key = os.path.join(prefix, str(uuid.uuid4()) + ".csv.gz")
-        list_keys.append(key)
-        put_text_object(
-            bucket,
-            key=key,
-            body=df.to_csv(index=False, quoting=csv.QUOTE_ALL),
-            compress=True,
-        )
-
-    return list_keys
+    check_executor(executor)
+    if index_prefix is not None:
+        partition_of_prefix(index_prefix, prefix)
+    update_index = _clear_for_write(bucket, prefix, index_prefix)
+
+    codec = get_codec(codec)
+    put = _put_csv_object if executor == "thread" else _put_csv_object_in_process
+    shard_rows = plan_shard_rows(
+        len(body),
+        estimate_bytes_per_row(body, lambda df: compress_csv(df, codec)),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
+
+    shards = put_shards(
+        prefix,
+        body,
+        shard_rows,
+        ".csv" + codec.extension,
+        lambda key, df: put(bucket, key=key, body=df, codec=codec),
+        max_workers,
+    )
+    return commit_shards(
+        prefix,
+        body,
+        "csv",
+        shards,
+        index_prefix,
+        manifest,
+        update_index,
+        partial(put_json_object, bucket, compress=False),
+    )
 
 
 def get_multiple_csv_objects_threaded(
-    bucket: str, prefixes: list[str], logger: logging.Logger | None = None
+    bucket: str,
+    prefixes: list[str],
+    logger: logging.Logger | None = None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+    executor: str = "thread",
 ) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from an S3 bucket given a list of prefixes and
-    concatenate them.
+    concatenate them. See get_multiple_csv_objects for the parsing options.
+    With executor="process", objects are downloaded from threads and
+    decompressed and parsed in the shared process pool (see
+    processes.configure_process_pool), which returns the columns as Arrow
+    IPC buffers.
+    Failed listings or downloads are retried up to retries times; the first
+    key that still fails cancels the pending ones and raises a
+    ThreadedTaskError.
+    Shards are concatenated in key order. assembly="preallocate" copies them
+    into preallocated columns, releasing each shard as soon as it is copied,
+    which keeps peak memory close to the size of the result.
+    Prefixes with a manifest are read like in get_multiple_csv_objects, and
+    every shard must have the rows the manifest lists.
+    """
+    check_executor(executor)
+    read = _read_csv_shard if executor == "thread" else _read_csv_shard_in_process
+    return get_multiple_objects_threaded(
+        prefixes,
+        partial(_list_shards, bucket),
+        lambda key, shard: read(
+            bucket, key, shard, engine, dtype_backend, usecols, dtype
+        ),
+        logger,
+        retries,
+        assembly,
+    )
+
+
+def iter_csv_objects(
+    bucket: str,
+    prefixes: list[str],
+    chunksize: int | None = None,
+    prefetch: int = 2,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+) -> Iterator[pd.DataFrame]:
+    """
+    Iterate over the csv objects under a list of prefixes in key order,
+    yielding one DataFrame per object, or chunks of chunksize rows when given.
+    The next prefetch objects are downloaded and parsed in the background, so
+    at most prefetch + 2 objects are held in memory at once, counting the one
+    being consumed.
+    See get_multiple_csv_objects for the parsing options.
     """
 
-    def _get_object(key: str, list_df: list[pd.DataFrame]):
-        if logger:
-            logger.info(f"Getting object {key}")
-        list_df.append(
-            pd.read_csv(
-                io.StringIO(
-                    get_text_object(bucket, key=key, compressed=is_compressed(key))
-                )
-            )
-        )
-        if logger:
-            logger.info(f"Object {key} done")
-
-    def _get_keys(prefix: str, list_keys: list[str]):
-        list_keys.extend(list_multiple_objects_keys(bucket, prefix))
+    shards = {}
 
-    list_keys = []
-    with ThreadPoolExecutor() as executor:
+    def _iter_keys() -> Iterator[str]:
         for prefix in prefixes:
-            executor.submit(_get_keys, prefix, list_keys)
-
-    list_df = []
-    with ThreadPoolExecutor() as executor:
-        for key in list_keys:
-            executor.submit(_get_object, key, list_df)
+            for key, shard in _list_shards(bucket, prefix):
+                shards[key] = shard
+                yield key
+
+    def _read(key: str) -> pd.DataFrame:
+        # Dropped only once read, so a retry still finds the entry
+        df = _read_csv_shard(
+            bucket, key, shards[key], engine, dtype_backend, usecols, dtype
+        )
+        shards.pop(key, None)
+        return df
 
-    if len(list_df) == 0:
-        raise ValueError("No data found")
+    dfs = iter_threaded(
+        _read,
+        _iter_keys(),
+        prefetch=prefetch,
+        retries=retries,
+    )
+    if chunksize is None:
+        return dfs
+    return rechunk(dfs, chunksize)
 
-    try:
-        df = pd.concat(list_df).reset_index(drop=True)
-    except Exception as e:
-        raise ValueError("Error concatenating dataframes") from e
 
-    return df
+def _list_shards_between_dates(
+    bucket: str, prefix: str, start_date: datetime, end_date: datetime
+) -> list[tuple[str, dict | None]]:
+    shards = list_shards_between_dates(
+        prefix,
+        start_date,
+        end_date,
+        partial(get_partition_index, bucket),
+        partial(_list_objects_key_by_day, bucket),
+        partial(get_manifest, bucket),
+    )
+    if len(shards) == 0:
+        raise ValueError(
+            f"No data found between {start_date} and {end_date} at {prefix}"
+        )
+    return shards
 
 
 def get_multiple_csv_objects_between_dates_threaded(
-    bucket: str, prefix: str, start_date: datetime, end_date: datetime
+    bucket: str,
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
 ) -> pd.DataFrame:
     """
     Retrieve multiple csv objects from an S3 bucket given a prefix and a
-    date range, then concatenate them.
+    date range, then concatenate them. Days written with a manifest are
+    read like in get_multiple_csv_objects.
     """
-    list_keys = list_objects_key_between_dates(bucket, prefix, start_date, end_date)
-    if len(list_keys) == 0:
-        raise ValueError(
-            f"No data found between {start_date} and {end_date} at {prefix}"
-        )
-    return get_multiple_csv_objects_threaded(bucket, list_keys)
+    return get_shards_threaded(
+        _list_shards_between_dates(bucket, prefix, start_date, end_date),
+        lambda key, shard: _read_csv_shard(
+            bucket, key, shard, engine, dtype_backend, usecols, dtype
+        ),
+    )
 
 
 def put_multiple_csv_objects_threaded(
@@ -388,20 +1441,231 @@ def put_multiple_csv_objects_threaded(
     dfs: dict[str, pd.DataFrame],
     size_max_mb: float = 100,
     logger: logging.Logger | None = None,
+    retries: int = 0,
+    index_prefix: str | None = None,
+    codec: str | Codec = "gzip",
+    executor: str = "thread",
 ) -> None:
     """
-    Put multiple csv objects into an S3 bucket given a folder.
+    Put multiple csv objects into an S3 bucket given a folder, compressed
+    with codec. executor="process" serializes the shards in a process pool
+    (see put_multiple_csv_objects).
+    Failed prefixes are retried up to retries times; the first prefix that
+    still fails cancels the pending ones and raises a ThreadedTaskError.
+    With index_prefix, every prefix must be one of its date partitions (see
+    put_multiple_csv_objects).
     """
-    with ThreadPoolExecutor() as executor:
-        for prefix, df in dfs.items():
-            if logger:
-                logger.info(f"Putting object {prefix}")
-            executor.submit(
-                put_multiple_csv_objects,
-                bucket,
-                prefix,
-                df,
-                size_max_mb,
-            )
+
+    def _put(prefix: str) -> list[str]:
+        if logger:
+            logger.info(f"Putting object {prefix}")
+        return put_multiple_csv_objects(
+            bucket,
+            prefix,
+            dfs[prefix],
+            size_max_mb,
+            index_prefix=index_prefix,
+            codec=codec,
+            executor=executor,
+        )
+
+    check_executor(executor)
+    run_threaded(_put, list(dfs), retries=retries)
     if logger:
         logger.info("Upload finished")
+
+
+def put_multiple_parquet_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    size_max_mb: float = 100,
+    row_group_size: int | None = None,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    index_prefix: str | None = None,
+    manifest: bool = True,
+    codec: str | Codec = "zstd",
+) -> list[str]:
+    """
+    Clean folder, split dataframe into multiple parquet files and put them
+    into folder. Shards are planned, uploaded, indexed and committed with a
+    manifest like in put_multiple_csv_objects. codec compresses the pages
+    inside the files, which keep the .parquet extension.
+    """
+    if index_prefix is not None:
+        partition_of_prefix(index_prefix, prefix)
+    update_index = _clear_for_write(bucket, prefix, index_prefix)
+
+    codec = get_codec(codec)
+    shard_rows = plan_shard_rows(
+        len(body),
+        estimate_bytes_per_row(
+            body,
+            lambda df: write_parquet(df, row_group_size, codec.name, codec.level),
+        ),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
+
+    shards = put_shards(
+        prefix,
+        body,
+        shard_rows,
+        ".parquet",
+        lambda key, df: _put_parquet_shard(bucket, key, df, row_group_size, codec),
+        max_workers,
+    )
+    return commit_shards(
+        prefix,
+        body,
+        "parquet",
+        shards,
+        index_prefix,
+        manifest,
+        update_index,
+        partial(put_json_object, bucket, compress=False),
+    )
+
+
+def _read_parquet_shard(
+    bucket: str,
+    key: str,
+    shard: dict | None,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+) -> pd.DataFrame:
+    df = get_parquet_object(bucket, key, columns=columns, filters=filters)
+    if shard is None or filters is not None:
+        return df
+    return check_rows(df, key, shard)
+
+
+def get_multiple_parquet_objects_threaded(
+    bucket: str,
+    prefixes: list[str],
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    Retrieve multiple parquet objects from an S3 bucket given a list of
+    prefixes and concatenate them, reading only the given columns and the
+    rows that match the filters. Errors are handled like in
+    get_multiple_csv_objects_threaded.
+    """
+
+    return get_multiple_objects_threaded(
+        prefixes,
+        partial(_list_shards, bucket),
+        lambda key, shard: _read_parquet_shard(bucket, key, shard, columns, filters),
+        logger,
+        retries,
+        assembly,
+    )
+
+
+def get_multiple_parquet_objects_between_dates_threaded(
+    bucket: str,
+    prefix: str,
+    start_date: datetime,
+    end_date: datetime,
+    columns: list[str] | None = None,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve multiple parquet objects from an S3 bucket given a prefix and a
+    date range, then concatenate them. Days written with a manifest must
+    have the rows it lists.
+    """
+    return get_shards_threaded(
+        _list_shards_between_dates(bucket, prefix, start_date, end_date),
+        lambda key, shard: _read_parquet_shard(bucket, key, shard, columns, filters),
+    )
+
+
+def put_partitioned_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    partition_cols: list[str] | None = None,
+    date_col: str | None = None,
+    file_format: str = "csv",
+    size_max_mb: float = 100,
+    max_workers: int = 4,
+    retries: int = 0,
+    index: bool = False,
+) -> dict[str, list[str]]:
+    """
+    Split a dataframe by partition and put every partition under its own
+    folder, up to max_workers partitions at once:
+    <prefix>/<YYYY>/<MM>/<DD>/<col>=<value>/..., the date taken from
+    date_col and a segment per partition column (see partition_groups).
+    Partitions are written like in put_multiple_csv_objects or
+    put_multiple_parquet_objects, replacing the partitions present in the
+    dataframe and leaving the others untouched. The partition columns are
+    kept in the files. With index, which needs date_col and no
+    partition_cols, the dates are recorded in the partition index of prefix.
+    Returns the keys written for every partition folder.
+    """
+    writers = {"csv": put_multiple_csv_objects, "parquet": put_multiple_parquet_objects}
+    if file_format not in writers:
+        raise ValueError(f"Unknown file format: {file_format}")
+
+    def _put(path: str, df: pd.DataFrame, index_prefix: str | None) -> list[str]:
+        return writers[file_format](
+            bucket, path, df, size_max_mb, index_prefix=index_prefix
+        )
+
+    return write_partitions(
+        prefix, body, _put, partition_cols, date_col, max_workers, retries, index
+    )
+
+
+def get_partitioned_objects(
+    bucket: str,
+    prefix: str,
+    filters: list[tuple] | list[list[tuple]] | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    file_format: str = "csv",
+    columns: list[str] | None = None,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    Read a dataset written by put_partitioned_objects, downloading only the
+    partitions that can match. Partitions are pruned from the keys of a
+    single listing: by date between start_date and end_date, both included,
+    using the partition index when there is one, and by the <col>=<value>
+    segments against filters (see match_partition). The remaining objects
+    are read and filtered row by row, parquet with predicate pushdown and
+    csv with the dtypes of the manifest of their partition, and
+    concatenated like in get_multiple_csv_objects_threaded.
+    """
+    return read_partitions(
+        prefix,
+        partial(iter_objects_key, bucket),
+        partial(get_partition_index, bucket),
+        partial(_list_objects_key_by_day, bucket),
+        partial(get_manifest, bucket),
+        lambda key, shard, usecols: _read_csv_shard(
+            bucket, key, shard, usecols=usecols
+        ),
+        lambda key, columns, filters: get_parquet_object(
+            bucket, key, columns=columns, filters=filters
+        ),
+        filters,
+        start_date,
+        end_date,
+        file_format,
+        columns,
+        logger,
+        retries,
+        assembly,
+    )
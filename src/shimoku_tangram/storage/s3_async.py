@@ -0,0 +1,606 @@
+import asyncio
+import base64
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable
+from functools import partial
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import ReadOnlyCredentials
+from botocore.exceptions import ClientError
+import botocore.session
+import httpx
+import pandas as pd
+
+from shimoku_tangram.reporting.logging import init_logger
+from shimoku_tangram.storage import aio, s3
+from shimoku_tangram.storage.aio import AsyncTransport, as_async_iterable
+from shimoku_tangram.storage.csv_shards import parse_csv_shard
+from shimoku_tangram.storage.compression import Codec, compress_csv, get_codec
+from shimoku_tangram.storage.manifest import manifest_key
+from shimoku_tangram.storage.partitions import (
+    dataset_of,
+    drop_cleared,
+    index_key,
+    modify_index_async,
+    record_shards,
+    split_partition_prefix,
+)
+from shimoku_tangram.storage.sharding import (
+    commit_shards_async,
+    estimate_bytes_per_row,
+    get_multiple_objects_async,
+    list_prefix_shards_async,
+    plan_shard_rows,
+    put_shards_async,
+)
+from shimoku_tangram.storage.tasks import run_async
+
+
+logger = init_logger(__name__)
+
+# DeleteObjects accepts at most 1,000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+_XMLNS = {"s3": "http://s3.amazonaws.com/doc/2006-03-01/"}
+
+_session: botocore.session.Session | None = None
+# The credentials of the session and their frozen copy, see _frozen_credentials
+_credentials: tuple[object, ReadOnlyCredentials] | None = None
+_credentials_lock = threading.Lock()
+_region_name: str | None = None
+_endpoint_url: str | None = None
+_transport = AsyncTransport()
+
+
+def configure_client(
+    max_concurrency: int = 64,
+    max_attempts: int = 5,
+    timeout: float = 60,
+    region_name: str | None = None,
+    endpoint_url: str | None = None,
+) -> None:
+    """
+    Set the number of requests kept in flight per event loop, the attempts
+    and timeout of every request, and where requests go: the S3 endpoint of
+    region_name (the default AWS region when None) or endpoint_url, for
+    S3-compatible stores. Clients already created are dropped; call
+    close_clients first from loops that used them.
+    """
+    global _transport, _region_name, _endpoint_url
+    _transport = AsyncTransport(max_concurrency, max_attempts, timeout)
+    _region_name = region_name
+    _endpoint_url = endpoint_url
+
+
+async def close_clients() -> None:
+    """
+    Close the HTTP client of the running event loop, e.g. on app shutdown.
+    """
+    await _transport.aclose()
+
+
+def _get_session() -> botocore.session.Session:
+    global _session
+    if _session is None:
+        _session = botocore.session.get_session()
+    return _session
+
+
+def _region() -> str:
+    return _region_name or _get_session().get_config_variable("region") or "us-east-1"
+
+
+def _frozen_credentials() -> ReadOnlyCredentials:
+    # Blocking: botocore may resolve or refresh credentials over the network
+    global _credentials
+    with _credentials_lock:
+        credentials = _get_session().get_credentials()
+        if credentials is None:
+            raise ValueError("No AWS credentials found")
+        _credentials = (credentials, credentials.get_frozen_credentials())
+        return _credentials[1]
+
+
+def _cached_credentials() -> ReadOnlyCredentials | None:
+    # The last frozen credentials, unless they are about to expire
+    if _credentials is None:
+        return None
+    credentials, frozen = _credentials
+    refresh_needed = getattr(credentials, "refresh_needed", None)
+    if refresh_needed is not None and refresh_needed():
+        return None
+    return frozen
+
+
+class _SigV4Auth(httpx.Auth):
+    """
+    Sign requests with the credentials of the default botocore session,
+    which refreshes them when they expire. From the event loop, credentials
+    are resolved in a worker thread and reused until they need a refresh.
+    """
+
+    def __init__(self, region_name: str):
+        self.region_name = region_name
+
+    def _sign(
+        self, request: httpx.Request, credentials: ReadOnlyCredentials
+    ) -> httpx.Request:
+        aws_request = AWSRequest(
+            method=request.method,
+            url=str(request.url),
+            data=request.content,
+            headers={
+                name: value
+                for name, value in request.headers.items()
+                if name.lower() in ("content-md5", "content-type")
+            },
+        )
+        S3SigV4Auth(credentials, "s3", self.region_name).add_auth(aws_request)
+        request.headers.update(dict(aws_request.headers.items()))
+        return request
+
+    def auth_flow(self, request: httpx.Request):
+        yield self._sign(request, _frozen_credentials())
+
+    async def async_auth_flow(self, request: httpx.Request):
+        credentials = _cached_credentials()
+        if credentials is None:
+            credentials = await asyncio.to_thread(_frozen_credentials)
+        yield self._sign(request, credentials)
+
+
+def _url(bucket: str, key: str = "", query: dict[str, str] | None = None) -> str:
+    path = quote(key, safe="/-_.~")
+    if _endpoint_url is not None:
+        url = f"{_endpoint_url.rstrip('/')}/{bucket}/{path}"
+    else:
+        url = f"https://{bucket}.s3.{_region()}.amazonaws.com/{path}"
+    if query:
+        # Encoded here, the way SigV4 canonicalizes it
+        url += "?" + "&".join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for name, value in sorted(query.items())
+        )
+    return url
+
+
+def _raise_for_status(response: httpx.Response, operation: str) -> None:
+    """
+    Raise the ClientError boto3 would raise for an error response.
+    """
+    if response.status_code < 300:
+        return
+    code, message = str(response.status_code), response.reason_phrase
+    try:
+        root = ElementTree.fromstring(response.content)
+        code = root.findtext("Code") or code
+        message = root.findtext("Message") or message
+    except ElementTree.ParseError:
+        pass
+    raise ClientError(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": response.status_code},
+        },
+        operation,
+    )
+
+
+async def _request(
+    method: str,
+    bucket: str,
+    key: str = "",
+    query: dict[str, str] | None = None,
+    operation: str = "",
+    **kwargs,
+) -> httpx.Response:
+    response = await _transport.request(
+        method, _url(bucket, key, query), auth=_SigV4Auth(_region()), **kwargs
+    )
+    _raise_for_status(response, operation)
+    return response
+
+
+async def iter_objects_metadata(bucket: str, prefix: str = "") -> AsyncIterator[dict]:
+    """
+    Yield the metadata of every object under a prefix. Pages of the listing
+    are requested lazily, only once the previous page has been consumed.
+    """
+    query = {"list-type": "2", "prefix": prefix}
+    while True:
+        response = await _request("GET", bucket, query=query, operation="ListObjectsV2")
+        root = ElementTree.fromstring(response.content)
+        for contents in root.iterfind("s3:Contents", _XMLNS):
+            yield {
+                "Key": contents.findtext("s3:Key", namespaces=_XMLNS),
+                "LastModified": contents.findtext("s3:LastModified", namespaces=_XMLNS),
+                "Size": int(contents.findtext("s3:Size", "0", namespaces=_XMLNS)),
+                "ETag": contents.findtext("s3:ETag", namespaces=_XMLNS),
+            }
+        token = root.findtext("s3:NextContinuationToken", namespaces=_XMLNS)
+        if token is None:
+            return
+        query = {**query, "continuation-token": token}
+
+
+async def iter_objects_key(bucket: str, prefix: str = "") -> AsyncIterator[str]:
+    async for obj in iter_objects_metadata(bucket, prefix):
+        yield obj["Key"]
+
+
+async def list_objects_metadata(bucket: str, prefix: str = "") -> list:
+    return [obj async for obj in iter_objects_metadata(bucket, prefix)]
+
+
+async def list_objects_key(bucket: str, prefix: str = "") -> list:
+    return [key async for key in iter_objects_key(bucket, prefix)]
+
+
+async def get_object(bucket: str, key: str, compressed: bool = True) -> bytes:
+    """
+    Get an object, decompressing it when compressed with the codec of its
+    extension, like s3.get_object.
+    """
+    response = await _request("GET", bucket, key, operation="GetObject")
+    if compressed:
+        return await aio.decompress(key, response.content)
+    return response.content
+
+
+async def put_object(
+    bucket: str,
+    key: str,
+    body: bytes,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    """
+    Put an object, compressing it first when compress is set with codec or
+    the codec of the key extension, like s3.put_object.
+    """
+    if compress:
+        body = await aio.compress(key, body, codec)
+    try:
+        await _request("PUT", bucket, key, operation="PutObject", content=body)
+        return True
+    finally:
+        # Keep the caches of storage.s3 coherent with writes made from here
+        s3.invalidate_cache(bucket, [key])
+
+
+async def delete_object(bucket: str, key: str) -> bool:
+    try:
+        await _request("DELETE", bucket, key, operation="DeleteObject")
+        return True
+    finally:
+        s3.invalidate_cache(bucket, [key])
+
+
+async def _delete_batch(bucket: str, keys: list[str]) -> dict[str, str]:
+    root = ElementTree.Element("Delete")
+    ElementTree.SubElement(root, "Quiet").text = "true"
+    for key in keys:
+        ElementTree.SubElement(ElementTree.SubElement(root, "Object"), "Key").text = key
+    body = ElementTree.tostring(root, encoding="utf-8")
+    try:
+        response = await _request(
+            "POST",
+            bucket,
+            query={"delete": ""},
+            operation="DeleteObjects",
+            content=body,
+            headers={
+                "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode(),
+                "Content-Type": "application/xml",
+            },
+        )
+    except Exception as e:
+        return {key: str(e) for key in keys}
+    finally:
+        s3.invalidate_cache(bucket, keys)
+    return {
+        error.findtext("s3:Key", namespaces=_XMLNS): (
+            f"{error.findtext('s3:Code', namespaces=_XMLNS)}: "
+            f"{error.findtext('s3:Message', namespaces=_XMLNS)}"
+        )
+        for error in ElementTree.fromstring(response.content).iterfind(
+            "s3:Error", _XMLNS
+        )
+    }
+
+
+async def delete_objects(
+    bucket: str, keys: Iterable[str] | AsyncIterable[str]
+) -> dict[str, str]:
+    """
+    Delete keys with DeleteObjects requests of up to 1,000 keys, sending
+    each batch as soon as it is full. Returns the keys that could not be
+    deleted mapped to their error, so an empty dict means every key was
+    deleted.
+    """
+    tasks = []
+    batch = []
+    async for key in as_async_iterable(keys):
+        batch.append(key)
+        if len(batch) == DELETE_BATCH_SIZE:
+            tasks.append(asyncio.ensure_future(_delete_batch(bucket, batch)))
+            batch = []
+    if batch:
+        tasks.append(asyncio.ensure_future(_delete_batch(bucket, batch)))
+
+    failures = {}
+    for result in await asyncio.gather(*tasks):
+        failures.update(result)
+    return failures
+
+
+async def _get_partition_index(
+    bucket: str, prefix: str
+) -> tuple[dict | None, str | None]:
+    key = index_key(prefix)
+    try:
+        response = await _request("GET", bucket, key, operation="GetObject")
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return None, None
+    body = await aio.decompress(key, response.content)
+    return json.loads(body), response.headers.get("ETag")
+
+
+async def _put_partition_index(
+    bucket: str, prefix: str, index: dict, etag: str | None
+) -> bool:
+    key = index_key(prefix)
+    headers = {"If-None-Match": "*"} if etag is None else {"If-Match": etag}
+    body = await aio.compress(key, json.dumps(index).encode("utf-8"), None)
+    try:
+        await _request(
+            "PUT", bucket, key, operation="PutObject", content=body, headers=headers
+        )
+    except ClientError as e:
+        if e.response["ResponseMetadata"]["HTTPStatusCode"] not in (409, 412):
+            raise
+        return False
+    finally:
+        s3.invalidate_cache(bucket, [key])
+    return True
+
+
+async def _modify_partition_index(
+    bucket: str, prefix: str, modify: Callable[[dict], dict]
+) -> None:
+    # Only an existing index is kept up to date, like s3._modify_partition_index
+    await modify_index_async(
+        prefix,
+        modify,
+        partial(_get_partition_index, bucket),
+        partial(_put_partition_index, bucket),
+        create=False,
+    )
+
+
+async def _update_partition_index(
+    bucket: str, prefix: str, shards: list[dict], columns: list[dict] | None
+) -> None:
+    # Shards of a <YYYY>/<MM>/<DD> prefix go to the index of its dataset
+    split = split_partition_prefix(prefix)
+    if split is not None:
+        await _modify_partition_index(
+            bucket, split[0], record_shards(split[1], shards, columns)
+        )
+
+
+async def _clear_partition_index(
+    bucket: str, prefix: str, failures: dict[str, str]
+) -> None:
+    index_prefix = dataset_of(prefix)
+    if index_prefix is not None:
+        await _modify_partition_index(
+            bucket, index_prefix, drop_cleared(prefix, failures)
+        )
+
+
+async def clear_path(bucket: str, prefix: str = "") -> bool:
+    """
+    Delete every object under a prefix while the listing is still being
+    paginated. Failed keys are logged and make the result False. Like
+    s3.clear_path, cleared date partitions leave the partition index.
+    """
+    failures = await delete_objects(bucket, iter_objects_key(bucket, prefix))
+    for key, error in failures.items():
+        logger.error(f"Error deleting object {key}: {error}")
+    await _clear_partition_index(bucket, prefix, failures)
+    return len(failures) == 0
+
+
+async def get_text_object(
+    bucket: str, key: str, encoding: str = "utf-8", compressed: bool = True
+) -> str:
+    return (await get_object(bucket, key, compressed)).decode(encoding)
+
+
+async def put_text_object(
+    bucket: str,
+    key: str,
+    body: str,
+    encoding: str = "utf-8",
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_object(bucket, key, body.encode(encoding), compress, codec)
+
+
+async def get_json_object(bucket: str, key: str, compressed: bool = True) -> dict:
+    return json.loads(await get_text_object(bucket, key, compressed=compressed))
+
+
+async def put_json_object(
+    bucket: str,
+    key: str,
+    body: dict,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_text_object(
+        bucket, key, json.dumps(body), compress=compress, codec=codec
+    )
+
+
+async def get_pkl_object(bucket: str, key: str, compressed: bool = True):
+    return pickle.loads(await get_object(bucket, key, compressed))
+
+
+async def put_pkl_object(
+    bucket: str,
+    key: str,
+    body,
+    compress: bool = True,
+    codec: str | Codec | None = None,
+) -> bool:
+    return await put_object(bucket, key, pickle.dumps(body), compress, codec)
+
+
+async def _get_manifest(bucket: str, prefix: str) -> dict:
+    return await get_json_object(bucket, manifest_key(prefix), compressed=False)
+
+
+async def get_multiple_csv_objects_threaded(
+    bucket: str,
+    prefixes: list[str],
+    logger: logging.Logger | None = None,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+    retries: int = 0,
+) -> pd.DataFrame:
+    """
+    Async counterpart of s3.get_multiple_csv_objects_threaded, under the
+    same name so calls port over with an await. Downloads run on the event
+    loop, bounded by configure_client; parsing runs in worker threads.
+    """
+
+    async def _list_shards(prefix: str) -> list[tuple[str, dict | None]]:
+        return await list_prefix_shards_async(
+            prefix, partial(list_objects_key, bucket), partial(_get_manifest, bucket)
+        )
+
+    async def _read(key: str, shard: dict | None) -> pd.DataFrame:
+        return await asyncio.to_thread(
+            parse_csv_shard,
+            await get_object(bucket, key, compressed=False),
+            key,
+            shard,
+            s3.is_compressed(key),
+            engine,
+            dtype_backend,
+            usecols,
+            dtype,
+        )
+
+    return await get_multiple_objects_async(
+        prefixes, _list_shards, _read, logger, retries
+    )
+
+
+async def get_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    engine: str = "c",
+    dtype_backend: str | None = None,
+    usecols: list[str] | None = None,
+    dtype: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve the csv objects under a prefix and concatenate them, like
+    s3.get_multiple_csv_objects.
+    """
+    return await get_multiple_csv_objects_threaded(
+        bucket,
+        [prefix],
+        engine=engine,
+        dtype_backend=dtype_backend,
+        usecols=usecols,
+        dtype=dtype,
+    )
+
+
+async def put_multiple_csv_objects(
+    bucket: str,
+    prefix: str,
+    body: pd.DataFrame,
+    size_max_mb: float = 100,
+    min_rows_per_shard: int = 1,
+    max_rows_per_shard: int | None = None,
+    max_workers: int = 4,
+    manifest: bool = True,
+    codec: str | Codec = "gzip",
+) -> list[str]:
+    """
+    Clean folder, split dataframe into multiple csv files and put them into
+    folder, like s3.put_multiple_csv_objects. Up to max_workers shards are
+    serialized in worker threads at once, uploads run on the event loop.
+    """
+    await clear_path(bucket, prefix)
+
+    codec = get_codec(codec)
+    shard_rows = plan_shard_rows(
+        len(body),
+        await asyncio.to_thread(
+            estimate_bytes_per_row, body, lambda df: compress_csv(df, codec)
+        ),
+        size_max_mb,
+        min_rows_per_shard,
+        max_rows_per_shard,
+    )
+
+    async def _put(key: str, df: pd.DataFrame) -> dict:
+        data = await asyncio.to_thread(compress_csv, df, codec)
+        await put_object(bucket, key, data, compress=False)
+        return {"size": len(data), "md5": hashlib.md5(data).hexdigest()}
+
+    shards = await put_shards_async(
+        prefix, body, shard_rows, ".csv" + codec.extension, _put, max_workers
+    )
+    return await commit_shards_async(
+        prefix,
+        body,
+        "csv",
+        shards,
+        manifest,
+        partial(_update_partition_index, bucket),
+        partial(put_json_object, bucket, compress=False),
+    )
+
+
+async def put_multiple_csv_objects_threaded(
+    bucket: str,
+    dfs: dict[str, pd.DataFrame],
+    size_max_mb: float = 100,
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    codec: str | Codec = "gzip",
+) -> None:
+    """
+    Async counterpart of s3.put_multiple_csv_objects_threaded, putting the
+    dataframes of several prefixes at once.
+    """
+
+    async def _put(prefix: str) -> list[str]:
+        if logger:
+            logger.info(f"Putting object {prefix}")
+        return await put_multiple_csv_objects(
+            bucket, prefix, dfs[prefix], size_max_mb, codec=codec
+        )
+
+    await run_async(_put, list(dfs), retries)
+    if logger:
+        logger.info("Upload finished")
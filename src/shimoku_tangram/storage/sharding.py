@@ -0,0 +1,417 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from shimoku_tangram.storage.manifest import (
+    build_manifest,
+    is_metadata,
+    list_shards,
+    manifest_key,
+)
+from shimoku_tangram.storage.tasks import run_async, run_threaded
+
+# Rows serialized to estimate the stored size of a row
+SAMPLE_ROWS = 5000
+# Contiguous blocks the sample is taken from, spread over the dataframe
+SAMPLE_BLOCKS = 10
+
+
+def estimate_bytes_per_row(
+    df: pd.DataFrame,
+    serialize: Callable[[pd.DataFrame], bytes],
+    sample_rows: int = SAMPLE_ROWS,
+) -> float:
+    """
+    Estimate the stored (serialized and compressed) size of a row. The
+    sample is made of contiguous blocks spread evenly over the dataframe, so
+    it compresses like a real shard while still covering all of the data.
+    """
+    if len(df) == 0:
+        return 0.0
+    if len(df) <= sample_rows:
+        sample = df
+    else:
+        block_rows = max(sample_rows // SAMPLE_BLOCKS, 1)
+        step = (len(df) - block_rows) / (SAMPLE_BLOCKS - 1)
+        sample = pd.concat(
+            [
+                df.iloc[int(i * step) : int(i * step) + block_rows]
+                for i in range(SAMPLE_BLOCKS)
+            ]
+        )
+    return len(serialize(sample)) / len(sample)
+
+
+def plan_shard_rows(
+    n_rows: int,
+    bytes_per_row: float,
+    size_max_mb: float,
+    min_rows: int = 1,
+    max_rows: int | None = None,
+) -> int:
+    """
+    Rows per shard so every shard stays under size_max_mb once stored and
+    all shards are about the same size, clamped to [min_rows, max_rows].
+    """
+    rows = n_rows
+    if n_rows > 0 and bytes_per_row > 0:
+        n_shards = math.ceil(n_rows * bytes_per_row / (size_max_mb * 1024**2))
+        rows = math.ceil(n_rows / max(n_shards, 1))
+    if max_rows is not None:
+        rows = min(rows, max_rows)
+    return max(rows, min_rows, 1)
+
+
+def generate_slices(df: pd.DataFrame, rows: int) -> Iterator[pd.DataFrame]:
+    """Generates slices of the DataFrame of the given number of rows."""
+    for start in range(0, len(df), rows):
+        yield df.iloc[start : start + rows]
+
+
+def put_shards(
+    prefix: str,
+    body: pd.DataFrame,
+    shard_rows: int,
+    extension: str,
+    put: Callable[[str, pd.DataFrame], dict],
+    max_workers: int,
+) -> list[dict]:
+    """
+    Serialize and upload the shards of a dataframe from a pool of
+    max_workers threads, put(key, df) returning the stored size and md5.
+    Shards are row slices, so only the ones being serialized take extra
+    memory. Returns the key, stored size, rows and md5 of every shard, in
+    shard order.
+    """
+    shards = list()
+    with ThreadPoolExecutor(max_workers) as executor:
+        tasks = []
+        for shard, df in plan_shards(prefix, body, shard_rows, extension):
+            shards.append(shard)
+            tasks.append(executor.submit(put, shard["key"], df))
+        for shard, task in zip(shards, tasks, strict=True):
+            stored = task.result()
+            shard["size"] = stored["size"]
+            shard["md5"] = stored["md5"]
+    return shards
+
+
+async def put_shards_async(
+    prefix: str,
+    body: pd.DataFrame,
+    shard_rows: int,
+    extension: str,
+    put: Callable[[str, pd.DataFrame], Awaitable[dict]],
+    max_workers: int,
+) -> list[dict]:
+    """
+    Async counterpart of put_shards, awaiting put(key, df) for up to
+    max_workers shards at once.
+    """
+    planned = list(plan_shards(prefix, body, shard_rows, extension))
+    # Bounds the serialized shards held in memory at once
+    putting = asyncio.Semaphore(max_workers)
+
+    async def _put(position: int) -> None:
+        shard, df = planned[position]
+        async with putting:
+            stored = await put(shard["key"], df)
+        shard["size"] = stored["size"]
+        shard["md5"] = stored["md5"]
+
+    await run_async(_put, list(range(len(planned))))
+    return [shard for shard, _ in planned]
+
+
+def plan_shards(
+    prefix: str, body: pd.DataFrame, shard_rows: int, extension: str
+) -> Iterator[tuple[dict, pd.DataFrame]]:
+    """
+    Yield the shard of every row slice of a dataframe, with a fresh key under
+    prefix and its rows, along with the slice.
+    """
+    for df in generate_slices(body, shard_rows):
+        key = os.path.join(prefix, str(uuid.uuid4()) + extension)
+        yield {"key": key, "rows": len(df)}, df
+
+
+def commit_shards(
+    prefix: str,
+    body: pd.DataFrame,
+    file_format: str,
+    shards: list[dict],
+    index_prefix: str | None,
+    manifest: bool,
+    update_index: Callable[[str | None, str, list[dict], list[dict] | None], None],
+    put_json: Callable[[str, dict], bool],
+) -> list[str]:
+    """
+    Record the stored shards of a prefix: in the partition index with
+    update_index(index_prefix, prefix, shards, manifest columns), which finds
+    the index of a date partition prefix itself when index_prefix is None,
+    then in its manifest with put_json(key, manifest). Returns the shard keys.
+    """
+    data = build_manifest(body, file_format, shards) if manifest and shards else None
+    columns = None if data is None else data["columns"]
+    update_index(index_prefix, prefix, shards, columns)
+    # The manifest goes last: once it exists every shard it lists is stored
+    if data is not None and not put_json(manifest_key(prefix), data):
+        raise OSError(f"Error uploading the manifest of {prefix}")
+    return [shard["key"] for shard in shards]
+
+
+async def commit_shards_async(
+    prefix: str,
+    body: pd.DataFrame,
+    file_format: str,
+    shards: list[dict],
+    manifest: bool,
+    update_index: Callable[[str, list[dict], list[dict] | None], Awaitable[None]],
+    put_json: Callable[[str, dict], Awaitable[bool]],
+) -> list[str]:
+    """
+    Async counterpart of commit_shards, where update_index(prefix, shards,
+    manifest columns) finds the index of a date partition prefix itself.
+    """
+    data = build_manifest(body, file_format, shards) if manifest and shards else None
+    await update_index(prefix, shards, None if data is None else data["columns"])
+    if data is not None and not await put_json(manifest_key(prefix), data):
+        raise OSError(f"Error uploading the manifest of {prefix}")
+    return [shard["key"] for shard in shards]
+
+
+def get_objects_threaded(
+    list_keys: list[str],
+    read: Callable[[str], pd.DataFrame],
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    Read every key with read(key) on a thread pool and concatenate the
+    results in key order, with pd.concat or, with assembly="preallocate",
+    concat_shards. Errors are raised like in tasks.run_threaded.
+    """
+    if assembly not in ("concat", "preallocate"):
+        raise ValueError(f"Unknown assembly mode: {assembly}")
+
+    def _get_object(key: str) -> pd.DataFrame:
+        if logger:
+            logger.info(f"Getting object {key}")
+        df = read(key)
+        if logger:
+            logger.info(f"Object {key} done")
+        return df
+
+    list_df = run_threaded(_get_object, list_keys, retries=retries)
+
+    if len(list_df) == 0:
+        raise ValueError("No data found")
+
+    try:
+        if assembly == "preallocate":
+            df = concat_shards(list_df)
+        else:
+            df = pd.concat(list_df, ignore_index=True)
+    except Exception as e:
+        raise ValueError("Error concatenating dataframes") from e
+
+    return df
+
+
+def get_shards_threaded(
+    shards: list[tuple[str, dict | None]],
+    read: Callable[[str, dict | None], pd.DataFrame],
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    Read shards listed like in manifest.list_shards like
+    get_objects_threaded, calling read(key, manifest entry).
+    """
+    entries = dict(shards)
+    return get_objects_threaded(
+        list(entries), lambda key: read(key, entries[key]), logger, retries, assembly
+    )
+
+
+def get_multiple_objects_threaded(
+    prefixes: list[str],
+    list_shards: Callable[[str], list[tuple[str, dict | None]]],
+    read: Callable[[str, dict | None], pd.DataFrame],
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+    assembly: str = "concat",
+) -> pd.DataFrame:
+    """
+    List the shards of every prefix with list_shards(prefix) on a thread
+    pool, then read them with get_shards_threaded.
+    """
+    shards = [
+        shard
+        for prefix_shards in run_threaded(list_shards, prefixes, retries=retries)
+        for shard in prefix_shards
+    ]
+    return get_shards_threaded(shards, read, logger, retries, assembly)
+
+
+async def get_multiple_objects_async(
+    prefixes: list[str],
+    list_shards: Callable[[str], Awaitable[list[tuple[str, dict | None]]]],
+    read: Callable[[str, dict | None], Awaitable[pd.DataFrame]],
+    logger: logging.Logger | None = None,
+    retries: int = 0,
+) -> pd.DataFrame:
+    """
+    Async counterpart of get_multiple_objects_threaded, with list_shards and
+    read coroutines. Results are concatenated with pd.concat.
+    """
+    shards = dict(
+        shard
+        for prefix_shards in await run_async(list_shards, prefixes, retries)
+        for shard in prefix_shards
+    )
+
+    async def _get_object(key: str) -> pd.DataFrame:
+        if logger:
+            logger.info(f"Getting object {key}")
+        df = await read(key, shards[key])
+        if logger:
+            logger.info(f"Object {key} done")
+        return df
+
+    list_df = await run_async(_get_object, list(shards), retries)
+    if len(list_df) == 0:
+        raise ValueError("No data found")
+    try:
+        return pd.concat(list_df, ignore_index=True)
+    except Exception as e:
+        raise ValueError("Error concatenating dataframes") from e
+
+
+async def list_prefix_shards_async(
+    prefix: str,
+    list_keys: Callable[[str], Awaitable[list[str]]],
+    get_manifest: Callable[[str], Awaitable[dict]],
+) -> list[tuple[str, dict | None]]:
+    """
+    List the shards under a prefix like manifest.list_shards, from
+    list_keys(prefix) and, when the listing has one, get_manifest(prefix).
+    """
+    keys = await list_keys(prefix)
+    manifest = await get_manifest(prefix) if manifest_key(prefix) in keys else None
+    return list_shards(prefix, keys, manifest)
+
+
+def list_folder_shards(
+    list_keys: list[str],
+    get_manifest: Callable[[str], dict | None],
+    retries: int = 0,
+) -> list[tuple[str, dict | None]]:
+    """
+    List the shards of keys listed from several folders like
+    manifest.list_shards, fetching get_manifest(folder), on a thread pool,
+    only for the folders whose listing has a manifest. Folders with no data
+    shards, only metadata, are skipped.
+    """
+    folders = {}
+    for key in list_keys:
+        folders.setdefault(key.rsplit("/", 1)[0], []).append(key)
+    folders = {
+        folder: keys
+        for folder, keys in folders.items()
+        if any(not key.endswith("/") and not is_metadata(key) for key in keys)
+    }
+
+    def _list_shards(folder: str) -> list[tuple[str, dict | None]]:
+        keys = folders[folder]
+        manifest = get_manifest(folder) if manifest_key(folder) in keys else None
+        return list_shards(folder, keys, manifest)
+
+    return [
+        shard
+        for folder_shards in run_threaded(_list_shards, list(folders), retries=retries)
+        for shard in folder_shards
+    ]
+
+
+def concat_shards(list_df: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate shards that share the same columns into a dataframe with a
+    fresh index, emptying list_df as it goes. Numpy columns are copied into
+    preallocated arrays, whose pages are only committed as they are filled,
+    and every shard is released right after being copied, so peak memory
+    stays close to the size of the result instead of twice it. Extension
+    dtype columns and shards with differing columns use pd.concat.
+    """
+    columns = list_df[0].columns
+    if columns.has_duplicates or any(
+        not df.columns.equals(columns) for df in list_df[1:]
+    ):
+        df = pd.concat(list_df, ignore_index=True)
+        list_df.clear()
+        return df
+
+    total_rows = sum(len(df) for df in list_df)
+    arrays = {}
+    pieces = {}
+    for i in range(len(columns)):
+        dtypes = {df.dtypes.iloc[i] for df in list_df}
+        dtype = dtypes.pop()
+        if not dtypes and isinstance(dtype, np.dtype):
+            arrays[i] = np.empty(total_rows, dtype=dtype)
+        else:
+            pieces[i] = []
+
+    position = 0
+    for n in range(len(list_df)):
+        df = list_df[n]
+        for i, values in arrays.items():
+            values[position : position + len(df)] = df.iloc[:, i].to_numpy()
+        for i, column_pieces in pieces.items():
+            column_pieces.append(df.iloc[:, i])
+        position += len(df)
+        list_df[n] = None
+    list_df.clear()
+
+    data = {}
+    for i, column in enumerate(columns):
+        if i in arrays:
+            data[column] = arrays.pop(i)
+        else:
+            data[column] = pd.concat(pieces.pop(i), ignore_index=True)
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def rechunk(dfs: Iterable[pd.DataFrame], rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Regroup a stream of DataFrames into chunks of the given number of rows
+    (the last one may be shorter), each with a fresh index.
+    """
+    if rows < 1:
+        raise ValueError("rows must be positive")
+
+    pending = []
+    n_pending = 0
+    for df in dfs:
+        start = 0
+        while n_pending + len(df) - start >= rows:
+            stop = start + rows - n_pending
+            pending.append(df.iloc[start:stop])
+            yield pd.concat(pending, ignore_index=True)
+            pending = []
+            n_pending = 0
+            start = stop
+        if start < len(df):
+            pending.append(df.iloc[start:])
+            n_pending += len(df) - start
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
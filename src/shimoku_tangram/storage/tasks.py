@@ -0,0 +1,169 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TypeVar
+
+from shimoku_tangram.reporting.logging import init_logger
+
+
+logger = init_logger(__name__)
+
+K = TypeVar("K")
+R = TypeVar("R")
+
+_DONE = object()
+
+
+class ThreadedTaskError(Exception):
+    """
+    Raised when tasks of a threaded storage helper fail. errors maps the key
+    of every failed task (object key, prefix, ...) to its exception.
+    """
+
+    def __init__(self, errors: dict[str, Exception]):
+        self.errors = errors
+        keys = ", ".join(list(errors)[:10])
+        if len(errors) > 10:
+            keys += f" and {len(errors) - 10} more"
+        super().__init__(f"{len(errors)} task(s) failed: {keys}")
+
+
+def batched(items: Iterable[K], size: int) -> Iterator[list[K]]:
+    """
+    Split items into lists of size items, the last one possibly shorter.
+    items is consumed lazily.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _with_retries(func: Callable[[K], R], retries: int) -> Callable[[K], R]:
+    def _run(key: K) -> R:
+        for attempt in range(retries + 1):
+            try:
+                return func(key)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"Retrying {key} (attempt {attempt + 1}): {e}")
+
+    return _run
+
+
+def run_threaded(
+    func: Callable[[K], R],
+    keys: list[K],
+    max_workers: int | None = None,
+    retries: int = 0,
+) -> list[R]:
+    """
+    Run func for every key on a thread pool and return the results in the
+    order of keys. A failed key is retried up to retries times; once a key
+    has failed for good the tasks that have not started yet are cancelled,
+    and a ThreadedTaskError with every failure is raised.
+    """
+
+    _run = _with_retries(func, retries)
+    errors = {}
+    with ThreadPoolExecutor(max_workers) as executor:
+        tasks = {executor.submit(_run, key): key for key in keys}
+        for task in as_completed(tasks):
+            if task.cancelled() or task.exception() is None:
+                continue
+            errors[str(tasks[task])] = task.exception()
+            for pending in tasks:
+                pending.cancel()
+
+    if errors:
+        raise ThreadedTaskError(errors)
+    return [task.result() for task in tasks]
+
+
+def iter_threaded(
+    func: Callable[[K], R],
+    keys: Iterable[K],
+    prefetch: int = 2,
+    retries: int = 0,
+) -> Iterator[R]:
+    """
+    Yield func(key) for every key in order while the next prefetch keys are
+    already running in the background. Asking for the next result submits
+    one more key first, so up to prefetch + 1 tasks are pending besides the
+    result the consumer still holds. keys is consumed lazily. A key that
+    still fails after retries raises a ThreadedTaskError; closing the
+    iterator cancels the tasks that have not started yet.
+    """
+    if prefetch < 0:
+        raise ValueError("prefetch must be non-negative")
+
+    _run = _with_retries(func, retries)
+    keys = iter(keys)
+    executor = ThreadPoolExecutor(max(prefetch, 1))
+    pending = deque()
+    try:
+        while True:
+            while len(pending) <= prefetch:
+                key = next(keys, _DONE)
+                if key is _DONE:
+                    break
+                pending.append((key, executor.submit(_run, key)))
+            if not pending:
+                return
+            key, task = pending.popleft()
+            try:
+                result = task.result()
+            except Exception as e:
+                raise ThreadedTaskError({str(key): e}) from e
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def run_async(
+    func: Callable[[K], Awaitable[R]],
+    keys: list[K],
+    retries: int = 0,
+) -> list[R]:
+    """
+    Await func for every key concurrently and return the results in the
+    order of keys. Concurrency is bounded by func itself (the async storage
+    modules cap their requests in flight). Errors are handled like in
+    run_threaded: once a key has failed for good the other tasks are
+    cancelled and a ThreadedTaskError with every failure is raised.
+    """
+
+    async def _run(key: K) -> R:
+        for attempt in range(retries + 1):
+            try:
+                return await func(key)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"Retrying {key} (attempt {attempt + 1}): {e}")
+
+    if not keys:
+        return []
+    tasks = [asyncio.ensure_future(_run(key)) for key in keys]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # Also reached when the caller is cancelled
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    errors = {
+        str(key): task.exception()
+        for key, task in zip(keys, tasks, strict=True)
+        if not task.cancelled() and task.exception() is not None
+    }
+    if errors:
+        raise ThreadedTaskError(errors)
+    return [task.result() for task in tasks]
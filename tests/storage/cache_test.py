@@ -0,0 +1,102 @@
+import os
+from shimoku_tangram.storage.cache import DiskCache, MemoryCache
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+
+class TestDiskCache(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_put(self):
+        cache = DiskCache(self.directory.name)
+
+        self.assertIsNone(cache.get("s3://bucket/key"))
+        cache.put("s3://bucket/key", '"etag"', b"body\nwith lines")
+
+        self.assertEqual(cache.get("s3://bucket/key"), ('"etag"', b"body\nwith lines"))
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskCache(self.directory.name, max_size_mb=2.5 / 1024)
+        cache.put("a", "1", b"a" * 1000)
+        cache.put("b", "1", b"b" * 1000)
+        os.utime(cache._path("a"), (0, 0))
+        os.utime(cache._path("b"), (1, 1))
+        cache.get("a")
+
+        cache.put("c", "1", b"c" * 1000)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_skips_bodies_larger_than_the_cache(self):
+        cache = DiskCache(self.directory.name, max_size_mb=1 / 1024)
+
+        cache.put("a", "1", b"a" * 2000)
+
+        self.assertIsNone(cache.get("a"))
+
+    def test_evicts_only_over_the_tracked_size(self):
+        cache = DiskCache(self.directory.name, max_size_mb=2.5 / 1024)
+        cache.put("a", "1", b"a" * 1000)
+
+        with patch.object(cache, "_evict", wraps=cache._evict) as mock_evict:
+            cache.put("a", "2", b"a" * 1000)
+            cache.put("b", "1", b"b" * 1000)
+            mock_evict.assert_not_called()
+            cache.put("c", "1", b"c" * 1000)
+            mock_evict.assert_called_once()
+
+        self.assertLessEqual(cache._size, cache.max_size)
+
+    def test_clear_keeps_other_files(self):
+        other = os.path.join(self.directory.name, "notes.txt")
+        with open(other, "w") as f:
+            f.write("keep")
+        cache = DiskCache(self.directory.name)
+        cache.put("a", "1", b"a")
+
+        cache.clear()
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(os.listdir(self.directory.name), ["notes.txt"])
+
+
+class TestMemoryCache(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = MemoryCache(max_size_mb=2.5 / 1024)
+        cache.put("a", b"a" * 1000)
+        cache.put("b", b"b" * 1000)
+        cache.get("a")
+
+        cache.put("c", b"c" * 1000)
+
+        self.assertEqual(cache.get("a"), b"a" * 1000)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), b"c" * 1000)
+
+    @patch("shimoku_tangram.storage.cache.time.monotonic")
+    def test_expires(self, mock_monotonic):
+        cache = MemoryCache(ttl_seconds=10)
+        mock_monotonic.return_value = 100
+        cache.put("a", b"a")
+
+        mock_monotonic.return_value = 109
+        self.assertEqual(cache.get("a"), b"a")
+        mock_monotonic.return_value = 110
+        self.assertIsNone(cache.get("a"))
+
+    def test_invalidate_prefix(self):
+        cache = MemoryCache()
+        cache.put("object:bucket/path/a", b"a")
+        cache.put("object:bucket/other", b"b")
+
+        cache.invalidate_prefix("object:bucket/path/")
+
+        self.assertIsNone(cache.get("object:bucket/path/a"))
+        self.assertEqual(cache.get("object:bucket/other"), b"b")
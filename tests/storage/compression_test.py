@@ -0,0 +1,123 @@
+import gzip
+from io import BytesIO
+import math
+import pandas as pd
+from shimoku_tangram.storage import compression
+from unittest import TestCase
+import zlib
+
+
+class TestCompression(TestCase):
+    def test_codecs_roundtrip(self):
+        data = b"".join(str(i).encode() for i in range(10000))
+
+        for name in ["gzip", "zstd", "lz4"]:
+            with self.subTest(name):
+                codec = compression.get_codec(name)
+
+                compressed = codec.compress(data)
+                streamed = b"".join(codec.iter_compress([data[:100], b"", data[100:]]))
+
+                self.assertLess(len(compressed), len(data))
+                self.assertEqual(codec.decompress(compressed), data)
+                self.assertEqual(codec.decompress(streamed), data)
+                with codec.open(BytesIO(streamed)) as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_gzip_level(self):
+        data = b"".join(str(i).encode() for i in range(10000))
+
+        fast = compression.GzipCodec(level=1).compress(data)
+
+        self.assertEqual(gzip.decompress(fast), data)
+        # The XFL byte of the gzip header records the fastest/best levels
+        self.assertEqual(fast[8], 4)
+        self.assertEqual(compression.GzipCodec().compress(data)[8], 2)
+
+    def test_get_codec_unknown(self):
+        with self.assertRaises(ValueError) as context:
+            compression.get_codec("brotli")
+
+        self.assertEqual(str(context.exception), "Unknown codec: brotli")
+
+    def test_codec_is_abstract(self):
+        class PartialCodec(compression.Codec):
+            name = "partial"
+
+            def compress(self, data: bytes) -> bytes:
+                return data
+
+        with self.assertRaises(TypeError):
+            PartialCodec()
+
+    def test_resolve_codec(self):
+        self.assertEqual(compression.resolve_codec("a/b.csv.zst").name, "zstd")
+        self.assertEqual(compression.resolve_codec("a/b.pkl.lz4").name, "lz4")
+        self.assertEqual(compression.resolve_codec("a/b.json.gz").name, "gzip")
+        self.assertEqual(compression.resolve_codec("a/b.json").name, "gzip")
+        self.assertEqual(compression.resolve_codec("a/b.gz", "zstd").name, "zstd")
+        self.assertIsNone(compression.codec_of_key("a/b.json"))
+
+    def test_iter_compressed_csv_parts(self):
+        df = pd.DataFrame({"a": range(5000), "b": [f"v{i}" for i in range(5000)]})
+
+        for name in ["gzip", "zstd", "lz4"]:
+            with self.subTest(name):
+                parts = list(
+                    compression.iter_compressed_csv(df, 1000, name, chunk_rows=500)
+                )
+                data = compression.get_codec(name).decompress(b"".join(parts))
+
+                self.assertGreater(len(parts), 1)
+                self.assertTrue(all(parts))
+                pd.testing.assert_frame_equal(pd.read_csv(BytesIO(data)), df)
+
+    def test_compress_blocks(self):
+        compression.configure_compression(block_size_mb=64 / 1024, max_workers=4)
+        self.addCleanup(compression.configure_compression)
+        data = b"".join(str(i).encode() for i in range(100000))
+
+        for name in ["gzip", "zstd", "lz4"]:
+            with self.subTest(name):
+                codec = compression.get_codec(name)
+
+                compressed = compression.compress_blocks(data, codec)
+
+                self.assertEqual(codec.decompress(compressed), data)
+                with codec.open(BytesIO(compressed)) as f:
+                    self.assertEqual(f.read(), data)
+        # Every 64 KB block is a gzip member of its own
+        members = compression.compress_blocks(data, "gzip").count(b"\x1f\x8b\x08")
+        self.assertEqual(members, math.ceil(len(data) / (64 * 1024)))
+        self.assertEqual(gzip.decompress(compression.compress_blocks(data)), data)
+
+    def test_compress_blocks_small_or_single_worker(self):
+        data = b"".join(str(i).encode() for i in range(100000))
+
+        compression.configure_compression(block_size_mb=64 / 1024, max_workers=1)
+        self.addCleanup(compression.configure_compression)
+        single = compression.compress_blocks(data, "gzip")
+        compression.configure_compression(max_workers=4)
+        small = compression.compress_blocks(data, "gzip")
+
+        for compressed in [single, small]:
+            # A single gzip member, with nothing left after it
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self.assertEqual(decompressor.decompress(compressed), data)
+            self.assertTrue(decompressor.eof)
+            self.assertEqual(decompressor.unused_data, b"")
+
+    def test_iter_compressed_csv_blocks(self):
+        compression.configure_compression(block_size_mb=16 / 1024, max_workers=4)
+        self.addCleanup(compression.configure_compression)
+        df = pd.DataFrame({"a": range(5000), "b": [f"v{i}" for i in range(5000)]})
+
+        for name in ["gzip", "zstd"]:
+            with self.subTest(name):
+                parts = list(
+                    compression.iter_compressed_csv(df, 1000, name, chunk_rows=500)
+                )
+                data = compression.get_codec(name).decompress(b"".join(parts))
+
+                self.assertTrue(all(parts))
+                pd.testing.assert_frame_equal(pd.read_csv(BytesIO(data)), df)
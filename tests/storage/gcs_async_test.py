@@ -0,0 +1,200 @@
+import asyncio
+from gzip import compress, decompress
+import json
+import pandas as pd
+from shimoku_tangram.storage import gcs_async
+from shimoku_tangram.storage.aio import AsyncTransport
+from google.api_core.exceptions import Forbidden, NotFound
+import httpx
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from urllib.parse import unquote
+
+
+class FakeGCS:
+    """
+    In-memory GCS speaking the JSON API, for an httpx.MockTransport.
+    """
+
+    def __init__(self):
+        self.store = {}
+        self.generations = {}
+        self.forbidden = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = 0
+        self.delay = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"] == "Bearer token"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                return httpx.Response(503)
+            return self._handle(request)
+        finally:
+            self.in_flight -= 1
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.raw_path.decode().split("?")[0]
+        params = request.url.params
+        if request.method == "POST" and path.startswith("/upload/"):
+            key = params["name"]
+            generation = params.get("ifGenerationMatch")
+            if generation is not None and int(generation) != self.generations.get(
+                key, 0
+            ):
+                return self._error(412)
+            self.store[key] = request.content
+            self.generations[key] = self.generations.get(key, 0) + 1
+            return httpx.Response(200, json={"name": key})
+        if "/o/" not in path:
+            items = [
+                {"name": name, "size": str(len(body))}
+                for name, body in sorted(self.store.items())
+                if name.startswith(params["prefix"])
+            ]
+            return httpx.Response(200, json={"items": items})
+        key = unquote(path.split("/o/", 1)[1])
+        if key in self.forbidden:
+            return self._error(403)
+        if key not in self.store:
+            return self._error(404)
+        if request.method == "DELETE":
+            del self.store[key]
+            return httpx.Response(204)
+        return httpx.Response(
+            200,
+            content=self.store[key],
+            headers={"x-goog-generation": str(self.generations[key])},
+        )
+
+    @staticmethod
+    def _error(status: int) -> httpx.Response:
+        return httpx.Response(
+            status, json={"error": {"code": status, "message": "error"}}
+        )
+
+
+class TestGCSAsync(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gcs = FakeGCS()
+        credentials = SimpleNamespace(valid=True, token="token")
+        for target, value in [
+            ("_auth", gcs_async._GoogleAuth()),
+            ("_transport", self._transport(max_concurrency=64)),
+        ]:
+            patcher = patch.object(gcs_async, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch(
+            "shimoku_tangram.storage.gcs_async.google.auth.default",
+            return_value=(credentials, "project"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _transport(self, **kwargs) -> AsyncTransport:
+        return AsyncTransport(transport=httpx.MockTransport(self.gcs), **kwargs)
+
+    async def test_object_roundtrip(self):
+        self.assertTrue(
+            await gcs_async.put_json_object("bucket", "a/b c.json.gz", {"a": 1})
+        )
+
+        actual = await gcs_async.get_json_object("bucket", "a/b c.json.gz")
+
+        self.assertEqual(actual, {"a": 1})
+        self.assertEqual(
+            await gcs_async.list_objects_key("bucket", "a/"), ["a/b c.json.gz"]
+        )
+        self.assertTrue(await gcs_async.delete_object("bucket", "a/b c.json.gz"))
+        with self.assertRaises(NotFound):
+            await gcs_async.get_object("bucket", "a/b c.json.gz")
+
+    async def test_csv_objects_roundtrip(self):
+        df = pd.DataFrame({"a": range(10), "b": ["0012"] * 10})
+        self.gcs.store["path/stale.csv.gz"] = b""
+
+        keys = await gcs_async.put_multiple_csv_objects(
+            "bucket", "path", df, max_rows_per_shard=4
+        )
+        actual = await gcs_async.get_multiple_csv_objects_threaded("bucket", ["path"])
+
+        self.assertEqual(len(keys), 3)
+        self.assertNotIn("path/stale.csv.gz", self.gcs.store)
+        self.assertIn("path/_manifest.json", self.gcs.store)
+        pd.testing.assert_frame_equal(actual, df)
+
+    async def test_partition_index_follows_writers_and_clear_path(self):
+        df = pd.DataFrame({"a": range(10)})
+        index = {"version": 1, "partitions": {"2024/01/05": [{"key": "x"}]}}
+        self.gcs.store["data/_partitions.json.gz"] = compress(
+            json.dumps(index).encode("utf-8")
+        )
+        self.gcs.generations["data/_partitions.json.gz"] = 1
+
+        keys = await gcs_async.put_multiple_csv_objects(
+            "bucket", "data/2024/01/06", df, max_rows_per_shard=4
+        )
+        stored = json.loads(decompress(self.gcs.store["data/_partitions.json.gz"]))
+        await gcs_async.clear_path("bucket", "data/2024/01/06")
+        cleared = json.loads(decompress(self.gcs.store["data/_partitions.json.gz"]))
+
+        self.assertEqual(
+            [entry["key"] for entry in stored["partitions"]["2024/01/06"]], keys
+        )
+        self.assertEqual(
+            stored["columns"], {"2024/01/06": [{"name": "a", "dtype": "int64"}]}
+        )
+        self.assertEqual(cleared["partitions"], index["partitions"])
+        self.assertEqual(cleared["columns"], {})
+
+    async def test_delete_objects_reports_errors(self):
+        self.gcs.store = {f"k{i}": b"x" for i in range(20)}
+        self.gcs.forbidden = {"k3"}
+        self.gcs.delay = 0.01
+
+        with patch.object(gcs_async, "_transport", self._transport(max_concurrency=3)):
+            failures = await gcs_async.delete_objects(
+                "bucket", [f"k{i}" for i in range(21)]
+            )
+
+        self.assertEqual(list(failures), ["k3"])
+        self.assertIsInstance(failures["k3"], str)
+        self.assertEqual(list(self.gcs.store), ["k3"])
+        self.assertEqual(self.gcs.max_in_flight, 3)
+
+    async def test_requests_in_flight_are_bounded(self):
+        self.gcs.store = {f"k{i}": b"x" for i in range(20)}
+        self.gcs.generations = {f"k{i}": 1 for i in range(20)}
+        self.gcs.delay = 0.01
+
+        with patch.object(gcs_async, "_transport", self._transport(max_concurrency=3)):
+            actual = await asyncio.gather(
+                *(gcs_async.get_object("bucket", f"k{i}", False) for i in range(20))
+            )
+
+        self.assertEqual(actual, [b"x"] * 20)
+        self.assertEqual(self.gcs.max_in_flight, 3)
+
+    @patch("shimoku_tangram.storage.aio.MAX_BACKOFF", 0)
+    async def test_transient_errors_are_retried(self):
+        self.gcs.store["k"] = b"x"
+        self.gcs.generations["k"] = 1
+        self.gcs.failures = 2
+
+        actual = await gcs_async.get_object("bucket", "k", compressed=False)
+
+        self.assertEqual(actual, b"x")
+
+    async def test_forbidden_error_is_raised(self):
+        self.gcs.store["k"] = b"x"
+        self.gcs.forbidden = {"k"}
+
+        with self.assertRaises(Forbidden):
+            await gcs_async.get_object("bucket", "k", compressed=False)
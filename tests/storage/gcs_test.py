@@ -0,0 +1,149 @@
+import pandas as pd
+import random
+from shimoku_tangram.storage import gcs
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+
+class TestGCS(TestCase):
+    def setUp(self):
+        gcs.reset_clients()
+        self.addCleanup(gcs.reset_clients)
+        patchers = {
+            "client": patch("shimoku_tangram.storage.gcs.storage.Client"),
+            "session": patch("shimoku_tangram.storage.gcs.AuthorizedSession"),
+            "auth": patch(
+                "shimoku_tangram.storage.gcs.google.auth.default",
+                return_value=("credentials", "project"),
+            ),
+        }
+        self.mocks = {name: patcher.start() for name, patcher in patchers.items()}
+        for patcher in patchers.values():
+            self.addCleanup(patcher.stop)
+        self.bucket = self.mocks["client"].return_value.bucket.return_value
+
+    def test_get_client_is_shared(self):
+        gcs.bucket_exists("test", "project")
+        gcs.list_objects_key("test", project_id="project")
+
+        client = gcs.get_client("project")
+
+        self.assertIs(client, self.mocks["client"].return_value)
+        self.mocks["client"].assert_called_once_with(
+            project="project",
+            credentials="credentials",
+            _http=self.mocks["session"].return_value,
+        )
+        self.mocks["session"].assert_called_once_with("credentials")
+        scheme, adapter = self.mocks["session"].return_value.mount.call_args.args
+        self.assertEqual(scheme, "https://")
+        self.assertEqual(adapter._pool_maxsize, 50)
+
+    def test_configure_client(self):
+        gcs.get_client("project")
+        gcs.configure_client(max_pool_connections=10)
+        self.addCleanup(gcs.configure_client)
+        gcs.get_client("project")
+
+        self.assertEqual(self.mocks["client"].call_count, 2)
+        _, adapter = self.mocks["session"].return_value.mount.call_args.args
+        self.assertEqual(adapter._pool_maxsize, 10)
+
+    def test_iter_objects_metadata_is_lazy(self):
+        pages = [
+            [
+                SimpleNamespace(
+                    name=f"p/{page}{i}", size=i, time_created=None, etag="e"
+                )
+                for i in range(2)
+            ]
+            for page in "ab"
+        ]
+        fetched = []
+
+        def _list_blobs(prefix):
+            for page in pages:
+                fetched.append(page)
+                yield from page
+
+        self.bucket.list_blobs.side_effect = _list_blobs
+
+        objects = gcs.iter_objects_metadata("test", "p/", "project")
+        first = next(objects)
+
+        self.assertEqual(first["Key"], "p/a0")
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual([obj["Key"] for obj in objects], ["p/a1", "p/b0", "p/b1"])
+        self.assertEqual(len(fetched), 2)
+        self.bucket.list_blobs.assert_called_once_with(prefix="p/")
+
+    def fake_batches(self, statuses: dict[str, int]) -> list[list[str]]:
+        """
+        Answer the batch requests of the mocked bucket with the status of
+        every deleted key (200 by default), and return the keys of every
+        batch.
+        """
+        batches = []
+
+        def _delete_blob(key):
+            batches[-1].append(key)
+
+        def _finish(batch, raise_exception=True):
+            self.assertFalse(raise_exception)
+            return [
+                SimpleNamespace(status_code=statuses.get(key, 200), text="error")
+                for key in batches[-1]
+            ]
+
+        self.bucket.delete_blob.side_effect = _delete_blob
+        client = self.bucket.client
+        client._push_batch.side_effect = lambda batch: batches.append([])
+        patcher = patch("google.cloud.storage.batch.Batch.finish", _finish)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return batches
+
+    def test_delete_objects_reports_errors(self):
+        keys = [f"key{i}" for i in range(250)]
+        batches = self.fake_batches({"key5": 404, "key150": 403})
+
+        failures = gcs.delete_objects(
+            "test", iter(keys), max_workers=1, project_id="project"
+        )
+
+        self.assertEqual([len(batch) for batch in batches], [100, 100, 50])
+        self.assertEqual(failures, {"key150": "403: error"})
+
+    def test_clear_path_error(self):
+        self.bucket.list_blobs.return_value = [
+            SimpleNamespace(name=name, size=1, time_created=None, etag="e")
+            for name in ["p/a", "p/b"]
+        ]
+        self.fake_batches({"p/b": 403})
+
+        self.assertFalse(gcs.clear_path("test", "p/", "project"))
+        self.assertEqual(self.bucket.delete_blob.call_count, 2)
+
+    @patch("shimoku_tangram.storage.gcs.CSV_UPLOAD_CHUNK_SIZE", 256 * 1024)
+    def test_put_csv_object_aborts_streaming_upload(self):
+        # Random text compresses poorly, so it takes several upload chunks
+        df = pd.DataFrame({"a": [random.randbytes(64).hex() for _ in range(2**16)]})
+        blob = self.bucket.blob.return_value
+        blob.create_resumable_upload_session.return_value = "session-url"
+        session = self.mocks["session"].return_value
+        session.put.side_effect = [
+            SimpleNamespace(status_code=308),
+            OSError("connection reset"),
+        ]
+
+        with self.assertRaises(OSError):
+            gcs._put_csv_object("test", "p/a.csv.gz", df, project_id="project")
+
+        self.bucket.blob.assert_called_once_with("p/a.csv.gz")
+        self.assertEqual(session.put.call_count, 2)
+        for call in session.put.call_args_list:
+            self.assertEqual(call.args, ("session-url",))
+            self.assertEqual(len(call.kwargs["data"]), 256 * 1024)
+            self.assertTrue(call.kwargs["headers"]["Content-Range"].endswith("/*"))
+        session.delete.assert_called_once_with("session-url")
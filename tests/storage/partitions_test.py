@@ -0,0 +1,292 @@
+from datetime import datetime
+import pandas as pd
+from shimoku_tangram.storage import partitions
+from unittest import TestCase
+
+
+class TestPartitions(TestCase):
+    def test_partition_of(self):
+        self.assertEqual(
+            partitions.partition_of("data", "data/2024/01/05/a.csv.gz"), "2024/01/05"
+        )
+        self.assertIsNone(partitions.partition_of("data", "data/2024/01/a.csv.gz"))
+        self.assertIsNone(partitions.partition_of("data", "other/2024/01/05/a"))
+
+    def test_partition_of_prefix(self):
+        self.assertEqual(
+            partitions.partition_of_prefix("data", "data/2024/01/05/"), "2024/01/05"
+        )
+        with self.assertRaises(ValueError):
+            partitions.partition_of_prefix("data", "data/2024/01/05/hour=1")
+
+    def test_split_partition_prefix_and_dataset_of(self):
+        self.assertEqual(
+            partitions.split_partition_prefix("a/data/2024/01/05/"),
+            ("a/data", "2024/01/05"),
+        )
+        self.assertIsNone(partitions.split_partition_prefix("data/2024/01"))
+        self.assertIsNone(partitions.split_partition_prefix("data/2024/01/05/x"))
+        self.assertEqual(partitions.dataset_of("data/2024"), "data")
+        self.assertEqual(partitions.dataset_of("data/2024/01/05/a.csv"), "data")
+        self.assertIsNone(partitions.dataset_of("data"))
+        self.assertIsNone(partitions.dataset_of("data/20240"))
+        self.assertIsNone(partitions.dataset_of("models/2024/model.pkl"))
+        self.assertIsNone(partitions.dataset_of("ids/1234"))
+        self.assertIsNone(partitions.dataset_of("data/2024/13"))
+        self.assertEqual(partitions.dataset_of("data/2024/01/"), "data")
+
+    def test_clear_partitions(self):
+        index = partitions.new_index()
+        partitions.set_partition(index, "2024/01/01", [{"key": "d/2024/01/01/a"}])
+        partitions.set_partition(
+            index, "2024/01/02", [{"key": "d/2024/01/02/a"}, {"key": "d/2024/01/02/b"}]
+        )
+        partitions.set_partition(index, "2024/02/01", [{"key": "d/2024/02/01/a"}])
+
+        partitions.clear_partitions(index, "d/2024/01", {"d/2024/01/02/b"})
+
+        self.assertEqual(
+            index["partitions"],
+            {
+                "2024/01/02": [{"key": "d/2024/01/02/b"}],
+                "2024/02/01": [{"key": "d/2024/02/01/a"}],
+            },
+        )
+
+    def test_keys_between_dates(self):
+        index = partitions.build_index(
+            "data",
+            [
+                {"Key": f"data/2024/01/{day:02d}/a.csv.gz", "Size": 10}
+                for day in (31, 2, 1, 3)
+            ]
+            + [{"Key": "data/_partitions.json.gz", "Size": 10}],
+        )
+
+        actual = partitions.keys_between_dates(
+            index, datetime(2024, 1, 2), datetime(2024, 1, 31)
+        )
+
+        self.assertEqual(
+            actual,
+            [
+                "data/2024/01/02/a.csv.gz",
+                "data/2024/01/03/a.csv.gz",
+                "data/2024/01/31/a.csv.gz",
+            ],
+        )
+
+    def test_build_index_with_manifests(self):
+        columns = [{"name": "a", "dtype": "int64"}]
+        manifest = {
+            "columns": columns,
+            "shards": [{"key": "data/2024/01/01/a.csv", "size": 3, "rows": 2}],
+        }
+        fetched = []
+
+        def _get_manifest(folder):
+            fetched.append(folder)
+            return manifest
+
+        index = partitions.build_index(
+            "data",
+            [
+                {"Key": key, "Size": 3}
+                for key in [
+                    "data/2024/01/01/_manifest.json",
+                    "data/2024/01/01/a.csv",
+                    "data/2024/01/01/stale.csv",
+                    "data/2024/01/02/b.csv",
+                ]
+            ],
+            _get_manifest,
+        )
+
+        self.assertEqual(fetched, ["data/2024/01/01"])
+        self.assertEqual(
+            partitions.shards_between_dates(
+                index, datetime(2024, 1, 1), datetime(2024, 1, 2)
+            ),
+            [
+                (
+                    "data/2024/01/01/a.csv",
+                    {
+                        "key": "data/2024/01/01/a.csv",
+                        "size": 3,
+                        "rows": 2,
+                        "columns": columns,
+                    },
+                ),
+                ("data/2024/01/02/b.csv", None),
+            ],
+        )
+        partitions.clear_partitions(index, "data/2024/01/02", set())
+        self.assertEqual(index["columns"], {"2024/01/01": columns})
+        partitions.clear_partitions(index, "data/2024/01/01", set())
+        self.assertEqual(index["columns"], {})
+
+    def test_list_shards_between_dates(self):
+        keys = [
+            "data/2024/01/01/_manifest.json",
+            "data/2024/01/01/a.csv",
+            "data/2024/01/02/b.csv",
+            "data/2024/01/03/c.csv",
+        ]
+        manifest = {"columns": [], "shards": [{"key": "data/2024/01/01/a.csv"}]}
+        fetched = []
+
+        def _get_manifest(folder):
+            fetched.append(folder)
+            return manifest
+
+        actual = partitions.list_shards_between_dates(
+            "data",
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 2),
+            lambda prefix: None,
+            lambda prefix, start_date, end_date: keys,
+            _get_manifest,
+            lambda key: not key.startswith("data/2024/01/03"),
+        )
+
+        self.assertEqual(fetched, ["data/2024/01/01"])
+        self.assertEqual(
+            actual,
+            [
+                (
+                    "data/2024/01/01/a.csv",
+                    {"key": "data/2024/01/01/a.csv", "columns": []},
+                ),
+                ("data/2024/01/02/b.csv", None),
+            ],
+        )
+
+        index = partitions.new_index()
+        partitions.set_partition(index, "2024/01/01", [{"key": "a"}], [])
+        actual = partitions.list_shards_between_dates(
+            "data",
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 2),
+            lambda prefix: index,
+            None,
+            None,
+        )
+
+        self.assertEqual(actual, [("a", {"key": "a", "columns": []})])
+
+    def test_set_partition(self):
+        index = partitions.new_index()
+        partitions.set_partition(index, "2024/01/01", [{"key": "a"}])
+        partitions.set_partition(index, "2024/01/02", [{"key": "b"}])
+
+        partitions.set_partition(index, "2024/01/01", [])
+
+        self.assertEqual(index["partitions"], {"2024/01/02": [{"key": "b"}]})
+
+    def test_partition_groups(self):
+        df = pd.DataFrame(
+            {
+                "ts": pd.to_datetime(
+                    ["2024-01-02 10:00", "2024-01-01 00:00", "2024-01-02 23:00"]
+                ),
+                "country": ["ES", "a/b", None],
+            }
+        )
+
+        actual = partitions.partition_groups(df, ["country"], "ts")
+
+        self.assertEqual(
+            {path: list(positions) for path, positions in actual.items()},
+            {
+                "2024/01/01/country=a%2Fb": [1],
+                "2024/01/02/country=ES": [0],
+                "2024/01/02/country=__HIVE_DEFAULT_PARTITION__": [2],
+            },
+        )
+        with self.assertRaises(ValueError):
+            partitions.partition_groups(df)
+
+    def test_partition_values(self):
+        self.assertEqual(
+            partitions.partition_values(
+                "data",
+                "data/2024/01/01/country=a%2Fb/n=__HIVE_DEFAULT_PARTITION__/x.csv",
+            ),
+            {"country": "a/b", "n": None},
+        )
+
+    def test_match_partition(self):
+        values = {"country": "ES", "n": "3", "day": "2024-01-02"}
+
+        self.assertTrue(partitions.match_partition(values, None))
+        self.assertTrue(partitions.match_partition(values, [("country", "=", "ES")]))
+        self.assertFalse(partitions.match_partition(values, [("n", ">", 3)]))
+        self.assertTrue(partitions.match_partition(values, [("n", "in", [1, 3])]))
+        self.assertFalse(
+            partitions.match_partition(
+                values, [("day", "<", datetime(2024, 1, 2)), ("country", "=", "ES")]
+            )
+        )
+        self.assertTrue(
+            partitions.match_partition(
+                values, [[("country", "=", "FR")], [("country", "!=", "FR")]]
+            )
+        )
+        # Predicates on data columns can't prune
+        self.assertTrue(partitions.match_partition(values, [("value", ">", 10)]))
+        with self.assertRaises(ValueError):
+            partitions.match_partition(values, [("n", "~", 1)])
+
+    def test_filter_rows(self):
+        df = pd.DataFrame({"a": [1, 2, 3, 4], "b": ["x", "y", "x", "y"]})
+
+        actual = partitions.filter_rows(
+            df, [[("a", ">", 2), ("b", "=", "x")], [("a", "in", [1])]]
+        )
+
+        self.assertEqual(list(actual["a"]), [1, 3])
+
+    def test_write_and_read_partitions(self):
+        df = pd.DataFrame({"country": ["ES", "FR", "ES"], "value": [1, 2, 3]})
+        store = {}
+
+        def _put(folder, rows, index_prefix):
+            store[f"{folder}a.csv"] = rows.reset_index(drop=True)
+            return [f"{folder}a.csv"]
+
+        written = partitions.write_partitions(
+            "data", df, _put, partition_cols=["country"]
+        )
+        actual = partitions.read_partitions(
+            "data",
+            lambda prefix: [key for key in store if key.startswith(prefix)],
+            None,
+            None,
+            lambda folder: None,
+            lambda key, shard, usecols: store[key][usecols or slice(None)],
+            None,
+            filters=[("country", "=", "ES"), ("value", ">", 1)],
+            columns=["value"],
+        )
+
+        self.assertEqual(
+            written,
+            {
+                "data/country=ES": ["data/country=ES/a.csv"],
+                "data/country=FR": ["data/country=FR/a.csv"],
+            },
+        )
+        self.assertEqual(list(actual["value"]), [3])
+        with self.assertRaises(ValueError):
+            partitions.write_partitions("data", df, _put, ["country"], index=True)
+        with self.assertRaises(ValueError):
+            partitions.read_partitions(
+                "data",
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                start_date=datetime(2024, 1, 1),
+            )
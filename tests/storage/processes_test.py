@@ -0,0 +1,88 @@
+from concurrent.futures.process import BrokenProcessPool
+import os
+import pandas as pd
+from shimoku_tangram.storage import processes
+import pyarrow as pa
+from shimoku_tangram.storage.compression import compress_csv, get_codec
+from shimoku_tangram.storage.manifest import build_manifest
+from unittest import TestCase
+
+
+class TestProcesses(TestCase):
+    def test_ipc_roundtrip_keeps_dtypes(self):
+        df = pd.DataFrame(
+            {
+                "a": pd.array([1, None, 3], dtype="Int64"),
+                "b": ["x", None, "z"],
+                "c": pd.date_range("2024-01-01", periods=3, tz="Europe/Madrid"),
+                "d": pd.Categorical(["p", "q", "p"]),
+            }
+        )
+
+        actual = processes.from_ipc(processes.to_ipc(df))
+
+        pd.testing.assert_frame_equal(actual, df)
+
+    def test_parse_and_serialize_csv(self):
+        df = pd.DataFrame({"a": range(1000), "b": [f"v{i}" for i in range(1000)]})
+        codec = get_codec("zstd")
+
+        body = processes.serialize_csv(df, codec)
+        actual = processes.parse_csv(body, "path/a.csv.zst", None, True)
+        arrow = processes.parse_csv(
+            body, "path/a.csv.zst", None, True, dtype_backend="pyarrow"
+        )
+
+        self.assertEqual(body, compress_csv(df, codec))
+        pd.testing.assert_frame_equal(actual, df)
+        self.assertEqual(str(arrow["b"].dtype), "string[pyarrow]")
+        with self.assertRaises(ValueError):
+            processes.parse_csv(
+                body, "path/a.csv.zst", {"rows": 10, "columns": []}, True
+            )
+
+    def test_parse_csv_applies_manifest_dates_with_arrow(self):
+        df = pd.DataFrame(
+            {
+                "t": pd.date_range(
+                    "2024-01-01 10:00:00.123", periods=3, freq="h", tz="Europe/Madrid"
+                ),
+                "n": pd.date_range("2024-01-01", periods=3, freq="s"),
+            }
+        )
+        codec = get_codec("gzip")
+        body = processes.serialize_csv(df, codec)
+        shard = {"rows": 3, "columns": build_manifest(df, "csv", [])["columns"]}
+        expected = df.astype(
+            {
+                "t": pd.ArrowDtype(pa.timestamp(df["t"].dt.unit, "Europe/Madrid")),
+                "n": pd.ArrowDtype(pa.timestamp(df["n"].dt.unit)),
+            }
+        )
+
+        for engine in ["c", "pyarrow"]:
+            with self.subTest(engine=engine):
+                actual = processes.parse_csv(
+                    body, "path/a.csv.gz", shard, True, engine, "pyarrow"
+                )
+                pd.testing.assert_frame_equal(actual, expected)
+
+    def test_broken_pool_is_replaced(self):
+        df = pd.DataFrame({"a": range(10)})
+        codec = get_codec("gzip")
+
+        with self.assertRaises(BrokenProcessPool):
+            processes._run_in_pool(os._exit, 1)
+        body = processes.serialize_csv(df, codec)
+
+        pd.testing.assert_frame_equal(
+            processes.parse_csv(body, "path/a.csv.gz", None, True), df
+        )
+
+    def test_check_executor(self):
+        processes.check_executor("process")
+
+        with self.assertRaises(ValueError) as context:
+            processes.check_executor("fiber")
+
+        self.assertEqual(str(context.exception), "Unknown executor: fiber")
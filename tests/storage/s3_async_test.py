@@ -0,0 +1,204 @@
+import asyncio
+from gzip import compress, decompress
+import hashlib
+import json
+import os
+import pandas as pd
+import threading
+from shimoku_tangram.storage import s3_async
+from shimoku_tangram.storage.aio import AsyncTransport
+from botocore.exceptions import ClientError
+import botocore.session
+import httpx
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+
+class FakeS3:
+    """
+    In-memory S3 speaking the REST API, for an httpx.MockTransport.
+    """
+
+    def __init__(self):
+        self.store = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = 0
+        self.delay = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"].startswith("AWS4-HMAC-SHA256")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                return httpx.Response(503)
+            return self._handle(request)
+        finally:
+            self.in_flight -= 1
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        key = unquote(request.url.path.lstrip("/"))
+        if request.method == "PUT":
+            if_match = request.headers.get("if-match")
+            if (if_match is not None and if_match != self._etag(key)) or (
+                request.headers.get("if-none-match") == "*" and key in self.store
+            ):
+                return httpx.Response(412)
+            self.store[key] = request.content
+            return httpx.Response(200)
+        if request.method == "DELETE":
+            self.store.pop(key, None)
+            return httpx.Response(204)
+        if request.method == "POST" and "delete" in request.url.params:
+            for element in ElementTree.fromstring(request.content).iter("Key"):
+                self.store.pop(element.text, None)
+            return httpx.Response(200, content=b"<DeleteResult/>")
+        if request.method == "GET" and request.url.params.get("list-type") == "2":
+            prefix = request.url.params["prefix"]
+            contents = "".join(
+                f"<Contents><Key>{name}</Key><Size>{len(body)}</Size></Contents>"
+                for name, body in sorted(self.store.items())
+                if name.startswith(prefix)
+            )
+            return httpx.Response(
+                200,
+                content=(
+                    '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/'
+                    f'2006-03-01/">{contents}</ListBucketResult>'
+                ).encode(),
+            )
+        if request.method == "GET":
+            if key not in self.store:
+                return httpx.Response(
+                    404, content=b"<Error><Code>NoSuchKey</Code></Error>"
+                )
+            return httpx.Response(
+                200, content=self.store[key], headers={"ETag": self._etag(key)}
+            )
+        return httpx.Response(405)
+
+    def _etag(self, key: str) -> str | None:
+        if key not in self.store:
+            return None
+        return f'"{hashlib.md5(self.store[key]).hexdigest()}"'
+
+
+class TestS3Async(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.s3 = FakeS3()
+        credentials = {
+            "AWS_ACCESS_KEY_ID": "key",
+            "AWS_SECRET_ACCESS_KEY": "secret",
+        }
+        with patch.dict(os.environ, credentials):
+            session = botocore.session.Session()
+            session.get_credentials()
+        for target, value in [
+            ("_session", session),
+            ("_credentials", None),
+            ("_region_name", "eu-west-1"),
+            ("_transport", self._transport(max_concurrency=64)),
+        ]:
+            patcher = patch.object(s3_async, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _transport(self, **kwargs) -> AsyncTransport:
+        return AsyncTransport(transport=httpx.MockTransport(self.s3), **kwargs)
+
+    async def test_object_roundtrip(self):
+        self.assertTrue(
+            await s3_async.put_json_object("bucket", "a/b c.json.gz", {"a": 1})
+        )
+
+        actual = await s3_async.get_json_object("bucket", "a/b c.json.gz")
+
+        self.assertEqual(actual, {"a": 1})
+        self.assertEqual(
+            await s3_async.list_objects_key("bucket", "a/"), ["a/b c.json.gz"]
+        )
+        self.assertTrue(await s3_async.delete_object("bucket", "a/b c.json.gz"))
+        with self.assertRaises(ClientError) as context:
+            await s3_async.get_object("bucket", "a/b c.json.gz")
+        self.assertEqual(context.exception.response["Error"]["Code"], "NoSuchKey")
+
+    async def test_csv_objects_roundtrip(self):
+        df = pd.DataFrame({"a": range(10), "b": ["0012"] * 10})
+        self.s3.store["path/stale.csv.gz"] = b""
+
+        keys = await s3_async.put_multiple_csv_objects(
+            "bucket", "path", df, max_rows_per_shard=4
+        )
+        actual = await s3_async.get_multiple_csv_objects_threaded("bucket", ["path"])
+
+        self.assertEqual(len(keys), 3)
+        self.assertNotIn("path/stale.csv.gz", self.s3.store)
+        self.assertIn("path/_manifest.json", self.s3.store)
+        pd.testing.assert_frame_equal(actual, df)
+
+    async def test_partition_index_follows_writers_and_clear_path(self):
+        df = pd.DataFrame({"a": range(10)})
+        index = {"version": 1, "partitions": {"2024/01/05": [{"key": "x"}]}}
+        self.s3.store["data/_partitions.json.gz"] = compress(
+            json.dumps(index).encode("utf-8")
+        )
+
+        keys = await s3_async.put_multiple_csv_objects(
+            "bucket", "data/2024/01/06", df, max_rows_per_shard=4
+        )
+        stored = json.loads(decompress(self.s3.store["data/_partitions.json.gz"]))
+        await s3_async.clear_path("bucket", "data/2024/01/06")
+        cleared = json.loads(decompress(self.s3.store["data/_partitions.json.gz"]))
+
+        self.assertEqual(
+            [entry["key"] for entry in stored["partitions"]["2024/01/06"]], keys
+        )
+        self.assertEqual(
+            stored["columns"], {"2024/01/06": [{"name": "a", "dtype": "int64"}]}
+        )
+        self.assertEqual(cleared["partitions"], index["partitions"])
+        self.assertEqual(cleared["columns"], {})
+
+    async def test_requests_in_flight_are_bounded(self):
+        self.s3.store = {f"k{i}": b"x" for i in range(20)}
+        self.s3.delay = 0.01
+
+        with patch.object(s3_async, "_transport", self._transport(max_concurrency=3)):
+            actual = await asyncio.gather(
+                *(s3_async.get_object("bucket", f"k{i}", False) for i in range(20))
+            )
+
+        self.assertEqual(actual, [b"x"] * 20)
+        self.assertEqual(self.s3.max_in_flight, 3)
+
+    @patch("shimoku_tangram.storage.aio.MAX_BACKOFF", 0)
+    async def test_transient_errors_are_retried(self):
+        self.s3.store["k"] = b"x"
+        self.s3.failures = 2
+
+        actual = await s3_async.get_object("bucket", "k", compressed=False)
+
+        self.assertEqual(actual, b"x")
+
+    async def test_credentials_are_resolved_off_the_loop_once(self):
+        self.s3.store["k"] = b"x"
+        threads = []
+        frozen_credentials = s3_async._frozen_credentials
+
+        def _frozen_credentials():
+            threads.append(threading.current_thread())
+            return frozen_credentials()
+
+        with patch.object(s3_async, "_frozen_credentials", _frozen_credentials):
+            await s3_async.get_object("bucket", "k", compressed=False)
+            await asyncio.gather(
+                *(s3_async.get_object("bucket", "k", False) for _ in range(5))
+            )
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
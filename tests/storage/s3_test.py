@@ -1,11 +1,24 @@
 import pandas as pd
 from shimoku_tangram.storage import s3
+from shimoku_tangram.storage.manifest import is_metadata
+from shimoku_tangram.storage.tasks import ThreadedTaskError
+import boto3
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
 from collections import namedtuple
-from gzip import compress
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from gzip import compress, decompress
+import hashlib
 from io import BytesIO
 import json
 import pickle
+import random
 import re
+from tempfile import TemporaryDirectory
+from datetime import datetime
+import threading
 from uuid import UUID
 from unittest import TestCase
 from unittest.mock import patch
@@ -16,6 +29,70 @@ AuxTestObject = namedtuple("AuxTestObject", ["attribute"])
 
 
 class TestS3(TestCase):
+    def setUp(self):
+        s3.reset_clients()
+
+    def tearDown(self):
+        s3.reset_clients()
+
+    @staticmethod
+    def fake_bucket(mock_client) -> dict:
+        """
+        Back the mocked client with an in-memory bucket and return its
+        key -> body store.
+        """
+        store = {}
+
+        def _etag(key):
+            return f'"{hashlib.md5(store[key]).hexdigest()}"' if key in store else None
+
+        def _put_object(Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+            if (IfMatch is not None and IfMatch != _etag(Key)) or (
+                IfNoneMatch == "*" and Key in store
+            ):
+                raise ClientError(
+                    {
+                        "Error": {"Code": "PreconditionFailed"},
+                        "ResponseMetadata": {"HTTPStatusCode": 412},
+                    },
+                    "PutObject",
+                )
+            store[Key] = Body
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        def _get_object(Bucket, Key, Range=None, **kwargs):
+            if Key not in store:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            body = store[Key]
+            if Range is not None:
+                start, end = map(int, Range.removeprefix("bytes=").split("-"))
+                body = body[start : end + 1]
+            return {"Body": BytesIO(body), "ETag": _etag(Key)}
+
+        def _head_object(Bucket, Key):
+            return {"ContentLength": len(store[Key]), "ETag": _etag(Key)}
+
+        def _list_objects_v2(Bucket, Prefix="", **kwargs):
+            return {
+                "Contents": [
+                    {"Key": key, "Size": len(body)}
+                    for key, body in sorted(store.items())
+                    if key.startswith(Prefix)
+                ]
+            }
+
+        def _delete_objects(Bucket, Delete):
+            for obj in Delete["Objects"]:
+                store.pop(obj["Key"], None)
+            return {}
+
+        mock_client.return_value.put_object.side_effect = _put_object
+        mock_client.return_value.delete_objects.side_effect = _delete_objects
+        mock_client.return_value.get_object.side_effect = _get_object
+        mock_client.return_value.head_object.side_effect = _head_object
+        mock_client.return_value.list_objects_v2.side_effect = _list_objects_v2
+        return store
+
     @staticmethod
     def is_valid_key(string: str) -> bool:
         try:
@@ -29,6 +106,27 @@ class TestS3(TestCase):
         except ValueError:
             return False
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_client_is_shared(self, mock_client):
+        s3.bucket_exists("test")
+        s3.list_objects_key("test")
+
+        self.assertIs(s3.get_client(), mock_client.return_value)
+        mock_client.assert_called_once()
+        self.assertEqual(mock_client.call_args.args, ("s3",))
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_configure_client(self, mock_client):
+        s3.get_client()
+        s3.configure_client(max_pool_connections=10, max_attempts=2)
+        s3.get_client()
+
+        self.assertEqual(mock_client.call_count, 2)
+        config = mock_client.call_args.kwargs["config"]
+        self.assertEqual(config.max_pool_connections, 10)
+        self.assertEqual(config.retries["max_attempts"], 2)
+        s3.configure_client()
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_bucket_exists(self, mock_client):
         mock_client.return_value.head_bucket.return_value = {}
@@ -72,6 +170,41 @@ class TestS3(TestCase):
             Bucket="test", Prefix=""
         )
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_list_objects_metadata_paginated(self, mock_client):
+        mock_client.return_value.list_objects_v2.side_effect = [
+            {
+                "Contents": [{"Key": "a"}],
+                "IsTruncated": True,
+                "NextContinuationToken": "token",
+            },
+            {"Contents": [{"Key": "b"}], "IsTruncated": False},
+        ]
+        response = s3.list_objects_metadata("test", "path")
+
+        self.assertEqual(response, [{"Key": "a"}, {"Key": "b"}])
+
+        mock_client.return_value.list_objects_v2.assert_called_with(
+            Bucket="test", Prefix="path", ContinuationToken="token"
+        )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_iter_objects_key_is_lazy(self, mock_client):
+        mock_client.return_value.list_objects_v2.side_effect = [
+            {
+                "Contents": [{"Key": "a"}],
+                "IsTruncated": True,
+                "NextContinuationToken": "token",
+            },
+            {"Contents": [{"Key": "b"}]},
+        ]
+        keys = s3.iter_objects_key("test")
+
+        self.assertEqual(next(keys), "a")
+        mock_client.return_value.list_objects_v2.assert_called_once()
+        self.assertEqual(list(keys), ["b"])
+        self.assertEqual(mock_client.return_value.list_objects_v2.call_count, 2)
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_list_objects_key(self, mock_client):
         mock_client.return_value.list_objects_v2.return_value = {
@@ -159,7 +292,7 @@ class TestS3(TestCase):
         mock_client.return_value.list_objects_v2.return_value = {
             "Contents": [{"Key": "test"}]
         }
-        mock_client.return_value.delete_object.return_value = {
+        mock_client.return_value.delete_objects.return_value = {
             "ResponseMetadata": {"HTTPStatusCode": 200}
         }
         response = s3.clear_path("test")
@@ -169,8 +302,8 @@ class TestS3(TestCase):
         mock_client.return_value.list_objects_v2.assert_called_once_with(
             Bucket="test", Prefix=""
         )
-        mock_client.return_value.delete_object.assert_called_once_with(
-            Bucket="test", Key="test"
+        mock_client.return_value.delete_objects.assert_called_once_with(
+            Bucket="test", Delete={"Objects": [{"Key": "test"}], "Quiet": True}
         )
 
     @patch("shimoku_tangram.storage.s3.client")
@@ -183,26 +316,40 @@ class TestS3(TestCase):
         mock_client.return_value.list_objects_v2.assert_called_once_with(
             Bucket="test", Prefix=""
         )
+        mock_client.return_value.delete_objects.assert_not_called()
 
     @patch("shimoku_tangram.storage.s3.client")
     def test_clear_path_error(self, mock_client):
         mock_client.return_value.list_objects_v2.return_value = {
             "Contents": [{"Key": "test"}]
         }
-        mock_client.return_value.delete_object.return_value = {
-            "ResponseMetadata": {"HTTPStatusCode": 400}
+        mock_client.return_value.delete_objects.return_value = {
+            "Errors": [{"Key": "test", "Code": "AccessDenied", "Message": "Denied"}]
         }
         response = s3.clear_path("test")
 
         self.assertFalse(response)
 
-        mock_client.return_value.list_objects_v2.assert_called_once_with(
-            Bucket="test", Prefix=""
-        )
-        mock_client.return_value.delete_object.assert_called_once_with(
-            Bucket="test", Key="test"
+        mock_client.return_value.delete_objects.assert_called_once_with(
+            Bucket="test", Delete={"Objects": [{"Key": "test"}], "Quiet": True}
         )
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_delete_objects_batches(self, mock_client):
+        keys = [f"key{i}" for i in range(2500)]
+
+        def _delete_objects(Bucket, Delete):
+            if Delete["Objects"][0]["Key"] == "key1000":
+                raise RuntimeError("throttled")
+            return {}
+
+        mock_client.return_value.delete_objects.side_effect = _delete_objects
+        failures = s3.delete_objects("test", iter(keys))
+
+        self.assertEqual(mock_client.return_value.delete_objects.call_count, 3)
+        self.assertEqual(sorted(failures), sorted(keys[1000:2000]))
+        self.assertEqual(failures["key1500"], "throttled")
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_get_object_compressed(self, mock_client):
         class MockBody:
@@ -245,6 +392,63 @@ class TestS3(TestCase):
             Bucket="test", Key="test"
         )
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_open_object_compressed(self, mock_client):
+        body = BytesIO(compress(b"line1\nline2\n"))
+        mock_client.return_value.get_object.return_value = {"Body": body}
+
+        with s3.open_object("test", "test") as stream:
+            self.assertEqual(stream.readline(), b"line1\n")
+            self.assertEqual(stream.read(), b"line2\n")
+
+        self.assertTrue(body.closed)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_open_object_uncompressed(self, mock_client):
+        mock_client.return_value.get_object.return_value = {"Body": BytesIO(b"test")}
+
+        with s3.open_object("test", "test", compressed=False) as stream:
+            self.assertEqual(stream.read(), b"test")
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_object_ranged(self, mock_client):
+        s3.configure_transfer(ranged_get_threshold_mb=1, ranged_get_size_mb=1)
+        self.addCleanup(s3.configure_transfer)
+        expected = random.Random(0).randbytes(3 * 1024**2)
+        body = compress(expected)
+        mock_client.return_value.head_object.return_value = {
+            "ContentLength": len(body),
+            "ETag": '"etag"',
+        }
+
+        def _get_object(Bucket, Key, Range, IfMatch):
+            start, end = map(int, Range.removeprefix("bytes=").split("-"))
+            return {"Body": BytesIO(body[start : end + 1])}
+
+        mock_client.return_value.get_object.side_effect = _get_object
+        response = s3.get_object("test", "test", ranged=True)
+
+        self.assertEqual(response, expected)
+        self.assertEqual(
+            mock_client.return_value.get_object.call_count,
+            -(-len(body) // 1024**2),
+        )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_object_ranged_small(self, mock_client):
+        mock_client.return_value.head_object.return_value = {
+            "ContentLength": 4,
+            "ETag": '"etag"',
+        }
+        mock_client.return_value.get_object.return_value = {"Body": BytesIO(b"test")}
+
+        response = s3.get_object("test", "test", compressed=False, ranged=True)
+
+        self.assertEqual(response, b"test")
+        mock_client.return_value.get_object.assert_called_once_with(
+            Bucket="test", Key="test"
+        )
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_put_object_compressed(self, mock_client):
         mock_client.return_value.put_object.return_value = {
@@ -282,6 +486,96 @@ class TestS3(TestCase):
             Bucket="test", Key="test", Body=compress(b"test")
         )
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_object_multipart(self, mock_client):
+        s3.configure_transfer(multipart_threshold_mb=1, multipart_part_size_mb=5)
+        self.addCleanup(s3.configure_transfer)
+        body = bytes(range(256)) * (12 * 1024**2 // 256)
+        mock_client.return_value.create_multipart_upload.return_value = {
+            "UploadId": "id"
+        }
+        attempts = []
+        parts = {}
+
+        def _upload_part(Bucket, Key, UploadId, PartNumber, Body):
+            attempts.append(PartNumber)
+            if attempts.count(2) == 1 and PartNumber == 2:
+                raise RuntimeError("reset")
+            parts[PartNumber] = Body
+            return {"ETag": f"etag{PartNumber}"}
+
+        mock_client.return_value.upload_part.side_effect = _upload_part
+        mock_client.return_value.complete_multipart_upload.return_value = {
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+        response = s3.put_object("test", "test", body, compress=False)
+
+        self.assertTrue(response)
+        mock_client.return_value.put_object.assert_not_called()
+        self.assertEqual(sorted(attempts), [1, 2, 2, 3])
+        self.assertEqual(b"".join(parts[number] for number in (1, 2, 3)), body)
+        mock_client.return_value.complete_multipart_upload.assert_called_once_with(
+            Bucket="test",
+            Key="test",
+            UploadId="id",
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": 1, "ETag": "etag1"},
+                    {"PartNumber": 2, "ETag": "etag2"},
+                    {"PartNumber": 3, "ETag": "etag3"},
+                ]
+            },
+        )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_multipart_uploads_share_the_part_pool(self, mock_client):
+        s3.configure_transfer(multipart_threshold_mb=1, max_workers=2)
+        self.addCleanup(s3.configure_transfer)
+        mock_client.return_value.create_multipart_upload.return_value = {
+            "UploadId": "id"
+        }
+        threads = set()
+
+        def _upload_part(Bucket, Key, UploadId, PartNumber, Body):
+            threads.add(threading.current_thread().name)
+            return {"ETag": f"etag{PartNumber}"}
+
+        mock_client.return_value.upload_part.side_effect = _upload_part
+        mock_client.return_value.complete_multipart_upload.return_value = {
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+        body = b"x" * 12 * 1024**2
+
+        with ThreadPoolExecutor(4) as executor:
+            responses = list(
+                executor.map(
+                    lambda key: s3.put_object("test", key, body, compress=False),
+                    ["a", "b", "c", "d"],
+                )
+            )
+
+        self.assertEqual(responses, [True] * 4)
+        self.assertLessEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith("s3-part") for name in threads))
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_object_multipart_aborts_on_failure(self, mock_client):
+        s3.configure_transfer(multipart_threshold_mb=1, part_attempts=2)
+        self.addCleanup(s3.configure_transfer)
+        mock_client.return_value.create_multipart_upload.return_value = {
+            "UploadId": "id"
+        }
+        mock_client.return_value.upload_part.side_effect = RuntimeError("down")
+
+        with self.assertRaises(RuntimeError):
+            s3.put_object("test", "test", b"x" * 2 * 1024**2, compress=False)
+
+        self.assertEqual(mock_client.return_value.upload_part.call_count, 2)
+        mock_client.return_value.complete_multipart_upload.assert_not_called()
+        mock_client.return_value.abort_multipart_upload.assert_called_once_with(
+            Bucket="test", Key="test", UploadId="id"
+        )
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_delete_object(self, mock_client):
         mock_client.return_value.delete_object.return_value = {
@@ -390,6 +684,10 @@ class TestS3(TestCase):
     def test_get_pkl_object(self, mock_client):
         expected = AuxTestObject(attribute="value")
 
+        mock_client.return_value.head_object.return_value = {
+            "ContentLength": 100,
+            "ETag": '"etag"',
+        }
         mock_client.return_value.get_object.return_value = {
             "Body": BytesIO(compress(pickle.dumps(expected)))
         }
@@ -501,6 +799,10 @@ class TestS3(TestCase):
         mock_client.return_value.list_objects_v2.return_value = {
             "Contents": [{"Key": "path/file.pkl"}]
         }
+        mock_client.return_value.head_object.return_value = {
+            "ContentLength": 100,
+            "ETag": '"etag"',
+        }
         mock_client.return_value.get_object.return_value = {
             "Body": BytesIO(pickle.dumps(expected))
         }
@@ -515,6 +817,10 @@ class TestS3(TestCase):
         mock_client.return_value.list_objects_v2.return_value = {
             "Contents": [{"Key": "path/file.pkl.gz"}]
         }
+        mock_client.return_value.head_object.return_value = {
+            "ContentLength": 100,
+            "ETag": '"etag"',
+        }
         mock_client.return_value.get_object.return_value = {
             "Body": BytesIO(compress(pickle.dumps(expected)))
         }
@@ -589,6 +895,24 @@ class TestS3(TestCase):
 
         self.assertTrue(actual.equals(expected))
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_multiple_csv_objects_pyarrow_engine(self, mock_client):
+        df = pd.DataFrame({"1": [1, 2, 3], "2": ["a", "b", "c"]})
+
+        mock_client.return_value.list_objects_v2.return_value = {
+            "Contents": [{"Key": "path/file.csv.gz"}]
+        }
+        mock_client.return_value.get_object.return_value = {
+            "Body": BytesIO(compress(df.to_csv(index=False).encode("utf-8")))
+        }
+        actual = s3.get_multiple_csv_objects(
+            "", "", engine="pyarrow", usecols=["2"], dtype={"2": "string"}
+        )
+
+        self.assertEqual(list(actual.columns), ["2"])
+        self.assertEqual(actual["2"].tolist(), ["a", "b", "c"])
+        self.assertEqual(actual["2"].dtype, "string")
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_get_multiple_csv_objects_nocsv(self, mock_client):
         mock_client.return_value.list_objects_v2.return_value = {
@@ -633,8 +957,595 @@ class TestS3(TestCase):
 
         self.assertTrue(all([self.is_valid_key(res) for res in response]))
 
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_multiple_csv_objects_shard_order(self, mock_client):
+        df = pd.DataFrame({"1": range(10)})
+        bodies = {}
+
+        def _put_object(Bucket, Key, Body):
+            bodies[Key] = Body
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+        mock_client.return_value.put_object.side_effect = _put_object
+        response = s3.put_multiple_csv_objects(
+            "", "path", df, max_rows_per_shard=3, max_workers=3
+        )
+
+        self.assertEqual(len(response), 4)
+        actual = pd.concat(
+            [pd.read_csv(BytesIO(decompress(bodies[key]))) for key in response]
+        ).reset_index(drop=True)
+        self.assertTrue(actual.equals(df))
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_multiple_csv_objects_threaded_error(self, mock_client):
+        df = pd.DataFrame({"1": [1, 2, 3]})
+
+        mock_client.return_value.list_objects_v2.return_value = {
+            "Contents": [{"Key": "path/file1.csv"}, {"Key": "path/file2.csv"}]
+        }
+
+        def _get_object(Bucket, Key):
+            if Key == "path/file2.csv":
+                raise RuntimeError("SlowDown")
+            return {"Body": BytesIO(df.to_csv(index=False).encode("utf-8"))}
+
+        mock_client.return_value.get_object.side_effect = _get_object
+
+        with self.assertRaises(ThreadedTaskError) as context:
+            s3.get_multiple_csv_objects_threaded("", ["path"], retries=1)
+
+        self.assertEqual(list(context.exception.errors), ["path/file2.csv"])
+        self.assertEqual(mock_client.return_value.get_object.call_count, 3)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_multiple_csv_objects_threaded_preallocate(self, mock_client):
+        keys = [f"path/file{i}.csv" for i in range(5)]
+        mock_client.return_value.list_objects_v2.return_value = {
+            "Contents": [{"Key": key} for key in reversed(keys)]
+        }
+
+        def _get_object(Bucket, Key):
+            i = keys.index(Key)
+            df = pd.DataFrame({"a": [i, i], "b": [str(i)] * 2})
+            return {"Body": BytesIO(df.to_csv(index=False).encode("utf-8"))}
+
+        mock_client.return_value.get_object.side_effect = _get_object
+
+        expected = s3.get_multiple_csv_objects_threaded("", ["path"])
+        actual = s3.get_multiple_csv_objects_threaded(
+            "", ["path"], assembly="preallocate"
+        )
+
+        pd.testing.assert_frame_equal(actual, expected)
+        self.assertEqual(actual["a"].tolist(), [4, 4, 3, 3, 2, 2, 1, 1, 0, 0])
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_iter_csv_objects(self, mock_client):
+        keys = [f"path/file{i}.csv" for i in range(4)]
+        mock_client.return_value.list_objects_v2.return_value = {
+            "Contents": [{"Key": key} for key in keys]
+        }
+
+        def _get_object(Bucket, Key):
+            i = keys.index(Key)
+            df = pd.DataFrame({"a": range(3 * i, 3 * i + 3)})
+            return {"Body": BytesIO(df.to_csv(index=False).encode("utf-8"))}
+
+        mock_client.return_value.get_object.side_effect = _get_object
+
+        shards = list(s3.iter_csv_objects("", ["path"], prefetch=1))
+        chunks = list(s3.iter_csv_objects("", ["path"], chunksize=5))
+
+        self.assertEqual([shard["a"].tolist() for shard in shards][1], [3, 4, 5])
+        self.assertEqual([len(chunk) for chunk in chunks], [5, 5, 2])
+        self.assertEqual(
+            pd.concat(chunks)["a"].tolist(), pd.concat(shards)["a"].tolist()
+        )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_iter_csv_objects_retries(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10)})
+        keys = s3.put_multiple_csv_objects("", "path", df, max_rows_per_shard=4)
+        get_object = mock_client.return_value.get_object.side_effect
+        failed = []
+
+        def _get_object(Bucket, Key, **kwargs):
+            if Key == keys[1] and not failed:
+                failed.append(Key)
+                raise RuntimeError("SlowDown")
+            return get_object(Bucket, Key, **kwargs)
+
+        mock_client.return_value.get_object.side_effect = _get_object
+
+        actual = pd.concat(s3.iter_csv_objects("", ["path"], retries=1))
+
+        self.assertEqual(failed, [keys[1]])
+        self.assertEqual(actual["a"].tolist(), list(range(10)))
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_object_cached(self, mock_client):
+        not_modified = ClientError(
+            {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+            "GetObject",
+        )
+        mock_client.return_value.get_object.side_effect = [
+            {"Body": BytesIO(compress(b"v1")), "ETag": '"1"'},
+            not_modified,
+            {"Body": BytesIO(compress(b"v2")), "ETag": '"2"'},
+        ]
+
+        with TemporaryDirectory() as directory:
+            s3.configure_cache(directory)
+            try:
+                first = s3.get_object("bucket", "key")
+                second = s3.get_object("bucket", "key")
+                third = s3.get_object("bucket", "key")
+            finally:
+                s3.configure_cache(None)
+
+        self.assertEqual([first, second, third], [b"v1", b"v1", b"v2"])
+        calls = mock_client.return_value.get_object.call_args_list
+        self.assertNotIn("IfNoneMatch", calls[0].kwargs)
+        self.assertEqual(calls[1].kwargs["IfNoneMatch"], '"1"')
+        self.assertEqual(calls[2].kwargs["IfNoneMatch"], '"1"')
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_memory_cache_only_small_objects(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        store["small.pkl.gz"] = compress(pickle.dumps([1]))
+        store["large.pkl.gz"] = compress(pickle.dumps(random.randbytes(2 * 1024**2)))
+        store["data.csv.gz"] = compress(b"a\n1\n")
+
+        s3.configure_memory_cache(1)
+        try:
+            for _ in range(2):
+                s3.get_pkl_object("bucket", "small.pkl.gz")
+                s3.get_pkl_object("bucket", "large.pkl.gz")
+                s3.get_object("bucket", "data.csv.gz")
+        finally:
+            s3.configure_memory_cache(None)
+
+        keys = [
+            call.kwargs["Key"]
+            for call in mock_client.return_value.get_object.call_args_list
+        ]
+        self.assertEqual(keys.count("small.pkl.gz"), 1)
+        self.assertEqual(keys.count("large.pkl.gz"), 2)
+        self.assertEqual(keys.count("data.csv.gz"), 2)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_single_json_object_memory_cached(self, mock_client):
+        mock_client.return_value.list_objects_v2.return_value = {
+            "Contents": [{"Key": "path/file.json.gz"}]
+        }
+        mock_client.return_value.get_object.side_effect = lambda Bucket, Key: {
+            "Body": BytesIO(compress(json.dumps({"a": [1]}).encode("utf-8")))
+        }
+        mock_client.return_value.put_object.return_value = {
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+
+        s3.configure_memory_cache(1)
+        try:
+            first = s3.get_single_json_object("bucket", "path")
+            first["a"].append(2)
+            second = s3.get_single_json_object("bucket", "path")
+            s3.put_json_object("bucket", "path/file.json.gz", {"a": [1]})
+            s3.get_single_json_object("bucket", "path")
+        finally:
+            s3.configure_memory_cache(None)
+
+        self.assertEqual(second, {"a": [1]})
+        self.assertEqual(mock_client.return_value.list_objects_v2.call_count, 2)
+        self.assertEqual(mock_client.return_value.get_object.call_count, 2)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_list_objects_key_between_dates_index(self, mock_client):
+        index = {
+            "version": 1,
+            "partitions": {
+                "2024/01/01": [{"key": "data/2024/01/01/a.csv.gz"}],
+                "2024/01/02": [{"key": "data/2024/01/02/b.csv.gz"}],
+                "2024/02/01": [{"key": "data/2024/02/01/c.csv.gz"}],
+            },
+        }
+        mock_client.return_value.get_object.return_value = {
+            "Body": BytesIO(compress(json.dumps(index).encode("utf-8")))
+        }
+
+        actual = s3.list_objects_key_between_dates(
+            "bucket", "data", datetime(2024, 1, 2), datetime(2024, 3, 1)
+        )
+
+        self.assertEqual(
+            actual, ["data/2024/01/02/b.csv.gz", "data/2024/02/01/c.csv.gz"]
+        )
+        mock_client.return_value.get_object.assert_called_once_with(
+            Bucket="bucket", Key="data/_partitions.json.gz"
+        )
+        mock_client.return_value.list_objects_v2.assert_not_called()
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_list_objects_key_between_dates_without_index(self, mock_client):
+        mock_client.return_value.get_object.side_effect = ClientError(
+            {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+        )
+        mock_client.return_value.list_objects_v2.side_effect = lambda **kwargs: {
+            "Contents": [{"Key": f"{kwargs['Prefix']}/a.csv.gz"}]
+        }
+
+        actual = s3.list_objects_key_between_dates(
+            "bucket", "data", datetime(2024, 1, 1), datetime(2024, 1, 2)
+        )
+
+        self.assertEqual(
+            actual, ["data/2024/01/01/a.csv.gz", "data/2024/01/02/a.csv.gz"]
+        )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_csv_objects_between_dates_manifest(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10), "b": ["0012"] * 10})
+        keys = s3.put_multiple_csv_objects(
+            "bucket", "data/2024/01/05", df, max_rows_per_shard=4
+        )
+
+        actual = s3.get_multiple_csv_objects_between_dates_threaded(
+            "bucket", "data", datetime(2024, 1, 5), datetime(2024, 1, 5)
+        )
+
+        pd.testing.assert_frame_equal(actual, df)
+        del store[keys[1]]
+        with self.assertRaises(ThreadedTaskError):
+            s3.get_multiple_csv_objects_between_dates_threaded(
+                "bucket", "data", datetime(2024, 1, 5), datetime(2024, 1, 5)
+            )
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_get_csv_objects_between_dates_index_skips_manifests(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(2), "b": ["0012"] * 2})
+        for day in range(1, 6):
+            s3.put_multiple_csv_objects("bucket", f"data/2024/01/{day:02d}", df)
+        s3.build_partition_index("bucket", "data")
+        for day in range(6, 11):
+            s3.put_multiple_csv_objects("bucket", f"data/2024/01/{day:02d}", df)
+        mock_client.return_value.get_object.reset_mock()
+        mock_client.return_value.list_objects_v2.reset_mock()
+
+        actual = s3.get_multiple_csv_objects_between_dates_threaded(
+            "bucket", "data", datetime(2024, 1, 1), datetime(2024, 1, 10)
+        )
+
+        pd.testing.assert_frame_equal(actual, pd.concat([df] * 10, ignore_index=True))
+        keys = [
+            call.kwargs["Key"]
+            for call in mock_client.return_value.get_object.call_args_list
+        ]
+        self.assertEqual(keys.count("data/_partitions.json.gz"), 1)
+        self.assertEqual(len(keys), 11)
+        mock_client.return_value.list_objects_v2.assert_not_called()
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_multiple_csv_objects_updates_index(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10)})
+
+        keys = s3.put_multiple_csv_objects(
+            "bucket", "data/2024/01/05", df, max_rows_per_shard=4, index_prefix="data"
+        )
+        index = s3.get_partition_index("bucket", "data")
+
+        self.assertEqual(list(index["partitions"]), ["2024/01/05"])
+        entries = index["partitions"]["2024/01/05"]
+        self.assertEqual([entry["key"] for entry in entries], keys)
+        self.assertEqual([entry["rows"] for entry in entries], [4, 4, 2])
+        self.assertEqual(
+            [entry["size"] for entry in entries], [len(store[key]) for key in keys]
+        )
+        with self.assertRaises(ValueError):
+            s3.put_multiple_csv_objects("bucket", "data/2024", df, index_prefix="data")
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_multiple_csv_objects_probes_index_once(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10)})
+
+        s3.put_multiple_csv_objects("bucket", "data/2024/01/05", df)
+        s3.put_multiple_csv_objects("bucket", "models/2024/v1", df)
+
+        keys = [
+            call.kwargs["Key"]
+            for call in mock_client.return_value.get_object.call_args_list
+        ]
+        self.assertEqual(keys, ["data/_partitions.json.gz"])
+        self.assertNotIn("data/_partitions.json.gz", store)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_partition_index_follows_writers_and_clear_path(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10)})
+        s3.put_multiple_csv_objects("bucket", "data/2024/01/05", df)
+        s3.build_partition_index("bucket", "data")
+
+        keys = s3.put_multiple_csv_objects(
+            "bucket", "data/2024/01/06", df, max_rows_per_shard=4
+        )
+        s3.put_multiple_csv_objects("bucket", "other/2024/01/06", df)
+        index = s3.get_partition_index("bucket", "data")
+
+        self.assertEqual(list(index["partitions"]), ["2024/01/05", "2024/01/06"])
+        self.assertEqual(
+            [entry["key"] for entry in index["partitions"]["2024/01/06"]], keys
+        )
+        self.assertIsNone(s3.get_partition_index("bucket", "other"))
+        self.assertTrue(s3.clear_path("bucket", "data/2024/01/05"))
+        self.assertEqual(
+            list(s3.get_partition_index("bucket", "data")["partitions"]),
+            ["2024/01/06"],
+        )
+        self.assertTrue(s3.clear_path("bucket", "data/2024"))
+        self.assertEqual(s3.get_partition_index("bucket", "data")["partitions"], {})
+
+    def test_partition_index_conditional_puts_pass_validation(self):
+        # A real client validates the request parameters against the service
+        # model of the installed botocore, which must know IfMatch/IfNoneMatch
+        s3_client = boto3.client(
+            "s3",
+            region_name="eu-west-1",
+            aws_access_key_id="key",
+            aws_secret_access_key="secret",
+        )
+        index = {"version": 1, "partitions": {}}
+        body = compress(json.dumps(index).encode("utf-8"))
+        with Stubber(s3_client) as stubber:
+            stubber.add_client_error("get_object", "NoSuchKey", http_status_code=404)
+            stubber.add_response(
+                "put_object",
+                {},
+                {
+                    "Bucket": "bucket",
+                    "Key": "data/_partitions.json.gz",
+                    "Body": ANY,
+                    "IfNoneMatch": "*",
+                },
+            )
+            stubber.add_response(
+                "get_object",
+                {"Body": StreamingBody(BytesIO(body), len(body)), "ETag": '"1"'},
+            )
+            stubber.add_response(
+                "put_object",
+                {},
+                {
+                    "Bucket": "bucket",
+                    "Key": "data/_partitions.json.gz",
+                    "Body": ANY,
+                    "IfMatch": '"1"',
+                },
+            )
+            with patch("shimoku_tangram.storage.s3.client", return_value=s3_client):
+                s3._modify_partition_index("bucket", "data", lambda i: i, create=True)
+                s3._update_partition_index(
+                    "bucket",
+                    "data",
+                    "data/2024/01/05",
+                    [{"key": "data/2024/01/05/a", "size": 1, "rows": 1}],
+                )
+            stubber.assert_no_pending_responses()
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_partition_index_update_retries_concurrent_writer(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        s3.build_partition_index("bucket", "data")
+        put_object = mock_client.return_value.put_object.side_effect
+        other = {"version": 1, "partitions": {"2024/01/01": [{"key": "x"}]}}
+        raced = []
+
+        def _put_object(Bucket, Key, Body, **kwargs):
+            # Another process updates the index between our read and write
+            if Key == "data/_partitions.json.gz" and not raced:
+                raced.append(Key)
+                store[Key] = compress(json.dumps(other).encode("utf-8"))
+            return put_object(Bucket, Key, Body, **kwargs)
+
+        mock_client.return_value.put_object.side_effect = _put_object
+        s3.put_multiple_csv_objects(
+            "bucket", "data/2024/01/05", pd.DataFrame({"a": [1]}), index_prefix="data"
+        )
+
+        index = s3.get_partition_index("bucket", "data")
+        self.assertEqual(list(index["partitions"]), ["2024/01/01", "2024/01/05"])
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_csv_objects_manifest_roundtrip(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        df = pd.DataFrame(
+            {
+                "a": range(10),
+                "b": ["0012"] * 10,
+                "c": pd.date_range("2024-01-01", periods=10, tz="Europe/Madrid"),
+            }
+        )
+
+        keys = s3.put_multiple_csv_objects("", "path", df, max_rows_per_shard=4)
+        manifest = s3.get_manifest("", "path")
+        actual = s3.get_multiple_csv_objects_threaded("", ["path"])
+
+        self.assertEqual([shard["key"] for shard in manifest["shards"]], keys)
+        self.assertEqual(manifest["rows"], 10)
+        self.assertEqual(
+            [shard["md5"] for shard in manifest["shards"]],
+            [hashlib.md5(store[key]).hexdigest() for key in keys],
+        )
+        pd.testing.assert_frame_equal(actual, df)
+
+        del store[keys[1]]
+        with self.assertRaises(ThreadedTaskError) as context:
+            s3.get_multiple_csv_objects_threaded("", ["path"])
+        self.assertIsInstance(context.exception.errors["path"], ValueError)
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_objects_codec_roundtrip(self, mock_client):
+        store = self.fake_bucket(mock_client)
+        df = pd.DataFrame({"a": range(10), "b": ["0012"] * 10})
+
+        keys = s3.put_multiple_csv_objects(
+            "", "path", df, max_rows_per_shard=4, codec="zstd"
+        )
+        json_key = s3.put_single_json_object("", "json", {"a": 1}, codec="lz4")
+
+        self.assertTrue(all(key.endswith(".csv.zst") for key in keys))
+        self.assertTrue(json_key.endswith(".json.lz4"))
+        self.assertEqual(store[keys[0]][:4], b"\x28\xb5\x2f\xfd")
+        pd.testing.assert_frame_equal(
+            s3.get_multiple_csv_objects_threaded("", ["path"]), df
+        )
+        self.assertEqual(s3.get_single_json_object("", "json"), {"a": 1})
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_csv_objects_process_executor_roundtrip(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame(
+            {
+                "a": range(10),
+                "b": ["0012"] * 10,
+                "c": pd.date_range("2024-01-01", periods=10, tz="Europe/Madrid"),
+            }
+        )
+
+        s3.put_multiple_csv_objects_threaded(
+            "", {"path": df}, codec="zstd", executor="process"
+        )
+        threads = s3.get_multiple_csv_objects_threaded("", ["path"])
+        processes = s3.get_multiple_csv_objects_threaded(
+            "", ["path"], executor="process"
+        )
+
+        pd.testing.assert_frame_equal(threads, df)
+        pd.testing.assert_frame_equal(processes, df)
+        with self.assertRaises(ValueError):
+            s3.get_multiple_csv_objects_threaded("", ["path"], executor="fiber")
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_partitioned_objects_roundtrip(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame(
+            {
+                "day": ["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03"],
+                "country": ["ES", "ES", "FR", "ES"],
+                "value": [1, 2, 3, 4],
+            }
+        )
+
+        written = s3.put_partitioned_objects(
+            "bucket", "data", df, partition_cols=["country"], date_col="day"
+        )
+        self.assertEqual(
+            list(written),
+            [
+                "data/2024/01/01/country=ES",
+                "data/2024/01/02/country=ES",
+                "data/2024/01/02/country=FR",
+                "data/2024/01/03/country=ES",
+            ],
+        )
+
+        mock_client.return_value.get_object.reset_mock()
+        actual = s3.get_partitioned_objects(
+            "bucket",
+            "data",
+            filters=[("country", "=", "ES"), ("value", ">", 1)],
+            start_date=datetime(2024, 1, 2),
+            end_date=datetime(2024, 1, 3),
+            columns=["value"],
+        )
+
+        self.assertEqual(list(actual["value"]), [2, 4])
+        # Besides the partition index and manifests, only the shards of the
+        # matching partitions are downloaded
+        self.assertEqual(
+            sorted(
+                call.kwargs["Key"].rsplit("/", 1)[0]
+                for call in mock_client.return_value.get_object.call_args_list
+                if not is_metadata(call.kwargs["Key"])
+            ),
+            ["data/2024/01/02/country=ES", "data/2024/01/03/country=ES"],
+        )
+        with self.assertRaises(ValueError):
+            s3.get_partitioned_objects("bucket", "data", [("country", "=", "IT")])
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_partitioned_objects_keep_dtypes(self, mock_client):
+        self.fake_bucket(mock_client)
+        df = pd.DataFrame({"store": ["01", "02", "01"], "value": [1, 2, 3]})
+
+        s3.put_partitioned_objects("bucket", "data", df, partition_cols=["store"])
+        actual = s3.get_partitioned_objects(
+            "bucket", "data", filters=[("store", "=", "01")]
+        )
+
+        self.assertEqual(list(actual["store"]), ["01", "01"])
+        self.assertEqual(list(actual["value"]), [1, 3])
+
     @patch("shimoku_tangram.storage.s3.client")
     def test_put_multiple_csv_objects_empty_df(self, mock_client):
         expected = pd.DataFrame()
         s3.put_multiple_csv_objects("", "path", expected)
         mock_client.return_value.put_object.assert_not_called()
+
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_parquet_objects_roundtrip(self, mock_client):
+        df = pd.DataFrame({"a": range(100), "b": [str(i) for i in range(100)]})
+        self.fake_bucket(mock_client)
+        keys = s3.put_multiple_parquet_objects("", "path", df, row_group_size=10)
+
+        self.assertTrue(all(key.endswith(".parquet") for key in keys))
+
+        actual = s3.get_multiple_parquet_objects_threaded(
+            "", ["path"], columns=["b"], filters=[("a", ">=", 95)]
+        )
+
+        self.assertEqual(sorted(actual["b"]), ["95", "96", "97", "98", "99"])
+        self.assertEqual(list(actual.columns), ["b"])
+
+    @patch("shimoku_tangram.storage.s3._multipart_part_size", 1024)
+    @patch("shimoku_tangram.storage.s3.client")
+    def test_put_multiple_csv_objects_streamed_multipart(self, mock_client):
+        df = pd.DataFrame(
+            {"a": range(30000), "b": [f"v{i * 7919 % 10007}" for i in range(30000)]}
+        )
+        parts = {}
+
+        def _upload_part(Bucket, Key, UploadId, PartNumber, Body):
+            parts[PartNumber] = Body
+            return {"ETag": str(PartNumber)}
+
+        mock_client.return_value.create_multipart_upload.return_value = {
+            "UploadId": "id"
+        }
+        mock_client.return_value.upload_part.side_effect = _upload_part
+        mock_client.return_value.complete_multipart_upload.return_value = {
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+        mock_client.return_value.put_object.return_value = {
+            "ResponseMetadata": {"HTTPStatusCode": 200}
+        }
+        keys = s3.put_multiple_csv_objects("", "path", df, size_max_mb=1024)
+
+        self.assertEqual(len(keys), 1)
+        self.assertGreater(len(parts), 1)
+        # Only the manifest goes up in a single request
+        self.assertEqual(
+            [
+                call.kwargs["Key"]
+                for call in mock_client.return_value.put_object.call_args_list
+            ],
+            ["path/_manifest.json"],
+        )
+        self.assertEqual(
+            decompress(b"".join(parts[number] for number in sorted(parts))),
+            df.to_csv(index=False, quoting=csv.QUOTE_ALL).encode("utf-8"),
+        )
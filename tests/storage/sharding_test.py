@@ -0,0 +1,144 @@
+import pandas as pd
+from shimoku_tangram.storage import sharding
+from shimoku_tangram.storage.compression import compress_csv
+from unittest import TestCase
+
+
+class TestSharding(TestCase):
+    def test_estimate_bytes_per_row(self):
+        df = pd.DataFrame(
+            {"a": range(50000), "b": [f"v{i * 7919 % 10007}" for i in range(50000)]}
+        )
+        expected = len(compress_csv(df)) / len(df)
+
+        actual = sharding.estimate_bytes_per_row(df, compress_csv)
+
+        self.assertAlmostEqual(actual, expected, delta=expected * 0.25)
+
+    def test_estimate_bytes_per_row_empty(self):
+        self.assertEqual(
+            sharding.estimate_bytes_per_row(pd.DataFrame(), compress_csv), 0
+        )
+
+    def test_plan_shard_rows_balanced(self):
+        # 250 MB in total with a 100 MB cap gives three even shards
+        rows = sharding.plan_shard_rows(1000, 250 * 1024**2 / 1000, 100)
+
+        self.assertEqual(rows, 334)
+
+    def test_plan_shard_rows_bounds(self):
+        rows_min = sharding.plan_shard_rows(1000, 1024**2, 100, min_rows=200)
+        rows_max = sharding.plan_shard_rows(1000, 1, 100, max_rows=300)
+
+        self.assertEqual(rows_min, 200)
+        self.assertEqual(rows_max, 300)
+
+    def test_plan_shard_rows_empty(self):
+        self.assertEqual(sharding.plan_shard_rows(0, 0, 100), 1)
+        self.assertEqual(list(sharding.generate_slices(pd.DataFrame(), 1)), [])
+
+    def test_generate_slices(self):
+        df = pd.DataFrame({"a": range(10)})
+
+        slices = list(sharding.generate_slices(df, 4))
+
+        self.assertEqual([len(s) for s in slices], [4, 4, 2])
+
+    def test_put_and_commit_shards(self):
+        df = pd.DataFrame({"a": range(10)})
+        stored = {}
+        calls = []
+
+        def _put(key, shard):
+            stored[key] = shard
+            return {"size": len(shard), "md5": str(len(shard))}
+
+        shards = sharding.put_shards("path", df, 4, ".csv", _put, max_workers=2)
+        keys = sharding.commit_shards(
+            "path",
+            df,
+            "csv",
+            shards,
+            "data",
+            True,
+            lambda *args: calls.append(("index", *args)),
+            lambda key, manifest: calls.append(("manifest", key, manifest)) or True,
+        )
+
+        self.assertEqual(keys, [shard["key"] for shard in shards])
+        self.assertEqual([shard["rows"] for shard in shards], [4, 4, 2])
+        self.assertEqual([len(stored[key]) for key in keys], [4, 4, 2])
+        self.assertEqual(
+            calls[0], ("index", "data", "path", shards, calls[1][2]["columns"])
+        )
+        self.assertEqual(calls[1][1], "path/_manifest.json")
+        self.assertEqual(calls[1][2]["shards"], shards)
+        with self.assertRaises(OSError):
+            sharding.commit_shards(
+                "path",
+                df,
+                "csv",
+                shards,
+                None,
+                True,
+                lambda *args: None,
+                lambda *args: False,
+            )
+
+    def test_get_multiple_objects_threaded(self):
+        shards = {
+            "a": [("a/1", {"rows": 1}), ("a/2", {"rows": 2})],
+            "b": [("b/1", None)],
+        }
+
+        actual = sharding.get_multiple_objects_threaded(
+            ["a", "b"],
+            shards.__getitem__,
+            lambda key, shard: pd.DataFrame(
+                {"key": [key] * (shard or {"rows": 1})["rows"]}
+            ),
+        )
+
+        self.assertEqual(list(actual["key"]), ["a/1", "a/2", "a/2", "b/1"])
+        with self.assertRaises(ValueError):
+            sharding.get_objects_threaded([], lambda key: None)
+
+    def test_concat_shards(self):
+        shards = [
+            pd.DataFrame(
+                {"a": range(i, i + 3), "b": [f"v{i}"] * 3, "c": [0.5] * 3},
+                index=range(10, 13),
+            )
+            for i in range(0, 9, 3)
+        ]
+        expected = pd.concat(shards, ignore_index=True)
+
+        actual = sharding.concat_shards(shards)
+
+        pd.testing.assert_frame_equal(actual, expected)
+        self.assertEqual(shards, [])
+
+    def test_concat_shards_mixed_dtypes(self):
+        shards = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [0.5]})]
+        expected = pd.concat(shards, ignore_index=True)
+
+        actual = sharding.concat_shards(shards)
+
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_concat_shards_different_columns(self):
+        shards = [pd.DataFrame({"a": [1]}), pd.DataFrame({"b": [2]})]
+        expected = pd.concat(shards, ignore_index=True)
+
+        actual = sharding.concat_shards(shards)
+
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_rechunk(self):
+        dfs = [pd.DataFrame({"a": range(i, i + 4)}) for i in range(0, 12, 4)]
+
+        chunks = list(sharding.rechunk(dfs, 5))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [5, 5, 2])
+        self.assertEqual(chunks[1]["a"].tolist(), [5, 6, 7, 8, 9])
+        self.assertEqual(chunks[1].index.tolist(), list(range(5)))
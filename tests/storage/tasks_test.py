@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from shimoku_tangram.storage import tasks
+from unittest import TestCase
+
+
+class TestTasks(TestCase):
+    def test_batched(self):
+        actual = list(tasks.batched(iter(range(5)), 2))
+
+        self.assertEqual(actual, [[0, 1], [2, 3], [4]])
+
+    def test_run_threaded_keeps_order(self):
+        actual = tasks.run_threaded(lambda key: key * 2, [3, 1, 2], max_workers=3)
+
+        self.assertEqual(actual, [6, 2, 4])
+
+    def test_run_threaded_retries(self):
+        attempts = {}
+
+        def _func(key):
+            attempts[key] = attempts.get(key, 0) + 1
+            if key == "b" and attempts[key] < 3:
+                raise RuntimeError("throttled")
+            return key
+
+        actual = tasks.run_threaded(_func, ["a", "b"], retries=2)
+
+        self.assertEqual(actual, ["a", "b"])
+        self.assertEqual(attempts, {"a": 1, "b": 3})
+
+    def test_run_threaded_fails_fast(self):
+        started = []
+        release = threading.Event()
+
+        def _func(key):
+            started.append(key)
+            if key == 0:
+                raise RuntimeError("denied")
+            release.wait(1)
+            return key
+
+        with self.assertRaises(tasks.ThreadedTaskError) as context:
+            tasks.run_threaded(_func, list(range(50)), max_workers=2)
+        release.set()
+
+        self.assertEqual(list(context.exception.errors), ["0"])
+        self.assertIsInstance(context.exception.errors["0"], RuntimeError)
+        self.assertLess(len(started), 50)
+
+    def test_iter_threaded_prefetch(self):
+        started = []
+
+        def _func(key):
+            started.append(key)
+            return key * 2
+
+        results = tasks.iter_threaded(_func, iter(range(10)), prefetch=2)
+
+        self.assertEqual(next(results), 0)
+        self.assertLessEqual(len(started), 3)
+        self.assertEqual(next(results), 2)
+        self.assertLessEqual(len(started), 4)
+        self.assertEqual(list(results), [2 * i for i in range(2, 10)])
+
+    def test_iter_threaded_error(self):
+        def _func(key):
+            if key == 2:
+                raise RuntimeError("throttled")
+            return key
+
+        results = tasks.iter_threaded(_func, range(5))
+
+        self.assertEqual([next(results), next(results)], [0, 1])
+        with self.assertRaises(tasks.ThreadedTaskError) as context:
+            next(results)
+        self.assertEqual(list(context.exception.errors), ["2"])
+
+    def test_run_async_keeps_order_and_fails_fast(self):
+        cancelled = []
+
+        async def _func(key):
+            if key == 0:
+                raise RuntimeError("denied")
+            try:
+                await asyncio.sleep(key / 100)
+            except asyncio.CancelledError:
+                cancelled.append(key)
+                raise
+            return key
+
+        self.assertEqual(asyncio.run(tasks.run_async(_func, [3, 1, 2])), [3, 1, 2])
+        with self.assertRaises(tasks.ThreadedTaskError) as context:
+            asyncio.run(tasks.run_async(_func, [2, 0, 1]))
+        self.assertEqual(list(context.exception.errors), ["0"])
+        self.assertEqual(sorted(cancelled), [1, 2])